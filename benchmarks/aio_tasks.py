@@ -0,0 +1,80 @@
+"""
+Benchmark: asyncio tasks and event loop overhead per request of AioPomp
+
+Crawls flat site of `requests` pages with in-memory downloader, all pages
+are fetched concurrently with `delay` seconds latency.
+
+Usage::
+
+    PYTHONPATH=. python benchmarks/aio_tasks.py [requests] [delay]
+"""
+import sys
+import time
+import asyncio
+import logging
+
+from pomp.contrib.asynciotools import AioPomp
+
+from benchmarks.suite.cases import AsyncMemoryDownloader, BenchCrawler
+from benchmarks.suite.sitegraph import make_site
+
+
+logging.disable(logging.WARNING)
+
+
+class DelayedMemoryDownloader(AsyncMemoryDownloader):
+
+    def __init__(self, site, concurrency, delay):
+        super(DelayedMemoryDownloader, self).__init__(site, concurrency)
+        self.delay = delay
+
+    async def process(self, crawler, request):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        return await super(DelayedMemoryDownloader, self).process(
+            crawler, request,
+        )
+
+
+def run(count, delay):
+    site = make_site(width=count, depth=1, items_on_page=1)
+    loop = asyncio.new_event_loop()
+    created = [0]
+    live = [0]
+    peak = [0]
+
+    def _on_task_done(task):
+        live[0] -= 1
+
+    def task_factory(loop, coro, **kwargs):
+        created[0] += 1
+        live[0] += 1
+        peak[0] = max(peak[0], live[0])
+        task = asyncio.Task(coro, loop=loop, **kwargs)
+        task.add_done_callback(_on_task_done)
+        return task
+
+    loop.set_task_factory(task_factory)
+    pomp = AioPomp(
+        downloader=DelayedMemoryDownloader(site, len(site), delay),
+    )
+    started = time.time()
+    loop.run_until_complete(pomp.pump(BenchCrawler()))
+    elapsed = time.time() - started
+    loop.close()
+    return len(site), created[0], peak[0], elapsed
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    delay = float(sys.argv[2]) if len(sys.argv) > 2 else 0.1
+
+    requests, tasks, peak, elapsed = run(count, delay)
+    print('requests:              %d' % requests)
+    print('tasks created:         %d' % tasks)
+    print('tasks per request:     %.2f' % (tasks / float(requests)))
+    print('peak tasks:            %d' % peak)
+    print('elapsed:               %.2fs' % elapsed)
+    print('loop time per request: %.1fus' % (
+        (elapsed - delay) / requests * 10 ** 6
+    ))
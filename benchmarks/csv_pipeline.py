@@ -0,0 +1,48 @@
+"""
+Benchmark: CsvPipeline per item writes vs batched mode
+
+Usage::
+
+    PYTHONPATH=. python benchmarks/csv_pipeline.py [items]
+"""
+import os
+import sys
+import time
+import tempfile
+
+from pomp.contrib.item import Item, Field
+from pomp.contrib.pipelines import CsvPipeline
+
+
+class BenchItem(Item):
+    url = Field()
+    title = Field()
+    price = Field()
+    description = Field()
+
+
+def run(count, **kwargs):
+    filepath = os.path.join(tempfile.gettempdir(), 'bench_pipe.csv')
+    items = [
+        BenchItem('http://localhost/%s' % i, 'title', i, 'description')
+        for i in range(count)
+    ]
+    pipe = CsvPipeline(filepath, **kwargs)
+    started = time.time()
+    pipe.start(None)
+    for item in items:
+        pipe.process(None, item)
+    pipe.stop(None)
+    result = count / (time.time() - started)
+    os.remove(filepath)
+    return result
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+
+    for name, kwargs in (
+            ('per item', {}),
+            ('batch_size=1000', {'batch_size': 1000}),
+            ('flush_interval=1', {'flush_interval': 1})):
+        print('%-20s %12.1f items/sec' % (name, run(count, **kwargs)))
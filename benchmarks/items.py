@@ -0,0 +1,70 @@
+"""
+Benchmark: Item and SlottedItem construction, attribute access and pickling
+
+Usage::
+
+    PYTHONPATH=. python benchmarks/items.py [count]
+"""
+import sys
+import time
+import pickle
+
+from pomp.contrib.item import Item, SlottedItem, Field
+
+
+class BenchItem(Item):
+    url = Field()
+    title = Field()
+    price = Field()
+    description = Field()
+
+
+class BenchSlottedItem(SlottedItem):
+    url = Field()
+    title = Field()
+    price = Field()
+    description = Field()
+
+
+def measure(func, count):
+    started = time.time()
+    func(count)
+    return count / (time.time() - started)
+
+
+def run(item_class, count):
+    item = item_class('http://localhost/', 'title', 10, 'description')
+    dumped = pickle.dumps(item, pickle.HIGHEST_PROTOCOL)
+
+    def construct(count):
+        for i in range(count):
+            item_class(
+                'http://localhost/', title='title', price=i,
+            )
+
+    def access(count):
+        for _ in range(count):
+            item.url, item.title, item.price, item.description
+
+    def dump(count):
+        for _ in range(count):
+            pickle.loads(pickle.dumps(item, pickle.HIGHEST_PROTOCOL))
+
+    return (
+        measure(construct, count),
+        measure(access, count),
+        measure(dump, count),
+        len(dumped),
+    )
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+    print('%-18s %14s %14s %14s %8s' % (
+        'items/sec', 'construction', 'access x4', 'pickling', 'bytes',
+    ))
+    for item_class in (BenchItem, BenchSlottedItem):
+        print('%-18s %14.1f %14.1f %14.1f %8d' % (
+            (item_class.__name__, ) + run(item_class, count)
+        ))
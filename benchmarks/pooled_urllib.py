@@ -0,0 +1,108 @@
+"""
+Benchmark: UrllibDownloader vs PooledUrllibDownloader on same host crawl
+
+Servers:
+
+- `wsgiref` mock server from tests - HTTP/1.0, closes connection after
+  each response, so keep-alive pool can not reuse connections
+- `http.server` with HTTP/1.1 keep-alive
+
+Usage::
+
+    PYTHONPATH=. python benchmarks/pooled_urllib.py [requests]
+"""
+import os
+import sys
+import time
+import logging
+import multiprocessing
+try:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+except ImportError:  # pragma: no cover
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+
+from pomp.core.base import BaseCrawler
+from pomp.core.engine import Pomp
+from pomp.contrib.urllibtools import (
+    UrllibDownloader, PooledUrllibDownloader, UrllibHttpRequest,
+)
+
+sys.path.append(
+    os.path.join(os.path.dirname(__file__), '..', 'tests')
+)
+from mockserver import HttpServer  # noqa
+
+
+logging.disable(logging.INFO)
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        body = b'{"items": [], "links": []}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class KeepAliveHttpServer(object):
+
+    def __init__(self, host='localhost'):
+        self.httpd = HTTPServer((host, 0), KeepAliveHandler)
+        self.location = 'http://%s:%s' % (
+            host, self.httpd.socket.getsockname()[1],
+        )
+        self.process = multiprocessing.Process(
+            target=self.httpd.serve_forever,
+        )
+
+    def start(self):
+        self.process.start()
+
+    def stop(self):
+        self.process.terminate()
+        self.process.join()
+        self.httpd.server_close()
+
+
+class Crawler(BaseCrawler):
+
+    def __init__(self, location, count):
+        self.ENTRY_REQUESTS = [
+            UrllibHttpRequest('%s/root' % location) for _ in range(count)
+        ]
+
+    def extract_items(self, response):
+        pass
+
+
+def run(downloader, location, count):
+    pomp = Pomp(downloader=downloader)
+    started = time.time()
+    pomp.pump(Crawler(location, count))
+    return count / (time.time() - started)
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+
+    for name, server in (
+            ('wsgiref', HttpServer(sitemap={'/root': {}})),
+            ('keep-alive', KeepAliveHttpServer())):
+        server.start()
+        try:
+            for downloader in (UrllibDownloader, PooledUrllibDownloader):
+                print('%-10s %-22s %10.1f requests/sec' % (
+                    name,
+                    downloader.__name__,
+                    run(downloader(), server.location, count),
+                ))
+        finally:
+            server.stop()
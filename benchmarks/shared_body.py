@@ -0,0 +1,97 @@
+"""
+Benchmark: ConcurrentDownloader bodies pickled vs passed by shared memory
+
+Every mode is run in own process to measure its peak RSS. Bodies are copied
+from shared memory to bytes, in `-view` modes body is ``memoryview`` of
+shared memory.
+
+Usage::
+
+    PYTHONPATH=. python benchmarks/shared_body.py [requests] [body MiB]
+"""
+import sys
+import time
+import zlib
+import resource
+import subprocess
+
+from pomp.core.base import BaseCrawler, BaseDownloadWorker, BaseHttpResponse
+from pomp.core.engine import Pomp
+from pomp.contrib.concurrenttools import ConcurrentDownloader
+from pomp.contrib.sharedbody import SHM, MMAP
+
+from benchmarks.suite.cases import BenchRequest
+
+
+class BodyResponse(BaseHttpResponse):
+
+    def __init__(self, request, body):
+        self.request = request
+        self.body = body
+
+    def get_request(self):
+        return self.request
+
+
+class BodyDownloadWorker(BaseDownloadWorker):
+
+    def __init__(self, body_size):
+        self.body_size = body_size
+
+    def process(self, request):
+        return BodyResponse(request, b'x' * self.body_size)
+
+
+class BodyCrawler(BaseCrawler):
+
+    def __init__(self, count):
+        self.ENTRY_REQUESTS = [
+            BenchRequest('http://bench/%s' % i) for i in range(count)
+        ]
+        self.checksum = 0
+
+    def extract_items(self, response):
+        # read the whole body
+        self.checksum = zlib.adler32(response.body, self.checksum)
+
+    def next_requests(self, response):
+        pass
+
+
+def run(mode, count, body_size):
+    transport, _, view = mode.partition('-')
+    downloader = ConcurrentDownloader(
+        worker_class=BodyDownloadWorker,
+        worker_kwargs={'body_size': body_size},
+        pool_size=4,
+        worker_reuse=True,
+        body_threshold=None if mode == 'pickle' else 1,
+        body_transport=None if mode == 'pickle' else transport,
+        body_view=bool(view),
+    )
+    started = time.time()
+    Pomp(downloader=downloader).pump(BodyCrawler(count))
+    elapsed = time.time() - started
+    return (
+        count / elapsed,
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024,
+    )
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 3:
+        print('%s %s' % run(
+            sys.argv[3], int(sys.argv[1]), int(sys.argv[2]) * 1024 * 1024,
+        ))
+        sys.exit(0)
+
+    count = sys.argv[1] if len(sys.argv) > 1 else '200'
+    size = sys.argv[2] if len(sys.argv) > 2 else '8'
+
+    print('%-10s %12s %14s' % ('bodies', 'req/sec', 'peak RSS MiB'))
+    for mode in ('pickle', SHM, MMAP, SHM + '-view', MMAP + '-view'):
+        output = subprocess.check_output(
+            [sys.executable, __file__, count, size, mode],
+        )
+        rate, rss = output.split()
+        print('%-10s %12.1f %14s' % (mode, float(rate), rss.decode()))
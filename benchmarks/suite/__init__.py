@@ -0,0 +1,38 @@
+"""
+Benchmark suite of the engine hot path
+
+Crawls synthetic site graph of configurable width and depth and reports
+requests/sec, per stage latency percentiles and peak RSS of each case:
+
+- `engine` - :class:`pomp.core.engine.Pomp` with in-memory downloader
+- `aioengine` - :class:`pomp.contrib.asynciotools.AioPomp` with
+  in-memory asyncio downloader
+- `pomp` - :class:`pomp.core.engine.Pomp` with urllib downloader and
+  local mock server
+- `aiopomp` - :class:`pomp.contrib.asynciotools.AioPomp` with asyncio
+  downloader and local mock server
+- `concurrent_downloader` - ``ConcurrentDownloader`` with in-memory
+  download worker
+- `concurrent_crawler` - ``ConcurrentCrawler`` with in-memory downloader
+- `concurrent_pools` - ``ConcurrentDownloader`` and ``ConcurrentCrawler``
+  with own pools of `pool_size` processes each
+- `shared_executor` - ``ConcurrentDownloader`` and ``ConcurrentCrawler``
+  with one ``SharedExecutor`` of `pool_size` processes
+- `fused` - ``ConcurrentDownloader`` parses responses by
+  ``ConcurrentCrawler`` worker in download worker processes
+
+Stages:
+
+- `queue` - from request creation to the first middleware
+- `download` - from the first middleware to the response middleware
+- `parse` - from the response middleware to the item pipeline
+- `total` - from request creation to the item pipeline
+
+Each case is run in own process, so peak RSS is not shared between cases.
+
+Usage::
+
+    PYTHONPATH=. python -m benchmarks.suite [--case engine] \\
+        [--width 10] [--depth 3] [--json result.json] \\
+        [--compare baseline.json] [--threshold 10]
+"""
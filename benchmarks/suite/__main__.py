@@ -0,0 +1,172 @@
+"""
+Run benchmark suite, see :mod:`benchmarks.suite`
+"""
+import sys
+import json
+import logging
+import argparse
+import platform
+import subprocess
+
+import pomp
+from benchmarks.suite.cases import CASES, run_case
+from benchmarks.suite.sitegraph import make_site
+from benchmarks.suite.stats import STAGES, PERCENTILES, get_peak_rss
+
+
+DEFAULT_CASES = (
+    'engine', 'aioengine', 'pomp', 'aiopomp',
+    'concurrent_downloader', 'concurrent_crawler',
+)
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks.suite',
+        description='Pomp engine benchmarks',
+    )
+    parser.add_argument(
+        '--case', action='append', choices=sorted(CASES),
+        help='case to run, all cases by default',
+    )
+    parser.add_argument('--width', type=int, default=10,
+                        help='count of links on page')
+    parser.add_argument('--depth', type=int, default=3,
+                        help='count of levels below the root page')
+    parser.add_argument('--items', type=int, default=2,
+                        help='count of items on page')
+    parser.add_argument('--body-size', type=int, default=0,
+                        help='page padding size in bytes')
+    parser.add_argument('--pool-size', type=int, default=4,
+                        help='pool size of concurrent cases')
+    parser.add_argument('--concurrency', type=int, default=10,
+                        help='concurrency of asyncio downloader')
+    parser.add_argument('--json', metavar='PATH',
+                        help='write results as JSON document')
+    parser.add_argument('--compare', metavar='PATH',
+                        help='compare requests/sec with JSON document of '
+                             'previous run, exit with status 1 on '
+                             'regression')
+    parser.add_argument('--threshold', type=float, default=10,
+                        help='regression threshold in percents')
+    parser.add_argument('--run-one', help=argparse.SUPPRESS)
+    return parser
+
+
+def run_one(args):
+    """Run case in the current process and print result as JSON"""
+    logging.disable(logging.WARNING)
+    site = make_site(
+        width=args.width, depth=args.depth,
+        items_on_page=args.items, body_size=args.body_size,
+    )
+    result = run_case(args.run_one, site, {
+        'pool_size': args.pool_size,
+        'concurrency': args.concurrency,
+    })
+    result['peak_rss_kb'], result['peak_children_rss_kb'] = get_peak_rss()
+    print(json.dumps(result))
+
+
+def run_isolated(name, argv):
+    output = subprocess.check_output(
+        [sys.executable, '-m', 'benchmarks.suite', '--run-one', name] +
+        argv
+    )
+    return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+
+def _format_ms(value):
+    return '%8.2f' % value if value is not None else '%8s' % '-'
+
+
+def print_results(results):
+    print('%-22s %8s %12s %12s %12s' % (
+        'case', 'requests', 'req/sec', 'rss KiB', 'children KiB',
+    ))
+    for result in results:
+        print('%-22s %8d %12.1f %12d %12d' % (
+            result['case'], result['requests'], result['requests_per_sec'],
+            result['peak_rss_kb'], result['peak_children_rss_kb'],
+        ))
+
+    print('')
+    print('%-22s %-8s ' % ('latency ms', 'stage') + ' '.join(
+        '%8s' % ('p%s' % percent) for percent in PERCENTILES
+    ) + ' %8s' % 'max')
+    for result in results:
+        for stage in STAGES:
+            report = result['stages'][stage]
+            print('%-22s %-8s ' % (result['case'], stage) + ' '.join(
+                _format_ms(report['p%s' % percent])
+                for percent in PERCENTILES
+            ) + ' ' + _format_ms(report['max']))
+
+
+def compare(results, baseline, threshold):
+    """Print requests/sec change against baseline
+
+    :rtype: list of regressed cases
+    """
+    previous = dict(
+        (result['case'], result) for result in baseline['results']
+    )
+    regressions = []
+    print('')
+    print('%-22s %12s %12s %8s' % ('case', 'baseline', 'current', 'change'))
+    for result in results:
+        base = previous.get(result['case'])
+        if not base:
+            continue
+        change = (
+            result['requests_per_sec'] / base['requests_per_sec'] - 1
+        ) * 100
+        regressed = change < -threshold
+        if regressed:
+            regressions.append(result['case'])
+        print('%-22s %12.1f %12.1f %+7.1f%%%s' % (
+            result['case'], base['requests_per_sec'],
+            result['requests_per_sec'], change,
+            ' REGRESSION' if regressed else '',
+        ))
+    return regressions
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    args = get_parser().parse_args(argv)
+    if args.run_one:
+        return run_one(args)
+
+    case_argv = [
+        '--width', str(args.width), '--depth', str(args.depth),
+        '--items', str(args.items), '--body-size', str(args.body_size),
+        '--pool-size', str(args.pool_size),
+        '--concurrency', str(args.concurrency),
+    ]
+    results = [
+        run_isolated(name, case_argv)
+        for name in args.case or DEFAULT_CASES
+    ]
+    print_results(results)
+
+    document = {
+        'pomp': pomp.__version__,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'params': vars(args),
+        'results': results,
+    }
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(document, f, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,313 @@
+"""
+Benchmark cases
+"""
+import os
+import sys
+import json
+import time
+import logging
+
+try:
+    from urllib.parse import urlsplit
+except ImportError:  # pragma: no cover
+    from urlparse import urlsplit
+
+from pomp.core.base import (
+    BaseCrawler, BaseDownloader, BaseDownloadWorker,
+    BaseHttpRequest, BaseHttpResponse,
+)
+from pomp.core.engine import Pomp
+from pomp.contrib.item import Item, Field
+from pomp.contrib.urllibtools import UrllibDownloader, UrllibHttpRequest
+from pomp.contrib.concurrenttools import (
+    ConcurrentDownloader, ConcurrentCrawler, SharedExecutor,
+)
+
+from benchmarks.suite.stats import StageStats, StagesMiddleware, \
+    StagesPipeline
+
+
+MEMORY_LOCATION = 'http://bench'
+
+log = logging.getLogger('benchmarks.suite')
+
+
+class BenchRequest(BaseHttpRequest):
+
+    def __init__(self, url):
+        self.url = url
+        self.created = time.time()
+        self.started = None
+
+
+class BenchUrllibRequest(UrllibHttpRequest):
+
+    def __init__(self, url):
+        super(BenchUrllibRequest, self).__init__(url)
+        self.created = time.time()
+        self.started = None
+
+
+class BenchResponse(BaseHttpResponse):
+
+    def __init__(self, request, body):
+        self.request = request
+        self.body = body
+
+    def get_request(self):
+        return self.request
+
+
+class BenchItem(Item):
+    url = Field()
+    value = Field()
+
+
+class BenchCrawler(BaseCrawler):
+
+    def __init__(self, location=MEMORY_LOCATION, request_class=BenchRequest):
+        self.location = location
+        self.request_class = request_class
+        self.ENTRY_REQUESTS = request_class('%s/root' % location)
+
+    def _get_page(self, response):
+        body = response.body
+        if isinstance(body, bytes):
+            body = json.loads(body.decode('utf-8'))
+        return body
+
+    def extract_items(self, response):
+        url = response.get_request().url
+        return [
+            BenchItem(url, value)
+            for value in self._get_page(response)['items']
+        ]
+
+    def next_requests(self, response):
+        return [
+            self.request_class('%s%s' % (self.location, link))
+            for link in self._get_page(response)['links']
+        ]
+
+
+class MemoryDownloader(BaseDownloader):
+
+    def __init__(self, site):
+        self.site = site
+
+    def process(self, crawler, request):
+        return BenchResponse(request, self.site[urlsplit(request.url).path])
+
+
+class AsyncMemoryDownloader(MemoryDownloader):
+
+    def __init__(self, site, concurrency=10):
+        super(AsyncMemoryDownloader, self).__init__(site)
+        self.concurrency = concurrency
+
+    def get_workers_count(self):
+        return self.concurrency
+
+    async def process(self, crawler, request):
+        return super(AsyncMemoryDownloader, self).process(crawler, request)
+
+
+class MemoryDownloadWorker(BaseDownloadWorker):
+
+    def __init__(self, site):
+        self.site = site
+
+    def process(self, request):
+        return BenchResponse(request, self.site[urlsplit(request.url).path])
+
+
+def _get_http_site(site):
+    # serve pages by mock server from tests
+    sys.path.append(
+        os.path.join(os.path.dirname(__file__), '..', '..', 'tests')
+    )
+    from mockserver import HttpServer
+    server = HttpServer(sitemap=site)
+    # wsgiref backlog of 5 connections drops concurrent connects
+    server.httpd.socket.listen(128)
+    return server
+
+
+def run_engine(site, stats, options):
+    pomp = Pomp(
+        downloader=MemoryDownloader(site),
+        middlewares=(StagesMiddleware(stats), ),
+        pipelines=(StagesPipeline(stats), ),
+    )
+    started = time.time()
+    pomp.pump(BenchCrawler())
+    return time.time() - started
+
+
+def run_pomp(site, stats, options):
+    server = _get_http_site(site)
+    server.start()
+    try:
+        pomp = Pomp(
+            downloader=UrllibDownloader(),
+            middlewares=(StagesMiddleware(stats), ),
+            pipelines=(StagesPipeline(stats), ),
+        )
+        started = time.time()
+        pomp.pump(BenchCrawler(server.location, BenchUrllibRequest))
+        return time.time() - started
+    finally:
+        server.stop()
+
+
+def run_aioengine(site, stats, options):
+    import asyncio
+    from pomp.contrib.asynciotools import AioPomp
+
+    loop = asyncio.new_event_loop()
+    try:
+        pomp = AioPomp(
+            downloader=AsyncMemoryDownloader(
+                site, concurrency=options['concurrency'],
+            ),
+            middlewares=(StagesMiddleware(stats), ),
+            pipelines=(StagesPipeline(stats), ),
+        )
+        started = time.time()
+        loop.run_until_complete(pomp.pump(BenchCrawler()))
+        return time.time() - started
+    finally:
+        loop.close()
+
+
+def run_aiopomp(site, stats, options):
+    import asyncio
+    from pomp.contrib.asynciotools import AioPomp, AsyncioHttpDownloader
+
+    server = _get_http_site(site)
+    server.start()
+    loop = asyncio.new_event_loop()
+    try:
+        pomp = AioPomp(
+            downloader=AsyncioHttpDownloader(
+                concurrency=options['concurrency'],
+            ),
+            middlewares=(StagesMiddleware(stats), ),
+            pipelines=(StagesPipeline(stats), ),
+        )
+        started = time.time()
+        loop.run_until_complete(pomp.pump(BenchCrawler(server.location)))
+        return time.time() - started
+    finally:
+        loop.close()
+        server.stop()
+
+
+def run_concurrent_downloader(site, stats, options):
+    downloader = ConcurrentDownloader(
+        worker_class=MemoryDownloadWorker,
+        worker_kwargs={'site': site},
+        pool_size=options['pool_size'],
+        worker_reuse=True,
+    )
+    pomp = Pomp(
+        downloader=downloader,
+        middlewares=(StagesMiddleware(stats), ),
+        pipelines=(StagesPipeline(stats), ),
+    )
+    started = time.time()
+    pomp.pump(BenchCrawler())
+    return time.time() - started
+
+
+def run_concurrent_crawler(site, stats, options):
+    crawler = ConcurrentCrawler(
+        worker_class=BenchCrawler,
+        pool_size=options['pool_size'],
+    )
+    crawler.ENTRY_REQUESTS = BenchRequest('%s/root' % MEMORY_LOCATION)
+    pomp = Pomp(
+        downloader=MemoryDownloader(site),
+        middlewares=(StagesMiddleware(stats), ),
+        pipelines=(StagesPipeline(stats), ),
+    )
+    started = time.time()
+    try:
+        pomp.pump(crawler)
+    finally:
+        crawler.executor.shutdown()
+    return time.time() - started
+
+
+def run_concurrent_pools(site, stats, options, executor=None, fused=False):
+    crawler = ConcurrentCrawler(
+        worker_class=BenchCrawler,
+        pool_size=options['pool_size'],
+        executor=executor,
+    )
+    downloader = ConcurrentDownloader(
+        worker_class=MemoryDownloadWorker,
+        worker_kwargs={'site': site},
+        pool_size=options['pool_size'],
+        worker_reuse=True,
+        executor=executor,
+        crawler=crawler if fused else None,
+    )
+    crawler.ENTRY_REQUESTS = BenchRequest('%s/root' % MEMORY_LOCATION)
+    pomp = Pomp(
+        downloader=downloader,
+        middlewares=(StagesMiddleware(stats), ),
+        pipelines=(StagesPipeline(stats), ),
+    )
+    started = time.time()
+    try:
+        pomp.pump(crawler)
+    finally:
+        crawler.executor.shutdown()
+    return time.time() - started
+
+
+def run_shared_executor(site, stats, options):
+    return run_concurrent_pools(
+        site, stats, options,
+        executor=SharedExecutor(pool_size=options['pool_size']),
+    )
+
+
+def run_fused(site, stats, options):
+    return run_concurrent_pools(site, stats, options, fused=True)
+
+
+CASES = {
+    'engine': run_engine,
+    'aioengine': run_aioengine,
+    'pomp': run_pomp,
+    'aiopomp': run_aiopomp,
+    'concurrent_downloader': run_concurrent_downloader,
+    'concurrent_crawler': run_concurrent_crawler,
+    'concurrent_pools': run_concurrent_pools,
+    'shared_executor': run_shared_executor,
+    'fused': run_fused,
+}
+
+
+def run_case(name, site, options):
+    """Run benchmark case
+
+    :rtype: dict of results
+    """
+    stats = StageStats()
+    elapsed = CASES[name](site, stats, options)
+
+    requests = len(stats.latencies['download'])
+    if requests != len(site):
+        log.warning(
+            'Case %s crawled %s pages of %s', name, requests, len(site),
+        )
+    return {
+        'case': name,
+        'requests': requests,
+        'elapsed': elapsed,
+        'requests_per_sec': requests / elapsed if elapsed else None,
+        'stages': stats.get_report(),
+    }
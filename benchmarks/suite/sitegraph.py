@@ -0,0 +1,30 @@
+"""
+Synthetic site graph
+"""
+
+
+def make_site(width=10, depth=3, items_on_page=2, body_size=0):
+    """Tree of pages
+
+    :param width: count of links on page
+    :param depth: count of levels below the root page
+    :param items_on_page: count of items on page
+    :param body_size: size of page padding in bytes
+    :rtype: dict of path -> page dict with `items`, `links` and `padding`
+    """
+    site = {}
+    level = ['/root']
+    for depth_level in range(depth + 1):
+        next_level = []
+        for path in level:
+            links = [
+                '%s/%s' % (path, i) for i in range(width)
+            ] if depth_level < depth else []
+            site[path] = {
+                'items': list(range(items_on_page)),
+                'links': links,
+                'padding': 'x' * body_size,
+            }
+            next_level.extend(links)
+        level = next_level
+    return site
@@ -0,0 +1,94 @@
+"""
+Stage latency stats
+"""
+import sys
+import time
+import resource
+
+from pomp.core.base import BaseMiddleware, BasePipeline
+
+
+STAGES = ('queue', 'download', 'parse', 'total')
+PERCENTILES = (50, 90, 99)
+
+
+def percentile(values, percent):
+    """Nearest-rank percentile of sorted values"""
+    if not values:
+        return None
+    index = max(0, int(round(percent / 100.0 * len(values))) - 1)
+    return values[min(index, len(values) - 1)]
+
+
+def get_peak_rss():
+    """Peak RSS in KiB of the current process and of its largest child"""
+    scale = 1024 if sys.platform == 'darwin' else 1
+    return (
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // scale,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss // scale,
+    )
+
+
+class StageStats(object):
+    """Collects latencies of request processing stages"""
+
+    def __init__(self):
+        self.latencies = dict((stage, []) for stage in STAGES)
+        self.responded = {}
+        self.created = {}
+
+    def add(self, stage, value):
+        self.latencies[stage].append(value)
+
+    def get_report(self):
+        """Percentiles of stage latencies in milliseconds
+
+        :rtype: dict of stage -> dict with `count`, `pXX` and `max`
+        """
+        report = {}
+        for stage, values in self.latencies.items():
+            values = sorted(values)
+            stage_report = {'count': len(values)}
+            for percent in PERCENTILES:
+                value = percentile(values, percent)
+                stage_report['p%s' % percent] = \
+                    None if value is None else value * 1000
+            stage_report['max'] = values[-1] * 1000 if values else None
+            report[stage] = stage_report
+        return report
+
+
+class StagesMiddleware(BaseMiddleware):
+    """Measures `queue` and `download` stages, must be the first one"""
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def process_request(self, request, crawler, downloader):
+        now = time.time()
+        self.stats.add('queue', now - request.created)
+        self.stats.created[request.url] = request.created
+        request.started = now
+        return request
+
+    def process_response(self, response, crawler, downloader):
+        now = time.time()
+        request = response.get_request()
+        self.stats.add('download', now - request.started)
+        self.stats.responded[request.url] = now
+        return response
+
+
+class StagesPipeline(BasePipeline):
+    """Measures `parse` and `total` stages by the first item of page"""
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def process(self, crawler, item):
+        now = time.time()
+        responded = self.stats.responded.pop(item.url, None)
+        if responded is not None:
+            self.stats.add('parse', now - responded)
+            self.stats.add('total', now - self.stats.created.pop(item.url))
+        return item
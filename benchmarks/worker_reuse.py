@@ -0,0 +1,88 @@
+"""
+Benchmark: ConcurrentDownloader with and without `worker_reuse`
+
+Download worker has expensive setup (like a browser driver or http session)
+and cheap request processing.
+
+Usage::
+
+    PYTHONPATH=. python benchmarks/worker_reuse.py \
+        [requests] [pool_size] [setup_delay]
+"""
+import sys
+import time
+import logging
+
+from pomp.core.base import (
+    BaseCrawler, BaseDownloadWorker, BaseHttpRequest, BaseHttpResponse,
+)
+from pomp.core.engine import Pomp
+from pomp.contrib.concurrenttools import ConcurrentDownloader
+
+
+logging.basicConfig(level=logging.WARNING, stream=sys.stdout)
+
+
+class BenchRequest(BaseHttpRequest):
+    def __init__(self, url):
+        self.url = url
+
+
+class BenchResponse(BaseHttpResponse):
+    def __init__(self, request, body):
+        self.request = request
+        self.body = body
+
+    def get_request(self):
+        return self.request
+
+
+class ExpensiveSetupWorker(BaseDownloadWorker):
+
+    def __init__(self, setup_delay=0.05):
+        # emulate driver start or session handshake
+        time.sleep(setup_delay)
+
+    def process(self, request):
+        return BenchResponse(request, 'body')
+
+
+class Crawler(BaseCrawler):
+
+    def __init__(self, count):
+        self.ENTRY_REQUESTS = [
+            BenchRequest('http://localhost/%s' % i) for i in range(count)
+        ]
+
+    def extract_items(self, response):
+        pass
+
+
+def run(count, pool_size, setup_delay, worker_reuse):
+    pomp = Pomp(
+        downloader=ConcurrentDownloader(
+            worker_class=ExpensiveSetupWorker,
+            worker_kwargs={'setup_delay': setup_delay},
+            pool_size=pool_size,
+            worker_reuse=worker_reuse,
+        ),
+    )
+    started = time.time()
+    pomp.pump(Crawler(count))
+    return count / (time.time() - started)
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    pool_size = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    setup_delay = float(sys.argv[3]) if len(sys.argv) > 3 else 0.05
+
+    print(
+        'requests: %s pool_size: %s setup_delay: %ss' % (
+            count, pool_size, setup_delay,
+        )
+    )
+    for worker_reuse in (False, True):
+        print('worker_reuse=%-5s %10.1f requests/sec' % (
+            worker_reuse, run(count, pool_size, setup_delay, worker_reuse),
+        ))
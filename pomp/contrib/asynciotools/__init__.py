@@ -1,31 +1,53 @@
 import sys
-import types  # noqa
+import time
+import signal
+import types
 import logging
 import asyncio
 import inspect
+import itertools
 from functools import partial
 
 
 try:
-    from asyncio import ensure_future
+    from asyncio import ensure_future as _ensure_future
 except ImportError:  # pragma: no cover
-    from asyncio import async as ensure_future  # noqa
+    # `async` is a keyword since python 3.7
+    _ensure_future = getattr(asyncio, 'async')
 
 
-from pomp.core.base import (  # noqa
+from pomp.core.base import (
     BaseQueue,
     BaseRequest,
     BaseResponse,
     BaseHttpResponse,
     BaseCrawlException,
 )
-from pomp.core.utils import iterator, switch_to_asyncio  # noqa
-from pomp.core.engine import StopCommand
+from pomp.core.utils import iterator
+from pomp.core.engine import StopCommand, get_request_priority
 from pomp.core.engine import Pomp as SyncPomp
+from pomp.core.scheduler import InFlightScheduler
 
 from pomp.contrib.concurrenttools import (
-    _run_crawler_worker, ConcurrentCrawler,
+    _run_crawler_worker, ConcurrentCrawler, ParsedResponse,
 )
+from pomp.contrib.sharedbody import detach_body
+from pomp.contrib.asynciotools.downloader import (  # noqa
+    AsyncioHttpDownloader, AsyncioHttpRequest, AsyncioHttpResponse,
+)
+
+
+# event loop references tasks weakly, so task waiting for weakly
+# referenced future (like waiter of stream reader) may be garbage collected
+# on the half way, keep tasks until they are done
+_pending_tasks = set()
+
+
+def ensure_future(coro_or_future):
+    task = _ensure_future(coro_or_future)
+    _pending_tasks.add(task)
+    task.add_done_callback(_pending_tasks.discard)
+    return task
 
 
 async def _co(value):
@@ -34,9 +56,27 @@ async def _co(value):
     return value
 
 
-def _wrap_to_future(value):
-    if inspect.iscoroutine(value):
-        return ensure_future(value)
+def _set_future_result(future, planned):
+    if future.cancelled():
+        return
+    try:
+        future.set_result(planned.result())
+    except Exception as e:
+        future.set_exception(e)
+
+
+async def _await(value):
+    """Await coroutine, future or :class:`pomp.core.utils.Planned`"""
+    if inspect.isawaitable(value):
+        return await value
+    if hasattr(value, 'add_done_callback'):
+        # planned object may be done in the other thread
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        value.add_done_callback(
+            partial(loop.call_soon_threadsafe, _set_future_result, future)
+        )
+        return await future
     return value
 
 
@@ -49,15 +89,243 @@ class SimpleAsyncioQueue(BaseQueue):
         self.q = asyncio.Queue() if use_lifo else asyncio.LifoQueue()
 
     async def get_requests(self, count=None):
-        return await self.q.get()
+        r = self._unwrap(await self.q.get())
+        if not count or count <= 1 or isinstance(r, StopCommand):
+            return r
+
+        # drain up to `count` requests without blocking
+        requests = [r]
+        while len(requests) < count:
+            try:
+                r = self._unwrap(self.q.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+            if isinstance(r, StopCommand):
+                # leave command for the next call
+                self.q.put_nowait(self._wrap(r))
+                break
+            requests.append(r)
+        return requests
 
     async def put_requests(self, requests):
-        await self.q.put(requests)
+        for request in iterator(requests):
+            self.q.put_nowait(self._wrap(request))
+
+    def _wrap(self, request):
+        return request
+
+    def _unwrap(self, entry):
+        return entry
+
+
+class PriorityAsyncioQueue(SimpleAsyncioQueue):
+    """Asyncio version of :class:`pomp.core.engine.PriorityQueue`
+
+    :param depth_bias: priority decrease for each level of request `depth`,
+                       positive value takes shallow requests first
+    """
+
+    def __init__(self, depth_bias=0):
+        self.depth_bias = depth_bias
+        self.q = asyncio.PriorityQueue()
+        # monotonic tie-breaker, requests are never compared
+        self._counter = itertools.count()
+
+    def _wrap(self, request):
+        return (
+            -get_request_priority(request, self.depth_bias),
+            next(self._counter),
+            request,
+        )
+
+    def _unwrap(self, entry):
+        return entry[-1]
+
+
+class AioInFlightScheduler(InFlightScheduler):
+    """Asyncio version of :class:`pomp.core.scheduler.InFlightScheduler`
+
+    `wait`, `acquire` and `acquire_host` are coroutines. Task of request to
+    busy or delayed host waits in `acquire_host` without global slot.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(AioInFlightScheduler, self).__init__(*args, **kwargs)
+        self._changed = None
+
+    async def wait(self):
+        await self._wait_for(self._is_free)
+
+    async def acquire(self):
+        await self._wait_for(self._is_free)
+        self._take()
+
+    def release(self):
+        self.in_flight -= 1
+        self._notify()
+
+    async def acquire_host(self, request):
+        if not self.is_polite():
+            return
+        host = self.get_host(request)
+        if not self._can_start(host, time.time()):
+            # parked task does not hold global slot
+            self.release()
+            self.parked_count += 1
+            try:
+                await self._wait_for(
+                    lambda: self._has_slot() and
+                    self._can_start(host, time.time()),
+                    lambda: self.next_at.get(host),
+                )
+            finally:
+                self.parked_count -= 1
+            self.in_flight += 1
+        self._take_host(host, request, time.time())
+
+    def release_host(self, request, failed=False):
+        if not self.is_polite():
+            return
+        host = self.get_host(request)
+        started = self._started.pop(id(request), None)
+        if self.autothrottle and started is not None:
+            self._throttle(host, time.time() - started, failed)
+        self._release_host(host)
+        self._notify()
+
+    def _notify(self):
+        if self._changed is not None and not self._changed.done():
+            self._changed.set_result(None)
+        self._changed = None
+
+    async def _wait_for(self, predicate, get_wake_at=None):
+        if predicate():
+            return
+        started = time.time()
+        self.waiting += 1
+        loop = asyncio.get_event_loop()
+        try:
+            while not predicate():
+                if self._changed is None:
+                    self._changed = loop.create_future()
+                wake_at = get_wake_at() if get_wake_at else None
+                handle = None
+                if wake_at is not None:
+                    # wake up waiters when delay of host is passed
+                    handle = loop.call_later(
+                        max(0, wake_at - time.time()), self._notify,
+                    )
+                try:
+                    # do not cancel other waiters on cancellation
+                    await asyncio.shield(self._changed)
+                finally:
+                    if handle is not None:
+                        handle.cancel()
+        finally:
+            self.waiting -= 1
+            self._account_wait(started)
+
+
+class AioTaskSet(object):
+    """Set of running tasks limited by count
+
+    :param limit: max count of running tasks, unlimited if ``None``
+    """
+
+    def __init__(self, limit=None):
+        self.limit = limit
+        self.tasks = set()
+        self._free = asyncio.Event()
+
+    def __len__(self):
+        return len(self.tasks)
+
+    async def spawn(self, coro):
+        """Run coroutine as task, wait for free place if limit is reached
+
+        :param coro: coroutine
+        :rtype: task
+        """
+        try:
+            while self.limit is not None and len(self.tasks) >= self.limit:
+                self._free.clear()
+                await self._free.wait()
+        except asyncio.CancelledError:
+            coro.close()
+            raise
+        task = ensure_future(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self._on_done)
+        return task
+
+    def _on_done(self, task):
+        self.tasks.discard(task)
+        self._free.set()
+        if not task.cancelled() and task.exception() is not None:
+            log.error(
+                'Task failed', exc_info=task.exception(),
+            )
+
+    def cancel(self):
+        """Cancel all running tasks"""
+        for task in self.tasks:
+            task.cancel()
+
+    async def drain(self, timeout=None):
+        """Wait for running tasks, cancel them after `timeout`
+
+        :param timeout: max time in seconds to wait, unlimited if ``None``
+        :rtype: count of cancelled tasks
+        """
+        if not self.tasks:
+            return 0
+        log.debug('Wait pending tasks: %s', len(self.tasks))
+        _, pending = await asyncio.wait(set(self.tasks), timeout=timeout)
+        if not pending:
+            return 0
+        log.warning('Cancel pending tasks: %s', len(pending))
+        for task in pending:
+            task.cancel()
+        await asyncio.wait(pending)
+        return len(pending)
 
 
 class AioPomp(SyncPomp):
+    """Asyncio version of :class:`pomp.core.engine.Pomp`
+
+    Every request is processed by own task, count of running tasks is
+    limited by `max_tasks` in addition to the scheduler limit.
+
+    On :meth:`stop` call or SIGINT/SIGTERM signal the engine stops to take
+    new requests from the queue, waits for running tasks up to
+    `drain_timeout` seconds and cancels the rest of them. The second stop
+    cancels running tasks immediately.
+
+    :param max_tasks: max count of running tasks, unlimited if ``None``
+    :param drain_timeout: max time in seconds to wait for running tasks on
+                          stop, unlimited if ``None``
+    :param handle_signals: stop on SIGINT and SIGTERM, signal handlers are
+                           set only while :meth:`pump` is running in the
+                           main thread and only for signals without
+                           handlers set by application
+    """
     DEFAULT_QUEUE_CLASS = SimpleAsyncioQueue
-    LOCK_FACTORY = asyncio.Lock
+    SCHEDULER_CLASS = AioInFlightScheduler
+    MAX_TASKS = 10000
+    DRAIN_TIMEOUT = 10
+    STOP_SIGNALS = (signal.SIGINT, signal.SIGTERM)
+
+    def __init__(self, *args, **kwargs):
+        self.max_tasks = kwargs.pop('max_tasks', self.MAX_TASKS)
+        self.drain_timeout = kwargs.pop('drain_timeout', self.DRAIN_TIMEOUT)
+        self.handle_signals = kwargs.pop('handle_signals', True)
+        super(AioPomp, self).__init__(*args, **kwargs)
+        self.tasks = None
+        self.stopping = False
+        self._dispatcher = None
+        # key -> (handle of timer, delayed requests)
+        self._delayed = {}
+        self._delayed_keys = itertools.count()
 
     async def pump(self, crawler):
         """Start crawling
@@ -66,75 +334,518 @@ class AioPomp(SyncPomp):
         """
         await self.prepare(crawler)
 
-        # add ENTRY_REQUESTS to the queue
-        next_requests = getattr(crawler, 'ENTRY_REQUESTS', None)
-        if next_requests:
-            await self._put_requests(iterator(next_requests))
-
-        _pending_iteration_tasks = []
+        replayed = self.journal.replay() if self.journal is not None else None
+        if replayed:
+            # resume interrupted crawl, requests are already journaled
+            await _co(self.queue.put_requests(
+                self._count_requests(replayed),
+            ))
+        else:
+            # add ENTRY_REQUESTS to the queue
+            next_requests = getattr(crawler, 'ENTRY_REQUESTS', None)
+            if next_requests:
+                await self._put_requests(iterator(next_requests))
+
+        self.tasks = AioTaskSet(limit=self.max_tasks)
+        self.stopping = False
+        self._dispatcher = ensure_future(self._dispatch(crawler))
+        signals = self._add_signal_handlers()
+        try:
+            try:
+                await self._dispatcher
+            except asyncio.CancelledError:
+                if not self.stopping:
+                    # pump itself is cancelled
+                    self.tasks.cancel()
+                    raise
+            # loop ended, but we have pending tasks - wait
+            await self.tasks.drain(
+                self.drain_timeout if self.stopping else None
+            )
+            # return delayed requests to the queue on stop
+            for key in list(self._delayed):
+                handle, requests = self._delayed.pop(key)
+                handle.cancel()
+                await _co(self.queue.put_requests(requests))
+        finally:
+            self._remove_signal_handlers(signals)
+            self._dispatcher = None
+            for handle, _ in self._delayed.values():
+                handle.cancel()
+            self._delayed.clear()
 
-        def _on_iterations_task_done(task, future):
-            _pending_iteration_tasks.remove(task)
+        await self.finish(crawler)
 
+    async def _dispatch(self, crawler):
         while True:
 
-            if self.queue_lock and self.queue_semaphore_value <= 0:
-                await self.queue_lock.acquire()
+            # wait for free slot
+            await self.scheduler.wait()
 
             next_requests = await self.queue.get_requests(
-                count=self.queue_semaphore_value
+                count=self.scheduler.available()
             )
 
             if isinstance(next_requests, StopCommand):
                 break
 
-            # process requests and do not block loop
-            task = asyncio.ensure_future(
-                self.process_requests(
-                    iterator(next_requests), crawler,
+            requests = [r for r in iterator(next_requests) if r]
+            for index, request in enumerate(requests):
+                acquired = False
+                try:
+                    await self.scheduler.acquire()
+                    acquired = True
+
+                    # process request and do not block loop
+                    await self.tasks.spawn(
+                        self.process_requests((request, ), crawler)
+                    )
+                except asyncio.CancelledError:
+                    if acquired:
+                        self.scheduler.release()
+                    # return not dispatched requests to the queue, they are
+                    # already counted in progress
+                    await _co(self.queue.put_requests(requests[index:]))
+                    raise
+
+    def stop(self):
+        """Stop crawling
+
+        Do not take new requests and wait for running tasks up to
+        `drain_timeout`, on the second call cancel running tasks.
+        """
+        if self._dispatcher is None:
+            return
+        if self.stopping:
+            log.warning('Cancel running tasks: %s', len(self.tasks))
+            self.tasks.cancel()
+            return
+        log.info('Stop crawling, running tasks: %s', len(self.tasks))
+        self.stopping = True
+        self._dispatcher.cancel()
+
+    def _on_signal(self, signum):
+        log.warning('Got signal %s', signum)
+        self.stop()
+
+    def _add_signal_handlers(self):
+        if not self.handle_signals:
+            return ()
+        loop = asyncio.get_event_loop()
+        signals = []
+        for signum in self.STOP_SIGNALS:
+            if signal.getsignal(signum) not in (
+                    signal.SIG_DFL, signal.default_int_handler):
+                # do not replace handler of application
+                continue
+            try:
+                loop.add_signal_handler(signum, self._on_signal, signum)
+            except (NotImplementedError, RuntimeError, ValueError):
+                # not supported by loop or not the main thread
+                continue
+            signals.append(signum)
+        return signals
+
+    def _remove_signal_handlers(self, signals):
+        loop = asyncio.get_event_loop()
+        for signum in signals:
+            loop.remove_signal_handler(signum)
+
+    async def prepare(self, crawler):
+        self._prepare_middlewares()
+
+        log.info('Prepare downloader: %s', self.downloader)
+        await _co(self.downloader.start(crawler))
+        self.in_progress = 0
+
+        log.info('Start crawler: %s', crawler)
+
+        for pipe in self.pipelines:
+            log.info('Start pipe: %s', pipe)
+            try:
+                await _co(pipe.start(crawler))
+            except Exception as e:
+                log.exception("On pipe start")
+                await self._exception_middlewares(
+                    BaseCrawlException(
+                        request=None,
+                        response=None,
+                        exception=e,
+                        exc_info=sys.exc_info(),
+                    ),
+                    crawler,
                 )
+
+        self._prepare_scheduler()
+
+    async def finish(self, crawler):
+        try:
+            await _co(self.downloader.stop(crawler))
+        except Exception as e:
+            log.exception("On downloader stop")
+            await self._exception_middlewares(
+                BaseCrawlException(
+                    request=None,
+                    response=None,
+                    exception=e,
+                    exc_info=sys.exc_info(),
+                ),
+                crawler,
             )
-            _pending_iteration_tasks.append(task)
-            task.add_done_callback(
-                partial(_on_iterations_task_done, task)
+        for pipe in self.pipelines:
+            log.info('Stop pipe: %s', pipe)
+            try:
+                await _co(pipe.stop(crawler))
+            except Exception as e:
+                log.exception("On pipe stop")
+                await self._exception_middlewares(
+                    BaseCrawlException(
+                        request=None,
+                        response=None,
+                        exception=e,
+                        exc_info=sys.exc_info(),
+                    ),
+                    crawler,
+                )
+        log.info('Stop crawler: %s', crawler)
+
+    async def process_requests(self, requests, crawler):
+
+        # process requests by middlewares
+        async for request in self._req_middlewares(requests, crawler):
+
+            if isinstance(request, BaseCrawlException):
+                # request processing is already done by middlewares
+                await self._resp_middlewares(request, crawler)
+                continue
+
+            if isinstance(request, BaseResponse):
+                # download is skipped by middlewares
+                await self._process_response(request, crawler)
+                continue
+
+            # hold host slot while request is downloading
+            await self.scheduler.acquire_host(request)
+
+            # execute requests by downloader in the current task
+            response = None
+            try:
+                try:
+                    response = await _await(
+                        self.downloader.process(crawler, request)
+                    )
+                finally:
+                    self.scheduler.release_host(
+                        request,
+                        failed=response is None or
+                        isinstance(response, BaseCrawlException),
+                    )
+            except Exception as e:
+                log.exception("On downloader process")
+                exception = BaseCrawlException(
+                    request=request,
+                    response=None,
+                    exception=e,
+                    exc_info=sys.exc_info(),
+                )
+                await self._exception_middlewares(exception, crawler)
+                await self._request_done(exception, crawler)
+                continue
+
+            # process response by middlewares and crawler
+            await self._process_response(response, crawler)
+
+    async def _process_response(self, response, crawler):
+        # pass response to middlewares
+        processed = await self._resp_middlewares(response, crawler)
+        if processed is None:
+            # response skipped by middlewares
+            await self._request_done(response, crawler)
+        else:
+            # process response by crawler
+            await self.response_callback(crawler, processed)
+
+    async def response_callback(self, crawler, response):
+        try:
+            if not isinstance(response, BaseCrawlException):
+                await self.on_response(crawler, response)
+            else:
+                await self._request_done(response, crawler)
+        except Exception as e:
+            log.exception("On response processing")
+            await self._exception_middlewares(
+                BaseCrawlException(
+                    request=response.get_request(),
+                    response=response,
+                    exception=e,
+                    exc_info=sys.exc_info(),
+                ),
+                crawler,
             )
 
-        # loop ended, but we have pending tasks - wait
-        if _pending_iteration_tasks:
-            log.debug(
-                "Wait pending iteration tasks: %s",
-                len(_pending_iteration_tasks),
-            )
-            await asyncio.wait(_pending_iteration_tasks)
+    async def on_response(self, crawler, response):
 
-        await self.finish(crawler)
+        try:
+            # wait coroutine, Planned or Future object
+            result = await _await(crawler.process(response))
+        except Exception as e:
+            await self._exception_middlewares(e, crawler)
+            result = None
 
-    # some kind of python magic
-    # read SyncPomp.* sources, add async/await/adapters by `# asyncio: `
-    # directive and inject to this class as native methods
-    exec('\n'.join(switch_to_asyncio(SyncPomp.prepare)))
-    exec('\n'.join(switch_to_asyncio(SyncPomp.process_requests)))
-    exec('\n'.join(switch_to_asyncio(SyncPomp.response_callback)))
-    exec('\n'.join(switch_to_asyncio(SyncPomp.on_response)))
-    exec('\n'.join(switch_to_asyncio(SyncPomp.on_parse_result)))
-    exec('\n'.join(switch_to_asyncio(SyncPomp._request_done)))
-    exec('\n'.join(switch_to_asyncio(SyncPomp._process_items)))
-    exec('\n'.join(switch_to_asyncio(SyncPomp._put_requests)))
-    exec('\n'.join(switch_to_asyncio(SyncPomp._req_middlewares)))
-    exec('\n'.join(switch_to_asyncio(SyncPomp._resp_middlewares)))
-    exec('\n'.join(switch_to_asyncio(SyncPomp._exception_middlewares)))
-    exec('\n'.join(switch_to_asyncio(SyncPomp.finish)))
+        if isinstance(result, BaseCrawlException):
+            await self._exception_middlewares(result, crawler)
+            await self._request_done(response, crawler)
+        else:
+            await self.on_parse_result(crawler, result, response)
+
+    async def on_parse_result(self, crawler, result, response):
+        try:
+            # collect requests of the page and put them to the queue at once
+            requests = []
+            if isinstance(result, types.GeneratorType):
+                for items in result:
+                    async for request in self._process_items(
+                            crawler, iterator(items), response=response):
+                        requests.extend(iterator(request))
+            elif hasattr(result, '__anext__'):  # support async generators
+                async for items in result:
+                    async for request in self._process_items(
+                            crawler, iterator(items), response=response):
+                        requests.extend(iterator(request))
+            else:
+                async for request in self._process_items(
+                        crawler, iterator(result), response=response):
+                    requests.extend(iterator(request))
+
+            next_requests = await _co(crawler.next_requests(response))
+
+            if hasattr(next_requests, '__anext__'):  # support async generators
+                async for request in next_requests:
+                    requests.extend(iterator(request))
+            elif next_requests is not None:
+                requests.extend(iterator(next_requests))
+
+            await self._put_requests(
+                requests,
+                crawler=crawler,
+                response=response,
+            )
+        finally:
+            await self._request_done(response, crawler)
+
+    async def _process_items(self, crawler, items, response=None):
+
+        for item in items:
+
+            if not item:
+                continue
+
+            # yield item as request
+            if isinstance(item, BaseRequest):
+                yield item
+            else:
+                # proccess item as data item by pipes
+                for pipe in self.pipelines:
+                    try:
+                        item = await _co(pipe.process(crawler, item))
+                    except Exception as e:
+                        log.exception("On pipe process")
+                        await self._exception_middlewares(
+                            BaseCrawlException(
+                                request=response.get_request(),
+                                response=response,
+                                exception=e,
+                                exc_info=sys.exc_info(),
+                            ),
+                            crawler,
+                        )
+                    else:
+                        # item filtered - stop pipe processing
+                        if not item:
+                            log.debug(
+                                "Stop item processing. Pipeline %s on %s",
+                                pipe, item,
+                            )
+                            break
+
+    async def _req_middlewares(self, requests, crawler):
+        # pass requests to middlewares
+        for request in requests:
+            source = request
+
+            for middleware in self.request_middlewares:
+                try:
+                    request = await _co(middleware.process_request(
+                        request, crawler, self.downloader,
+                    ))
+                except Exception as e:
+                    log.exception(
+                        'Exception on process %s by %s', request, middleware)
+
+                    # yield exception instance instead of request
+                    # do not break request-response processing logic
+                    yield BaseCrawlException(
+                        request=request,
+                        response=None,
+                        exception=e,
+                        exc_info=sys.exc_info(),
+                    )
+
+                    # mark to stop request processing
+                    request = None
+
+                # response instead of download, e.g. from cache
+                if isinstance(request, BaseResponse):
+                    break
+
+                # stop middleware chain
+                if not request:
+                    log.debug(
+                        "Stop request processing. Middleware %s on %s",
+                        middleware, request,
+                    )
+                    await self._request_done(None, crawler, request=source)
+                    break
+
+            if request:
+                yield request
+
+    async def _resp_middlewares(self, response, crawler):
+        # pass response to middlewares
+        for middleware in self.response_middlewares:
+            # exception may be replaced by response, e.g. from cache
+            is_error = isinstance(response, BaseCrawlException)
+            func = 'process_response' if not is_error else 'process_exception'
+            try:
+                value = await _co(getattr(middleware, func)(
+                    response, crawler, self.downloader,
+                ))
+            except Exception as e:
+                log.exception(
+                    'Exception on process %s by %s', response, middleware,
+                )
+                response = await self._exception_middlewares(
+                    BaseCrawlException(
+                        request=response.get_request()
+                        if isinstance(response, BaseHttpResponse) else None,
+                        response=response,
+                        exception=e,
+                        exc_info=sys.exc_info(),
+                    ),
+                    crawler,
+                )
+                value = None  # stop processing response by middlewares
+            if isinstance(value, BaseRequest):
+                # request is returned to the queue, e.g. for retry
+                await self._put_returned_request(value, crawler)
+                return None
+            if not value:
+                log.debug(
+                    "Stop response processing. Middleware %s on %s",
+                    middleware, response,
+                )
+                return None
+            response = value
+
+        return response
+
+    async def _exception_middlewares(self, exception, crawler):
+        value = None
+        for middleware in self.response_middlewares:
+            try:
+                value = await _co(middleware.process_exception(
+                    exception, crawler, self.downloader,
+                ))
+                if isinstance(value, BaseRequest):
+                    await self._put_returned_request(value, crawler)
+                    return None
+                if value is None:  # stop processing exception
+                    log.debug(
+                        "Stop exception processing. Middleware %s on %s",
+                        middleware, value,
+                    )
+                    break
+            except Exception:
+                log.exception(
+                    'Exception on process %s by %s', exception, middleware
+                )
+        return value
+
+    async def _put_requests(
+            self, requests, response=None, crawler=None, not_before=None):
+        if hasattr(requests, 'add_done_callback'):
+            # "hold" engine and wait future/planned
+            self.in_progress += 1
+            try:
+                requests = await _await(requests)
+            finally:
+                self.in_progress -= 1
+
+        requests = self._count_requests(requests, response)
+        if not requests:
+            return
+        self._journal_put(requests)
+        delay = not_before - time.time() if not_before is not None else 0
+        if delay > 0:
+            # delayed requests are counted in progress, but do not hold
+            # slots of the scheduler and tasks while they wait
+            key = next(self._delayed_keys)
+            handle = asyncio.get_event_loop().call_later(
+                delay, self._put_delayed, key,
+            )
+            self._delayed[key] = (handle, requests)
+        else:
+            await _co(self.queue.put_requests(requests))
+
+    def _put_delayed(self, key):
+        _, requests = self._delayed.pop(key)
+        ensure_future(_co(self.queue.put_requests(requests)))
+
+    async def _put_returned_request(self, request, crawler):
+        await self._put_requests(
+            (request, ), crawler=crawler,
+            not_before=getattr(request, 'not_before', None),
+        )
+
+    async def _request_done(self, response, crawler, request=None):
+        if self.journal is not None or self._has_queue_done:
+            request = self._get_done_request(response, request)
+            if request is not None:
+                self._journal_done(request)
+                await _co(self._queue_done(request))
+        if self._is_done():
+            # work done
+            await _co(self.queue.put_requests(StopCommand()))
+
+        # response processing complete
+        try:
+            await _co(crawler.on_processing_done(response))
+        except Exception as e:
+            log.exception("On done processing exception")
+            await self._exception_middlewares(
+                BaseCrawlException(
+                    request=response.get_request(),
+                    response=response,
+                    exception=e,
+                    exc_info=sys.exc_info(),
+                ),
+                crawler,
+            )
+        finally:
+            self._release_response(response)
 
 
 class AioConcurrentCrawler(ConcurrentCrawler):
 
     async def process(self, response):
+        if isinstance(response, ParsedResponse):
+            return response.results
         try:
             return await asyncio.get_event_loop().run_in_executor(
                 self.executor,
                 _run_crawler_worker,
                 self.worker_params,
-                response,
+                detach_body(response),
             )
         except Exception as e:
             log.exception('Exception on %s', response)
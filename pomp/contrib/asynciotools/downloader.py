@@ -0,0 +1,591 @@
+"""
+Asyncio http downloader without third-party dependencies
+
+Fetches data over HTTP/1.1 keep-alive connections opened by
+`asyncio.open_connection`. Compressed body is decoded while it is read,
+see :mod:`pomp.contrib.decoding`.
+"""
+import io
+import sys
+import time
+import asyncio
+import logging
+import collections
+from http.client import parse_headers
+from urllib.error import HTTPError
+from urllib.parse import urlsplit
+from urllib.request import Request
+
+from pomp.core.base import (
+    BaseDownloader, BaseHttpRequest, BaseHttpResponse,
+    BaseCrawlException, TimeoutCrawlException, BodySizeCrawlException,
+)
+from pomp.contrib.decoding import ACCEPT_ENCODING, get_decoder
+
+
+log = logging.getLogger('pomp.contrib.asynciotools.downloader')
+
+
+READ_CHUNK_SIZE = 64 * 1024
+DEFAULT_PORTS = {
+    'http': 80,
+    'https': 443,
+}
+
+if hasattr(asyncio, 'current_task'):
+    _current_task = asyncio.current_task
+else:  # pragma: no cover
+    _current_task = asyncio.Task.current_task
+
+
+class AsyncioHttpRequest(BaseHttpRequest):
+    """Request for :class:`AsyncioHttpDownloader`
+
+    :param url: url
+    :param method: http method
+    :param headers: dict of http headers
+    :param data: request body bytes
+    :param connect_timeout: connect timeout in seconds
+    :param read_timeout: socket read timeout in seconds
+    :param total_timeout: deadline for the whole request in seconds
+    :param max_body_size: max size of response body in bytes
+
+    Timeouts and body size override downloader options for this request.
+    """
+
+    def __init__(
+            self, url, method='GET', headers=None, data=None,
+            connect_timeout=None, read_timeout=None, total_timeout=None,
+            max_body_size=None):
+        self.url = url
+        self.method = method
+        self.headers = headers or {}
+        self.data = data
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.total_timeout = total_timeout
+        self.max_body_size = max_body_size
+
+    def __str__(self):
+        return '<AsyncioHttpRequest {s.method} {s.url}>'.format(s=self)
+
+
+class AsyncioHttpResponse(BaseHttpResponse):
+    """Response of :class:`AsyncioHttpDownloader`
+
+    :param request: request
+    :param status: http status code
+    :param reason: http status reason
+    :param headers: ``http.client.HTTPMessage`` instance
+    :param body: response body bytes
+    """
+
+    def __init__(self, request, status, reason, headers, body):
+        self.request = request
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.body = body
+
+    def get_request(self):
+        return self.request
+
+    def __str__(self):
+        return '<AsyncioHttpResponse {s.status} on {s.request}>'.format(
+            s=self,
+        )
+
+
+class _Deadline(object):
+    """Timeouts of one request applied by one timer of event loop
+
+    Expired deadline cancels the task and :class:`asyncio.TimeoutError`
+    is raised on exit of ``with`` block. Timer is not rescheduled by every
+    read, timer callback checks the actual deadline and rearms itself.
+
+    :param total_timeout: deadline for the whole ``with`` block in seconds
+    """
+
+    def __init__(self, total_timeout=None):
+        self.loop = asyncio.get_event_loop()
+        self.total_at = None if total_timeout is None \
+            else self.loop.time() + total_timeout
+        self.timeout = None
+        self.timeout_at = None
+        self.expired = False
+        self._task = None
+        self._cancelling = 0
+        self._handle = None
+
+    def set_timeout(self, timeout):
+        """Limit every following wait by `timeout` in seconds"""
+        self.timeout = timeout
+        self.touch()
+
+    def touch(self):
+        """Restart timeout before the next wait"""
+        if self.timeout is None:
+            self.timeout_at = None
+        else:
+            self.timeout_at = self.loop.time() + self.timeout
+        self._arm()
+
+    def _get_when(self):
+        if self.timeout_at is None:
+            return self.total_at
+        if self.total_at is None:
+            return self.timeout_at
+        return min(self.timeout_at, self.total_at)
+
+    def _arm(self):
+        if self._task is None or self.expired:
+            return
+        when = self._get_when()
+        if when is None:
+            return
+        # timer fired earlier rearms itself
+        if self._handle is None or self._handle.when() > when:
+            if self._handle is not None:
+                self._handle.cancel()
+            self._handle = self.loop.call_at(when, self._on_timer)
+
+    def _on_timer(self):
+        self._handle = None
+        when = self._get_when()
+        if when is None:
+            return
+        if when > self.loop.time():
+            self._handle = self.loop.call_at(when, self._on_timer)
+            return
+        self.expired = True
+        self._task.cancel()
+
+    def __enter__(self):
+        self._task = _current_task()
+        if hasattr(self._task, 'cancelling'):
+            self._cancelling = self._task.cancelling()
+        self._arm()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        task, self._task = self._task, None
+        if self.expired and exc_type is asyncio.CancelledError:
+            if hasattr(task, 'uncancel') and \
+                    task.uncancel() > self._cancelling:
+                # task is cancelled by other side too
+                return
+            raise asyncio.TimeoutError('request timeout exceeded')
+
+
+class _Body(object):
+    """Collect decoded body and check its size
+
+    :param request: request
+    :param headers: response headers
+    :param max_body_size: max size of decoded body in bytes
+    :param decode_content: decode body by ``Content-Encoding`` header
+    """
+
+    def __init__(self, request, headers, max_body_size, decode_content):
+        self.request = request
+        self.max_body_size = max_body_size
+        self.decoder = get_decoder(
+            headers.get('Content-Encoding'), chunk_size=READ_CHUNK_SIZE,
+        ) if decode_content else None
+        self.chunks = []
+        self.size = 0
+
+        length = headers.get('Content-Length')
+        if max_body_size is not None and length and length.isdigit() \
+                and int(length) > max_body_size:
+            raise self._get_size_exception()
+
+    def _get_size_exception(self):
+        return BodySizeCrawlException(
+            self.request,
+            exception=ValueError(
+                'Response body exceeds %s bytes' % self.max_body_size
+            ),
+        )
+
+    def _add(self, chunks):
+        for chunk in chunks:
+            self.size += len(chunk)
+            if self.max_body_size is not None and \
+                    self.size > self.max_body_size:
+                raise self._get_size_exception()
+            self.chunks.append(chunk)
+
+    def write(self, chunk):
+        self._add(
+            (chunk, ) if self.decoder is None else self.decoder.decode(chunk)
+        )
+
+    def read(self):
+        if self.decoder is not None:
+            self._add(self.decoder.flush())
+            self.decoder = None
+        return b''.join(self.chunks)
+
+
+class _Connection(object):
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.released_at = None
+
+    def is_closing(self):
+        return self.writer.is_closing() or self.reader.at_eof()
+
+    def close(self):
+        self.writer.close()
+
+
+class AsyncioConnectionPool(object):
+    """Per host pool of keep-alive asyncio connections
+
+    :param maxsize: max count of idle connections kept for each host,
+                    released connections over the limit are closed
+    :param idle_timeout: idle connection older than this value in seconds
+                         is evicted from the pool
+    """
+
+    def __init__(self, maxsize=10, idle_timeout=60):
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+        # (scheme, host, port) -> deque of connections
+        self._idle = {}
+
+    async def get_connection(self, scheme, host, port, timeout=None):
+        """Pop idle connection to the host or open new one
+
+        :rtype: tuple of connection and reused flag
+        """
+        now = time.time()
+        idle = self._idle.get((scheme, host, port))
+        while idle:
+            conn = idle.pop()
+            if now - conn.released_at <= self.idle_timeout \
+                    and not conn.is_closing():
+                return conn, True
+            conn.close()
+
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(
+                host, port, ssl=True if scheme == 'https' else None,
+            ),
+            timeout,
+        )
+        return _Connection(reader, writer), False
+
+    def release(self, conn, scheme, host, port):
+        """Return connection to the pool for following requests"""
+        idle = self._idle.setdefault(
+            (scheme, host, port), collections.deque(),
+        )
+        if len(idle) < self.maxsize:
+            conn.released_at = time.time()
+            idle.append(conn)
+        else:
+            conn.close()
+
+    def evict_idle(self):
+        """Close connections idle more than `idle_timeout`"""
+        now = time.time()
+        for idle in self._idle.values():
+            # oldest connections are in the left side
+            while idle and now - idle[0].released_at > self.idle_timeout:
+                idle.popleft().close()
+
+    def get_idle_count(self):
+        return sum(len(idle) for idle in self._idle.values())
+
+    def close(self):
+        """Close all idle connections"""
+        for idle in self._idle.values():
+            while idle:
+                idle.pop().close()
+        self._idle.clear()
+
+
+class AsyncioHttpDownloader(BaseDownloader):
+    """Asyncio downloader over HTTP/1.1 keep-alive connections
+
+    Accepts any :class:`pomp.core.base.BaseHttpRequest` with `url`
+    attribute, method, headers and body are taken from
+    :class:`AsyncioHttpRequest` or ``urllib.request.Request`` instances.
+    Redirects are not followed.
+
+    :param concurrency: max count of concurrent requests
+    :param timeout: connect and read timeout in seconds
+    :param connect_timeout: connect timeout in seconds, `timeout` by default
+    :param read_timeout: socket read timeout in seconds, `timeout` by default
+    :param total_timeout: deadline for the whole request in seconds
+    :param pool_maxsize: max count of idle connections for each host
+    :param idle_timeout: idle connection lifetime in seconds
+    :param headers: dict of default http headers
+    :param max_body_size: max size of response body in bytes, larger
+                          responses are aborted and returned as
+                          :class:`pomp.core.base.BodySizeCrawlException`
+    :param decode_content: request compressed body and decode it,
+                           `max_body_size` limits decoded body
+    """
+    # exceptions raised when server closed keep-alive connection
+    RETRY_EXCEPTIONS = (ConnectionError, )
+
+    def __init__(
+            self, concurrency=100, timeout=None, connect_timeout=None,
+            read_timeout=None, total_timeout=None, pool_maxsize=10,
+            idle_timeout=60, headers=None, max_body_size=None,
+            decode_content=True):
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.connect_timeout = timeout if connect_timeout is None \
+            else connect_timeout
+        self.read_timeout = timeout if read_timeout is None \
+            else read_timeout
+        self.total_timeout = total_timeout
+        self.headers = headers or {}
+        self.max_body_size = max_body_size
+        self.decode_content = decode_content
+        self.pool = AsyncioConnectionPool(
+            maxsize=pool_maxsize,
+            idle_timeout=idle_timeout,
+        )
+        self._semaphore = None
+
+    def start(self, crawler):
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+
+    def get_workers_count(self):
+        return self.concurrency
+
+    def stop(self, crawler):
+        self.pool.close()
+
+    async def process(self, crawler, request):
+        if self._semaphore is None:
+            self.start(crawler)
+
+        def _option(name):
+            value = getattr(request, name, None)
+            return getattr(self, name) if value is None else value
+
+        log.info("Fetch %s", request)
+        try:
+            async with self._semaphore:
+                # deadline is applied by timer without wrapping of every
+                # wait to `asyncio.wait_for` task
+                with _Deadline(_option('total_timeout')) as deadline:
+                    return await self._fetch(
+                        request,
+                        deadline,
+                        _option('connect_timeout'),
+                        _option('read_timeout'),
+                        _option('max_body_size'),
+                    )
+        except BodySizeCrawlException as e:
+            log.warning('Abort %s: %s', request, e.exception)
+            return e
+        except Exception as e:
+            log.exception('Exception on %s', request)
+            exception_class = TimeoutCrawlException \
+                if isinstance(e, asyncio.TimeoutError) else BaseCrawlException
+            return exception_class(
+                request,
+                exception=e,
+                exc_info=sys.exc_info(),
+            )
+
+    def _build_request(self, request, url):
+        if isinstance(request, AsyncioHttpRequest):
+            method, body = request.method, request.data
+            headers = request.headers
+        elif isinstance(request, Request):
+            method, body = request.get_method(), request.data
+            headers = dict(request.header_items())
+        else:
+            method, body, headers = 'GET', None, {}
+
+        path = url.path or '/'
+        if url.query:
+            path = '%s?%s' % (path, url.query)
+
+        host = url.hostname
+        if url.port and url.port != DEFAULT_PORTS.get(url.scheme):
+            host = '%s:%s' % (host, url.port)
+
+        all_headers = {
+            'Host': host,
+            'Accept': '*/*',
+            'Connection': 'keep-alive',
+        }
+        if self.decode_content:
+            all_headers['Accept-Encoding'] = ACCEPT_ENCODING
+        all_headers.update(self.headers)
+        all_headers.update(headers)
+        if body is not None:
+            all_headers['Content-Length'] = str(len(body))
+
+        lines = ['%s %s HTTP/1.1' % (method, path)]
+        lines.extend('%s: %s' % item for item in all_headers.items())
+        data = ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+        if body is not None:
+            data += body
+        return method, data
+
+    async def _connect(self, url, port, deadline, connect_timeout):
+        deadline.set_timeout(connect_timeout)
+        return await self.pool.get_connection(
+            url.scheme, url.hostname, port,
+        )
+
+    async def _fetch(
+            self, request, deadline, connect_timeout, read_timeout,
+            max_body_size=None):
+        url = urlsplit(request.url)
+        port = url.port or DEFAULT_PORTS[url.scheme]
+        method, data = self._build_request(request, url)
+
+        self.pool.evict_idle()
+        conn, reused = await self._connect(
+            url, port, deadline, connect_timeout,
+        )
+        try:
+            try:
+                deadline.set_timeout(read_timeout)
+                status, reason, headers = await self._send(
+                    conn, data, deadline,
+                )
+            except self.RETRY_EXCEPTIONS:
+                conn.close()
+                if not reused:
+                    raise
+                # keep-alive connection was closed by server - retry once
+                conn, _ = await self._connect(
+                    url, port, deadline, connect_timeout,
+                )
+                deadline.set_timeout(read_timeout)
+                status, reason, headers = await self._send(
+                    conn, data, deadline,
+                )
+
+            body = _Body(
+                request, headers, max_body_size, self.decode_content,
+            )
+            keep_alive = await self._read_body(
+                conn, method, status, headers, deadline, body.write,
+            )
+            content = body.read()
+        except BaseException:
+            conn.close()
+            raise
+
+        if keep_alive:
+            self.pool.release(conn, url.scheme, url.hostname, port)
+        else:
+            conn.close()
+
+        response = AsyncioHttpResponse(
+            request, status, reason, headers, content,
+        )
+        if status >= 400:
+            return BaseCrawlException(
+                request,
+                response=response,
+                exception=HTTPError(
+                    request.url, status, reason, headers, None,
+                ),
+            )
+        return response
+
+    async def _send(self, conn, data, deadline):
+        conn.writer.write(data)
+        deadline.touch()
+        await conn.writer.drain()
+
+        deadline.touch()
+        status_line = await conn.reader.readline()
+        if not status_line:
+            raise ConnectionResetError('connection closed by server')
+        parts = status_line.decode('latin-1').rstrip('\r\n').split(' ', 2)
+        if len(parts) < 2:
+            raise ValueError('bad status line: %r' % status_line)
+        version, status = parts[0], int(parts[1])
+        reason = parts[2] if len(parts) > 2 else ''
+
+        header_lines = []
+        while True:
+            deadline.touch()
+            line = await conn.reader.readline()
+            header_lines.append(line)
+            if line in (b'\r\n', b'\n', b''):
+                break
+        headers = parse_headers(io.BytesIO(b''.join(header_lines)))
+        headers.http_version = version
+        return status, reason, headers
+
+    async def _read_body(
+            self, conn, method, status, headers, deadline, on_chunk):
+        """Stream response body to `on_chunk` callback
+
+        `deadline` is touched before every read.
+
+        :rtype: True if connection may be reused
+        """
+        reader = conn.reader
+        connection = (headers.get('Connection') or '').lower()
+        if headers.http_version == 'HTTP/1.0':
+            keep_alive = connection == 'keep-alive'
+        else:
+            keep_alive = connection != 'close'
+
+        if method == 'HEAD' or status in (204, 304) or 100 <= status < 200:
+            return keep_alive
+
+        if 'chunked' in (headers.get('Transfer-Encoding') or '').lower():
+            while True:
+                deadline.touch()
+                size_line = await reader.readline()
+                size = int(size_line.split(b';', 1)[0].strip(), 16)
+                if size == 0:
+                    # skip trailers
+                    while True:
+                        deadline.touch()
+                        line = await reader.readline()
+                        if line in (b'\r\n', b'\n', b''):
+                            break
+                    return keep_alive
+                while size:
+                    deadline.touch()
+                    chunk = await reader.read(min(size, READ_CHUNK_SIZE))
+                    if not chunk:
+                        raise asyncio.IncompleteReadError(b'', size)
+                    size -= len(chunk)
+                    on_chunk(chunk)
+                deadline.touch()
+                await reader.readline()
+
+        length = headers.get('Content-Length')
+        if length is not None:
+            length = int(length)
+            while length:
+                deadline.touch()
+                chunk = await reader.read(min(length, READ_CHUNK_SIZE))
+                if not chunk:
+                    raise asyncio.IncompleteReadError(b'', length)
+                length -= len(chunk)
+                on_chunk(chunk)
+            return keep_alive
+
+        # body until connection closed
+        while True:
+            deadline.touch()
+            chunk = await reader.read(READ_CHUNK_SIZE)
+            if not chunk:
+                return False
+            on_chunk(chunk)
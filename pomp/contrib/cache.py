@@ -0,0 +1,564 @@
+"""
+HTTP responses cache
+
+:class:`HttpCacheMiddleware` stores responses by request fingerprint and
+returns cached response instead of download. Stale response with ``ETag``
+or ``Last-Modified`` header is revalidated by conditional request and
+``304 Not Modified`` response is replaced by the cached one.
+
+Cached responses are kept by :class:`FilesystemCacheStorage` - bodies in
+files and index in sqlite database, so many crawler processes may share
+one cache directory. Entries are evicted by `ttl` and least recently used
+entries are evicted by `max_size` and `max_entries` limits.
+"""
+import os
+import json
+import time
+import logging
+import sqlite3
+import binascii
+import tempfile
+import threading
+import contextlib
+from email.message import Message
+
+from pomp.core.base import BaseMiddleware, BaseHttpResponse
+from pomp.contrib.dedup import request_fingerprint
+
+
+log = logging.getLogger('pomp.contrib.cache')
+
+
+# atomic replace of existing file, `os.rename` on python 2
+_replace = getattr(os, 'replace', os.rename)
+
+# headers of 304 response not applied to cached response
+NOT_UPDATED_HEADERS = frozenset((
+    'content-length', 'content-encoding', 'transfer-encoding',
+    'connection', 'keep-alive',
+))
+
+
+class CacheEntry(object):
+    """Cached response
+
+    :param url: url of request
+    :param status: http status code
+    :param headers: list of header name and value pairs
+    :param body: body bytes
+    :param stored_at: timestamp of storing or of the last revalidation
+    """
+
+    def __init__(self, url, status, headers, body, stored_at=None):
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.stored_at = time.time() if stored_at is None else stored_at
+
+    def get_header(self, name):
+        """Value of header by case insensitive name or ``None``"""
+        name = name.lower()
+        for key, value in self.headers:
+            if key.lower() == name:
+                return value
+        return None
+
+
+class BaseCacheStorage(object):
+    """Storage of cached responses interface"""
+
+    def get(self, fingerprint):
+        """Get entry
+
+        :param fingerprint: fingerprint bytes
+        :rtype: :class:`CacheEntry` or ``None``
+        """
+        raise NotImplementedError()
+
+    def set(self, fingerprint, entry):
+        """Store entry
+
+        :param fingerprint: fingerprint bytes
+        :param entry: instance of :class:`CacheEntry`
+        """
+        raise NotImplementedError()
+
+    def touch(self, fingerprint, headers=None):
+        """Mark entry as stored now after revalidation
+
+        :param fingerprint: fingerprint bytes
+        :param headers: new list of header name and value pairs
+        """
+        raise NotImplementedError()
+
+    def delete(self, fingerprint):
+        """Delete entry
+
+        :param fingerprint: fingerprint bytes
+        """
+        raise NotImplementedError()
+
+    def get_size(self):
+        """Total size of stored bodies
+
+        :rtype: size in bytes
+        """
+        raise NotImplementedError()
+
+    def close(self):
+        """Release storage resources"""
+        pass
+
+
+class FilesystemCacheStorage(BaseCacheStorage):
+    """Cached responses in directory
+
+    Each body is kept in own file written to temporary file and renamed,
+    so reader never sees partially written body. Index of entries and
+    totals are kept in sqlite database in WAL mode, body files are renamed
+    and removed in transactions of the index, so storage may be shared by
+    processes. Body removed by other process is reported as not cached.
+
+    :param path: directory path, existing entries are kept
+    :param ttl: entries stored earlier than this value in seconds are
+                evicted
+    :param max_size: max total size of bodies in bytes, least recently
+                     used entries are evicted
+    :param max_entries: max count of entries, least recently used entries
+                        are evicted
+    :param timeout: seconds to wait for lock of database by other process
+    """
+    INDEX_NAME = 'index.sqlite'
+
+    def __init__(
+            self, path, ttl=None, max_size=None, max_entries=None,
+            timeout=30):
+        self.path = path
+        self.ttl = ttl
+        self.max_size = max_size
+        self.max_entries = max_entries
+        _makedirs(path)
+        self._lock = threading.Lock()
+        # transactions are started explicitly
+        self.connection = sqlite3.connect(
+            os.path.join(path, self.INDEX_NAME),
+            timeout=timeout,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        self.connection.execute('PRAGMA journal_mode = WAL')
+        self.connection.execute('PRAGMA synchronous = NORMAL')
+        with self._transaction() as connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS entries ('
+                'fingerprint BLOB PRIMARY KEY, url TEXT, status INTEGER, '
+                'headers TEXT, size INTEGER, stored_at REAL, '
+                'accessed_at REAL) WITHOUT ROWID'
+            )
+            connection.execute(
+                'CREATE INDEX IF NOT EXISTS entries_accessed_at '
+                'ON entries (accessed_at)'
+            )
+            connection.execute(
+                'CREATE INDEX IF NOT EXISTS entries_stored_at '
+                'ON entries (stored_at)'
+            )
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS totals ('
+                'id INTEGER PRIMARY KEY, count INTEGER, size INTEGER)'
+            )
+            connection.execute(
+                'INSERT OR IGNORE INTO totals VALUES (0, 0, 0)'
+            )
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        with self._lock:
+            # lock database for writing at once, not on the first write
+            self.connection.execute('BEGIN IMMEDIATE')
+            try:
+                yield self.connection
+            except BaseException:
+                self.connection.execute('ROLLBACK')
+                raise
+            self.connection.execute('COMMIT')
+
+    def _get_file_path(self, fingerprint):
+        name = binascii.hexlify(fingerprint).decode('ascii')
+        return os.path.join(self.path, name[:2], name)
+
+    def get(self, fingerprint):
+        with self._lock:
+            row = self.connection.execute(
+                'SELECT url, status, headers, stored_at FROM entries '
+                'WHERE fingerprint = ?',
+                (sqlite3.Binary(fingerprint), ),
+            ).fetchone()
+        if row is None:
+            return None
+        url, status, headers, stored_at = row
+        if self.ttl is not None and stored_at < time.time() - self.ttl:
+            self.delete(fingerprint)
+            return None
+
+        try:
+            with open(self._get_file_path(fingerprint), 'rb') as f:
+                body = f.read()
+        except (IOError, OSError):
+            log.debug('Body of %s is removed', url)
+            return None
+
+        with self._lock:
+            self.connection.execute(
+                'UPDATE entries SET accessed_at = ? WHERE fingerprint = ?',
+                (time.time(), sqlite3.Binary(fingerprint)),
+            )
+        return CacheEntry(
+            url, status,
+            [tuple(header) for header in json.loads(headers)],
+            body, stored_at=stored_at,
+        )
+
+    def set(self, fingerprint, entry):
+        path = self._get_file_path(fingerprint)
+        _makedirs(os.path.dirname(path))
+        fd, temp_path = tempfile.mkstemp(
+            prefix='.tmp-', dir=os.path.dirname(path),
+        )
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(entry.body)
+        except BaseException:
+            _remove(temp_path)
+            raise
+
+        size = len(entry.body)
+        key = sqlite3.Binary(fingerprint)
+        now = time.time()
+        with self._transaction() as connection:
+            # under lock of database, so other process does not remove
+            # new body of evicted entry
+            _replace(temp_path, path)
+            old = connection.execute(
+                'SELECT size FROM entries WHERE fingerprint = ?', (key, ),
+            ).fetchone()
+            connection.execute(
+                'INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (
+                    key, entry.url, entry.status, json.dumps(entry.headers),
+                    size, entry.stored_at, now,
+                ),
+            )
+            connection.execute(
+                'UPDATE totals SET count = count + ?, size = size + ?',
+                (0 if old else 1, size - (old[0] if old else 0)),
+            )
+        self.evict()
+
+    def touch(self, fingerprint, headers=None):
+        now = time.time()
+        key = sqlite3.Binary(fingerprint)
+        with self._lock:
+            if headers is None:
+                self.connection.execute(
+                    'UPDATE entries SET stored_at = ?, accessed_at = ? '
+                    'WHERE fingerprint = ?',
+                    (now, now, key),
+                )
+            else:
+                self.connection.execute(
+                    'UPDATE entries SET stored_at = ?, accessed_at = ?, '
+                    'headers = ? WHERE fingerprint = ?',
+                    (now, now, json.dumps(headers), key),
+                )
+
+    def delete(self, fingerprint):
+        with self._transaction() as connection:
+            rows = connection.execute(
+                'SELECT fingerprint, size FROM entries WHERE fingerprint = ?',
+                (sqlite3.Binary(fingerprint), ),
+            ).fetchall()
+            self._delete_rows(connection, rows)
+
+    def evict(self):
+        """Evict expired entries and least recently used entries over
+        limits"""
+        if self.ttl is None and self.max_size is None and \
+                self.max_entries is None:
+            return
+
+        with self._transaction() as connection:
+            rows = []
+            if self.ttl is not None:
+                rows = connection.execute(
+                    'SELECT fingerprint, size FROM entries '
+                    'WHERE stored_at < ?',
+                    (time.time() - self.ttl, ),
+                ).fetchall()
+                self._delete_rows(connection, rows)
+
+            count, size = connection.execute(
+                'SELECT count, size FROM totals',
+            ).fetchone()
+            victims = []
+            if self._is_over(count, size):
+                for fingerprint, entry_size in connection.execute(
+                        'SELECT fingerprint, size FROM entries '
+                        'ORDER BY accessed_at'):
+                    victims.append((fingerprint, entry_size))
+                    count -= 1
+                    size -= entry_size
+                    if not self._is_over(count, size):
+                        break
+                self._delete_rows(connection, victims)
+
+        if rows or victims:
+            log.debug('Evict %s entries', len(rows) + len(victims))
+
+    def _is_over(self, count, size):
+        return (
+            self.max_entries is not None and count > self.max_entries
+        ) or (
+            self.max_size is not None and size > self.max_size
+        )
+
+    def _delete_rows(self, connection, rows):
+        if not rows:
+            return
+        connection.executemany(
+            'DELETE FROM entries WHERE fingerprint = ?',
+            [(fingerprint, ) for fingerprint, _ in rows],
+        )
+        connection.execute(
+            'UPDATE totals SET count = count - ?, size = size - ?',
+            (len(rows), sum(size for _, size in rows)),
+        )
+        for fingerprint, _ in rows:
+            _remove(self._get_file_path(bytes(fingerprint)))
+
+    def __len__(self):
+        with self._lock:
+            return self.connection.execute(
+                'SELECT count FROM totals',
+            ).fetchone()[0]
+
+    def get_size(self):
+        with self._lock:
+            return self.connection.execute(
+                'SELECT size FROM totals',
+            ).fetchone()[0]
+
+    def close(self):
+        self.connection.close()
+
+
+def _makedirs(path):
+    try:
+        os.makedirs(path)
+    except OSError:
+        # created by other process
+        if not os.path.isdir(path):
+            raise
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class CachedHttpResponse(BaseHttpResponse):
+    """Response from cache
+
+    :param request: request
+    :param entry: instance of :class:`CacheEntry`
+    """
+
+    def __init__(self, request, entry):
+        self.request = request
+        self.status = entry.status
+        self.headers = Message()
+        for name, value in entry.headers:
+            self.headers[name] = value
+        self.body = entry.body
+        self.stored_at = entry.stored_at
+
+    def get_request(self):
+        return self.request
+
+    def __str__(self):
+        return '<CachedHttpResponse {s.status} on {s.request}>'.format(
+            s=self,
+        )
+
+
+def _get_method(request):
+    method = getattr(request, 'method', None)
+    if method is None and hasattr(request, 'get_method'):
+        method = request.get_method()
+    return (method or 'GET').upper()
+
+
+def _get_headers(headers):
+    if headers is None:
+        return []
+    return [(str(name), str(value)) for name, value in headers.items()]
+
+
+def _set_header(request, name, value):
+    if hasattr(request, 'add_header'):
+        request.add_header(name, value)
+    elif isinstance(getattr(request, 'headers', None), dict):
+        request.headers[name] = value
+    else:
+        return False
+    return True
+
+
+class HttpCacheMiddleware(BaseMiddleware):
+    """Return cached responses instead of download
+
+    Only responses of GET requests are cached, response with
+    ``Cache-Control: no-store`` header is not stored and request with true
+    `dont_cache` attribute is not cached. Conditional headers are added
+    to requests with `add_header` method or `headers` dict.
+
+    Place the middleware after middlewares which build requests, so it
+    gets final requests and gets responses and exceptions before other
+    middlewares. Engine does not close middlewares - call
+    :meth:`close` when crawling is done.
+
+    :param storage: instance of :class:`BaseCacheStorage`
+    :param max_age: cached response younger than this value in seconds is
+                    returned without request, older response is
+                    revalidated, ``None`` - cached response is never stale
+    :param statuses: http statuses of stored responses
+    :param fingerprint: callable to get request fingerprint bytes,
+                        :func:`pomp.contrib.dedup.request_fingerprint`
+                        by default
+    """
+
+    def __init__(
+            self, storage, max_age=0, statuses=(200, ), fingerprint=None):
+        self.storage = storage
+        self.max_age = max_age
+        self.statuses = statuses
+        self.fingerprint = fingerprint or request_fingerprint
+        self.hits = 0
+        self.revalidated = 0
+        self.stored = 0
+
+    def _is_cacheable(self, request):
+        return request is not None and \
+            not getattr(request, 'dont_cache', False) and \
+            _get_method(request) == 'GET'
+
+    def process_request(self, request, crawler, downloader):
+        if not self._is_cacheable(request):
+            return request
+
+        entry = self.storage.get(self.fingerprint(request))
+        if entry is None:
+            return request
+        if self.max_age is None or \
+                time.time() - entry.stored_at < self.max_age:
+            self.hits += 1
+            log.debug('Cached response of %s', request)
+            return CachedHttpResponse(request, entry)
+
+        # stale response, ask server whether it was changed
+        etag = entry.get_header('ETag')
+        if etag:
+            _set_header(request, 'If-None-Match', etag)
+        last_modified = entry.get_header('Last-Modified')
+        if last_modified:
+            _set_header(request, 'If-Modified-Since', last_modified)
+        return request
+
+    def process_response(self, response, crawler, downloader):
+        request = response.get_request()
+        if not self._is_cacheable(request):
+            return response
+
+        status = getattr(response, 'status', None)
+        headers = getattr(response, 'headers', None)
+        if status == 304:
+            return self._revalidate(request, headers, response)
+
+        body = getattr(response, 'body', None)
+        if status not in self.statuses or body is None or \
+                isinstance(response, CachedHttpResponse):
+            return response
+        headers = _get_headers(headers)
+        if any(
+                name.lower() == 'cache-control' and 'no-store' in value
+                for name, value in headers):
+            return response
+
+        self.storage.set(
+            self.fingerprint(request),
+            CacheEntry(request.url, status, headers, bytes(body)),
+        )
+        self.stored += 1
+        return response
+
+    def process_exception(self, exception, crawler, downloader):
+        # `urlopen` raises `HTTPError` on 304 response
+        response = exception.response
+        status = getattr(response, 'status', None) or \
+            getattr(exception.exception, 'code', None)
+        if status != 304 or not self._is_cacheable(exception.request):
+            return exception
+
+        headers = getattr(response, 'headers', None) or \
+            getattr(exception.exception, 'headers', None)
+        return self._revalidate(exception.request, headers, exception)
+
+    def _revalidate(self, request, headers, response):
+        fingerprint = self.fingerprint(request)
+        entry = self.storage.get(fingerprint)
+        if entry is None:
+            # evicted after request was sent
+            return response
+
+        update = [
+            (name, value) for name, value in _get_headers(headers)
+            if name.lower() not in NOT_UPDATED_HEADERS
+        ]
+        names = set(name.lower() for name, _ in update)
+        entry.headers = [
+            (name, value) for name, value in entry.headers
+            if name.lower() not in names
+        ] + update
+        entry.stored_at = time.time()
+        self.storage.touch(fingerprint, entry.headers)
+        self.revalidated += 1
+        log.debug('Not modified response of %s', request)
+
+        # replaced response is not released by engine
+        release = getattr(response, 'release', None)
+        if release is not None:
+            release()
+        return CachedHttpResponse(request, entry)
+
+    def get_stats(self):
+        """Cache stats
+
+        :rtype: dict with `hits` - count of responses returned without
+                request, `revalidated` - count of not modified responses,
+                `stored` - count of stored responses, `entries` and `size`
+                of storage
+        """
+        return {
+            'hits': self.hits,
+            'revalidated': self.revalidated,
+            'stored': self.stored,
+            'entries': len(self.storage),
+            'size': self.storage.get_size(),
+        }
+
+    def close(self):
+        """Close storage"""
+        self.storage.close()
@@ -6,19 +6,45 @@ import sys
 import signal
 import logging
 import itertools
+import threading
+import multiprocessing
 from functools import partial
-from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
 
 from pomp.core.base import (
-    BaseCrawler, BaseDownloader, BaseCrawlException,
+    BaseCrawler, BaseDownloader, BaseHttpResponse, BaseCrawlException,
+)
+from pomp.contrib.urllibtools import (
+    UrllibDownloadWorker, PooledUrllibDownloadWorker,
 )
-from pomp.contrib.urllibtools import UrllibDownloadWorker
 from pomp.core.utils import iterator, Planned
+from pomp.contrib.sharedbody import (
+    attach_body, detach_body, _run_sharing_body,
+)
 
 
 log = logging.getLogger('pomp.contrib.concurrent')
 
 
+# download worker instances of the current pool process by key of
+# downloader, built once by `_init_download_worker` in `worker_reuse` mode
+_download_workers = {}
+
+# unique keys of downloaders sharing one pool
+_worker_keys = itertools.count()
+
+
+def _init_download_worker(params, key=None):
+    log.debug(
+        "Init download worker pid=%s key=%s params=%s",
+        os.getpid(), key, params,
+    )
+    _download_workers[key] = params['worker_class'](
+        **params.get('worker_kwargs', {})
+    )
+
+
 def _run_download_worker(params, request):
     pid = os.getpid()
     log.debug("Download worker pid=%s params=%s", pid, params)
@@ -34,6 +60,34 @@ def _run_download_worker(params, request):
         raise
 
 
+def _run_reused_download_worker(request, key=None, params=None):
+    pid = os.getpid()
+    try:
+        if key not in _download_workers:
+            # executor without initializer support (python < 3.7)
+            _init_download_worker(params, key)
+        return _download_workers[key].process(request)
+    except Exception:
+        log.exception(
+            "Exception on download worker pid=%s request=%s", pid, request
+        )
+        raise
+
+
+def _parse_response(worker, response):
+    items = worker.extract_items(response)
+    next_requests = worker.next_requests(response)
+
+    if next_requests:
+        return list(
+            itertools.chain(
+                iterator(items),
+                iterator(next_requests),
+            )
+        )
+    return list(iterator(items))
+
+
 def _run_crawler_worker(params, response):
     pid = os.getpid()
     log.debug("Crawler worker pid=%s params=%s", pid, params)
@@ -42,18 +96,46 @@ def _run_crawler_worker(params, response):
         worker = params['worker_class'](**params.get('worker_kwargs', {}))
 
         # process response
-        items = worker.extract_items(response)
-        next_requests = worker.next_requests(response)
-
-        if next_requests:
-            return list(
-                itertools.chain(
-                    iterator(items),
-                    iterator(next_requests),
-                )
-            )
-        return list(iterator(items))
+        return _parse_response(worker, response)
+
+    except Exception:
+        log.exception(
+            "Exception on crawler worker pid=%s request=%s", pid, response
+        )
+        raise
+
+
+# crawler worker instances of the current pool process in fused mode by
+# key of downloader
+_crawler_workers = {}
+
 
+def _run_fused_worker(
+        crawler_params, request, params=None, reuse=False, key=None):
+    if reuse:
+        response = _run_reused_download_worker(request, key, params)
+    else:
+        response = _run_download_worker(params, request)
+    if isinstance(response, BaseCrawlException):
+        return response
+
+    pid = os.getpid()
+    try:
+        worker = _crawler_workers.get(key) if reuse else None
+        if worker is None:
+            worker = crawler_params['worker_class'](
+                **crawler_params.get('worker_kwargs', {})
+            )
+            if reuse:
+                _crawler_workers[key] = worker
+
+        # pass back extracted data instead of response body
+        return ParsedResponse(
+            response.get_request(),
+            _parse_response(worker, response),
+            status=getattr(response, 'status', None),
+            headers=getattr(response, 'headers', None),
+        )
     except Exception:
         log.exception(
             "Exception on crawler worker pid=%s request=%s", pid, response
@@ -61,11 +143,194 @@ def _run_crawler_worker(params, response):
         raise
 
 
+class ParsedResponse(BaseHttpResponse):
+    """Response parsed in download worker process in fused mode
+
+    Response body is not passed back from pool process, only extracted
+    items and next requests.
+
+    :param request: request of response
+    :param results: list of extracted items and next requests
+    :param status: status of the original response
+    :param headers: headers of the original response
+    """
+
+    def __init__(self, request, results, status=None, headers=None):
+        self.request = request
+        self.results = results
+        self.status = status
+        self.headers = headers
+
+    def get_request(self):
+        return self.request
+
+    def __str__(self):
+        return '<ParsedResponse on {s.request}>'.format(s=self)
+
+
+# initializers of the current pool process are done
+_initialized = False
+
+
+def _run_initializers(initializers):
+    global _initialized
+    _initialized = True
+    for initializer, args in initializers:
+        initializer(*args)
+
+
+def _run_job(initializers, fn, *args, **kwargs):
+    if not _initialized:
+        _run_initializers(initializers)
+    return fn(*args, **kwargs)
+
+
+class SharedExecutor(object):
+    """Process pool shared by concurrent downloader and crawler
+
+    Download and parse jobs wait in separate queues and no more than
+    `pool_size` jobs are passed to the pool at once. Free pool process
+    takes the next job by smooth weighted round robin of not empty queues,
+    so both kinds of jobs progress while one of them floods the pool.
+
+    Pass the executor to :class:`ConcurrentDownloader` and
+    :class:`ConcurrentCrawler` by `executor` param, downloader reports
+    `pool_size` as workers count - combined capacity of downloads and
+    parsing. Pool processes are started on the first job, so components in
+    `worker_reuse` mode must be built before crawling.
+
+    :param pool_size: count of pool processes, CPU count by default
+    :param download_weight: share of pool for download jobs
+    :param parse_weight: share of pool for parse jobs
+    """
+    DOWNLOAD = 'download'
+    PARSE = 'parse'
+
+    def __init__(self, pool_size=None, download_weight=1, parse_weight=1):
+        self.pool_size = pool_size or multiprocessing.cpu_count()
+        self.weights = {
+            self.DOWNLOAD: download_weight,
+            self.PARSE: parse_weight,
+        }
+        self.queues = dict((kind, deque()) for kind in self.weights)
+        self.running = 0
+        self._credits = dict.fromkeys(self.weights, 0)
+        self.initializers = []
+        # done callback may be called in submitting thread
+        self._lock = threading.RLock()
+        self._executor = None
+        self._wrap_jobs = False
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            self._executor = self._create_executor()
+        return self._executor
+
+    def _create_executor(self):
+        try:
+            return ProcessPoolExecutor(
+                max_workers=self.pool_size,
+                initializer=_run_initializers,
+                initargs=(self.initializers, ),
+            )
+        except TypeError:  # pragma: no cover
+            # python < 3.7 - initializers will be passed with each job
+            self._wrap_jobs = True
+            return ProcessPoolExecutor(max_workers=self.pool_size)
+
+    def add_initializer(self, initializer, *args):
+        """Add function called once in each pool process
+
+        :param initializer: picklable callable
+        """
+        if self._executor is not None:
+            raise RuntimeError('Pool processes are already started')
+        self.initializers.append((initializer, args))
+
+    def get_executor(self, kind):
+        """Executor interface of jobs queue
+
+        :param kind: :attr:`DOWNLOAD` or :attr:`PARSE`
+        :rtype: instance of ``concurrent.futures.Executor``
+        """
+        return _SharedExecutorQueue(self, kind)
+
+    def submit(self, kind, fn, *args, **kwargs):
+        """Put job to the queue
+
+        :param kind: :attr:`DOWNLOAD` or :attr:`PARSE`
+        :rtype: ``concurrent.futures.Future``
+        """
+        future = Future()
+        with self._lock:
+            self.queues[kind].append((fn, args, kwargs, future))
+            self._dispatch()
+        return future
+
+    def get_workers_count(self):
+        return self.pool_size
+
+    def shutdown(self, wait=True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+
+    def _next_kind(self):
+        kinds = [kind for kind in self.queues if self.queues[kind]]
+        if not kinds:
+            return None
+        total = 0
+        for kind in kinds:
+            self._credits[kind] += self.weights[kind]
+            total += self.weights[kind]
+        kind = max(kinds, key=self._credits.get)
+        self._credits[kind] -= total
+        return kind
+
+    def _dispatch(self):
+        while self.running < self.pool_size:
+            kind = self._next_kind()
+            if kind is None:
+                break
+            fn, args, kwargs, future = self.queues[kind].popleft()
+            if not future.set_running_or_notify_cancel():
+                continue
+            self.running += 1
+            executor = self.executor
+            if self._wrap_jobs:  # pragma: no cover
+                fn, args = partial(_run_job, self.initializers, fn), args
+            executor.submit(fn, *args, **kwargs).add_done_callback(
+                partial(self._on_done, future)
+            )
+
+    def _on_done(self, future, pool_future):
+        with self._lock:
+            self.running -= 1
+            self._dispatch()
+        try:
+            future.set_result(pool_future.result())
+        except Exception as e:
+            future.set_exception(e)
+
+
+class _SharedExecutorQueue(Executor):
+
+    def __init__(self, shared, kind):
+        self.shared = shared
+        self.kind = kind
+
+    def submit(self, fn, *args, **kwargs):
+        return self.shared.submit(self.kind, fn, *args, **kwargs)
+
+    def shutdown(self, wait=True, **kwargs):
+        self.shared.shutdown(wait=wait)
+
+
 class ConcurrentMixin(object):
 
     def _done(self, request, done_future, future):
         try:
-            response = future.result()
+            response = self._get_result(future)
         except Exception as e:
             log.exception('Exception on %s', request)
             done_future.set_result(BaseCrawlException(
@@ -76,26 +341,83 @@ class ConcurrentMixin(object):
         else:
             done_future.set_result(response)
 
+    def _get_result(self, future):
+        return future.result()
+
 
 class ConcurrentDownloader(BaseDownloader, ConcurrentMixin):
     """Concurrent ProcessPoolExecutor downloader
 
-    :param pool_size: size of ThreadPoolExecutor
-    :param timeout: request timeout in seconds
+    :param worker_class: class of download worker,
+                         subclass of :class:`pomp.core.base.BaseDownloadWorker`
+    :param worker_kwargs: keyword arguments for `worker_class` constructor
+    :param pool_size: size of ProcessPoolExecutor
+    :param worker_reuse: build download worker once per pool process
+                         and reuse it for every request, otherwise
+                         worker is built for each request
+    :param executor: instance of :class:`SharedExecutor`, `pool_size` is
+                     ignored
+    :param crawler: instance of :class:`ConcurrentCrawler`, enables fused
+                    mode - response is parsed by the crawler worker in the
+                    download worker process and only extracted items and
+                    next requests are passed back by :class:`ParsedResponse`,
+                    so response middlewares get parsed response without body
+    :param body_threshold: min size of response body in bytes passed from
+                           pool process by shared memory, see
+                           :mod:`pomp.contrib.sharedbody`
+    :param body_transport: :attr:`pomp.contrib.sharedbody.SHM` or
+                           :attr:`pomp.contrib.sharedbody.MMAP`
+    :param body_view: `body` of response is read-only ``memoryview`` of
+                      shared memory instead of bytes copy, see
+                      :func:`pomp.contrib.sharedbody.attach_body`
     """
     def __init__(
             self, worker_class,
-            worker_kwargs=None, pool_size=5,):
-
-        # configure executor
-        self.pool_size = pool_size
-        self.executor = ProcessPoolExecutor(max_workers=self.pool_size)
+            worker_kwargs=None, pool_size=5, worker_reuse=False,
+            executor=None, crawler=None, body_threshold=None,
+            body_transport=None, body_view=False):
 
         # prepare worker params
         self.worker_params = {
             'worker_class': worker_class,
             'worker_kwargs': worker_kwargs or {},
         }
+        self.crawler_params = crawler.worker_params if crawler else None
+        self.body_threshold = body_threshold
+        self.body_transport = body_transport
+        self.body_view = body_view
+
+        # configure executor
+        self.pool_size = pool_size
+        self.worker_reuse = worker_reuse
+        self._reused_worker_params = None
+        # workers of downloaders sharing one pool are kept by own keys
+        self._worker_key = '%s-%s' % (os.getpid(), next(_worker_keys))
+        self.shared_executor = executor
+        if executor is not None:
+            self.pool_size = executor.get_workers_count()
+            self.executor = executor.get_executor(SharedExecutor.DOWNLOAD)
+            if self.worker_reuse:
+                executor.add_initializer(
+                    _init_download_worker, self.worker_params,
+                    self._worker_key,
+                )
+        elif self.worker_reuse:
+            try:
+                self.executor = ProcessPoolExecutor(
+                    max_workers=self.pool_size,
+                    initializer=_init_download_worker,
+                    initargs=(self.worker_params, self._worker_key),
+                )
+            except TypeError:  # pragma: no cover
+                # python < 3.7 - worker params will be passed with request
+                # and worker will be built on first request
+                self.executor = ProcessPoolExecutor(
+                    max_workers=self.pool_size,
+                )
+                self._reused_worker_params = self.worker_params
+        else:
+            self.executor = ProcessPoolExecutor(max_workers=self.pool_size)
 
         # ctrl-c support for python2.x
         # trap sigint
@@ -106,9 +428,31 @@ class ConcurrentDownloader(BaseDownloader, ConcurrentMixin):
     def process(self, crawler, request):
 
         # delegate request processing to the executor
-        future = self.executor.submit(
-            _run_download_worker, self.worker_params, request,
-        )
+        if self.crawler_params is not None:
+            job = (
+                _run_fused_worker,
+                self.crawler_params,
+                request,
+                self._reused_worker_params if self.worker_reuse
+                else self.worker_params,
+                self.worker_reuse,
+                self._worker_key,
+            )
+        elif self.worker_reuse:
+            job = (
+                _run_reused_download_worker,
+                request,
+                self._worker_key,
+                self._reused_worker_params,
+            )
+        else:
+            job = (_run_download_worker, self.worker_params, request)
+
+        if self.body_threshold is not None and self.crawler_params is None:
+            job = (
+                _run_sharing_body, self.body_threshold, self.body_transport,
+            ) + job
+        future = self.executor.submit(*job)
 
         # build Planned object
         done_future = Planned()
@@ -120,6 +464,12 @@ class ConcurrentDownloader(BaseDownloader, ConcurrentMixin):
 
         return done_future
 
+    def _get_result(self, future):
+        response = future.result()
+        if self.body_threshold is not None:
+            response = attach_body(response, view=self.body_view)
+        return response
+
     def get_workers_count(self):
         return self.pool_size
 
@@ -132,30 +482,121 @@ class ConcurrentUrllibDownloader(ConcurrentDownloader):
     :class:`pomp.contrib.SimpleDownloader`
 
     :param pool_size: pool size of ProcessPoolExecutor
-    :param timeout: request timeout in seconds
+    :param timeout: connect and read timeout in seconds
+    :param worker_reuse: reuse download worker in pool processes
+    :param connect_timeout: connect timeout in seconds
+    :param read_timeout: socket read timeout in seconds
+    :param total_timeout: deadline for the whole request in seconds
+    :param executor: instance of :class:`SharedExecutor`
+    :param crawler: instance of :class:`ConcurrentCrawler` for fused mode
+    :param body_threshold: min size of response body in bytes passed by
+                           shared memory
+    :param body_transport: shared memory transport
+    :param body_view: pass body as ``memoryview`` of shared memory
+    :param max_body_size: max size of response body in bytes
+    :param decode_content: request compressed body and decode it
     """
-    def __init__(self, pool_size=5, timeout=None):
+    def __init__(
+            self, pool_size=5, timeout=None, worker_reuse=True,
+            connect_timeout=None, read_timeout=None, total_timeout=None,
+            executor=None, crawler=None,
+            body_threshold=None, body_transport=None, body_view=False,
+            max_body_size=None, decode_content=True):
         super(ConcurrentUrllibDownloader, self).__init__(
             pool_size=pool_size,
             worker_class=UrllibDownloadWorker,
             worker_kwargs={
-                'timeout': timeout
+                'timeout': timeout,
+                'connect_timeout': connect_timeout,
+                'read_timeout': read_timeout,
+                'total_timeout': total_timeout,
+                'max_body_size': max_body_size,
+                'decode_content': decode_content,
+            },
+            worker_reuse=worker_reuse,
+            executor=executor,
+            crawler=crawler,
+            body_threshold=body_threshold,
+            body_transport=body_transport,
+            body_view=body_view,
+        )
+
+
+class ConcurrentPooledUrllibDownloader(ConcurrentDownloader):
+    """Concurrent ProcessPoolExecutor downloader over keep-alive connections
+    :class:`pomp.contrib.urllibtools.PooledUrllibDownloadWorker`
+
+    Each pool process keeps own pool of connections.
+
+    :param pool_size: pool size of ProcessPoolExecutor
+    :param timeout: connect and read timeout in seconds
+    :param pool_maxsize: max count of idle connections for each host
+                         in each pool process
+    :param idle_timeout: idle connection lifetime in seconds
+    :param connect_timeout: connect timeout in seconds
+    :param read_timeout: socket read timeout in seconds
+    :param total_timeout: deadline for the whole request in seconds
+    :param executor: instance of :class:`SharedExecutor`
+    :param crawler: instance of :class:`ConcurrentCrawler` for fused mode
+    :param body_threshold: min size of response body in bytes passed by
+                           shared memory
+    :param body_transport: shared memory transport
+    :param body_view: pass body as ``memoryview`` of shared memory
+    :param max_body_size: max size of response body in bytes
+    :param decode_content: request compressed body and decode it
+    """
+    def __init__(
+            self, pool_size=5, timeout=None, pool_maxsize=10,
+            idle_timeout=60, connect_timeout=None, read_timeout=None,
+            total_timeout=None, executor=None, crawler=None,
+            body_threshold=None, body_transport=None, body_view=False,
+            max_body_size=None, decode_content=True):
+        super(ConcurrentPooledUrllibDownloader, self).__init__(
+            pool_size=pool_size,
+            worker_class=PooledUrllibDownloadWorker,
+            worker_kwargs={
+                'timeout': timeout,
+                'connect_timeout': connect_timeout,
+                'read_timeout': read_timeout,
+                'total_timeout': total_timeout,
+                'pool_maxsize': pool_maxsize,
+                'idle_timeout': idle_timeout,
+                'max_body_size': max_body_size,
+                'decode_content': decode_content,
             },
+            worker_reuse=True,
+            executor=executor,
+            crawler=crawler,
+            body_threshold=body_threshold,
+            body_transport=body_transport,
+            body_view=body_view,
         )
 
 
 class ConcurrentCrawler(BaseCrawler, ConcurrentMixin):
     """Concurrent ProcessPoolExecutor crawler
 
+    Pass the crawler to :class:`ConcurrentDownloader` by `crawler` param
+    to parse responses in download worker processes.
+
     :param pool_size: pool size of ProcessPoolExecutor
     :param timeout: request timeout in seconds
+    :param executor: instance of :class:`SharedExecutor`, `pool_size` is
+                     ignored
     """
 
-    def __init__(self, worker_class, worker_kwargs=None, pool_size=5):
+    def __init__(
+            self, worker_class, worker_kwargs=None, pool_size=5,
+            executor=None):
 
         # configure executor
-        self.pool_size = pool_size
-        self.executor = ProcessPoolExecutor(max_workers=self.pool_size)
+        self.shared_executor = executor
+        if executor is not None:
+            self.pool_size = executor.get_workers_count()
+            self.executor = executor.get_executor(SharedExecutor.PARSE)
+        else:
+            self.pool_size = pool_size
+            self.executor = ProcessPoolExecutor(max_workers=self.pool_size)
 
         # prepare worker params
         self.worker_params = {
@@ -167,9 +608,13 @@ class ConcurrentCrawler(BaseCrawler, ConcurrentMixin):
         self.ENTRY_REQUESTS = getattr(worker_class, 'ENTRY_REQUESTS', None)
 
     def process(self, response):
+        if isinstance(response, ParsedResponse):
+            # already parsed by download worker in fused mode
+            return response.results
+
         # delegate response processing to the executor
         future = self.executor.submit(
-            _run_crawler_worker, self.worker_params, response,
+            _run_crawler_worker, self.worker_params, detach_body(response),
         )
 
         # build Planned object
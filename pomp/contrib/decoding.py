@@ -0,0 +1,169 @@
+"""
+Incremental decoding of compressed response bodies
+
+Downloaders send :attr:`ACCEPT_ENCODING` header and decode response body
+by ``Content-Encoding`` while it is read. Compressed chunk is expanded by
+parts not bigger than `chunk_size`, so size limit of the body is checked
+against decoded bytes before a decompression bomb is expanded in memory.
+
+Supported encodings: ``gzip``, ``deflate`` and ``br`` if ``brotli`` or
+``brotlicffi`` package is installed.
+"""
+import zlib
+import logging
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+
+log = logging.getLogger('pomp.contrib.decoding')
+
+
+DECODE_CHUNK_SIZE = 64 * 1024
+
+ACCEPT_ENCODING = 'gzip, deflate' + (', br' if brotli is not None else '')
+
+
+class _ZlibDecoder(object):
+
+    def __init__(self, wbits, chunk_size):
+        self.wbits = wbits
+        self.chunk_size = chunk_size
+        self._obj = zlib.decompressobj(wbits)
+        self._started = False
+
+    def _decompress(self, data):
+        output = self._obj.decompress(data, self.chunk_size)
+        if output:
+            yield output
+        # input after the end of stream is moved to `unused_data`
+        while self._obj.unconsumed_tail and not self._obj.eof:
+            output = self._obj.decompress(
+                self._obj.unconsumed_tail, self.chunk_size,
+            )
+            if output:
+                yield output
+
+    def decode(self, parts):
+        for data in parts:
+            if not self._started and data and self.wbits == zlib.MAX_WBITS:
+                self._started = True
+                try:
+                    # peek the header, some servers send raw deflate
+                    probe = zlib.decompressobj(zlib.MAX_WBITS)
+                    probe.decompress(data[:2])
+                except zlib.error:
+                    self._obj = zlib.decompressobj(-zlib.MAX_WBITS)
+            while data:
+                for output in self._decompress(data):
+                    yield output
+                data = b''
+                if self._obj.eof and self._obj.unused_data:
+                    # next member of multi member gzip
+                    data = self._obj.unused_data
+                    self._obj = zlib.decompressobj(self.wbits)
+
+    def flush(self):
+        output = self._obj.flush()
+        if output:
+            yield output
+
+
+class _BrotliDecoder(object):
+    # brotli output is not bounded by call, input is fed by small slices
+    INPUT_SLICE = 1024
+
+    def __init__(self, chunk_size):
+        self._obj = brotli.Decompressor()
+        self._process = getattr(self._obj, 'process', None) or \
+            self._obj.decompress
+
+    def decode(self, parts):
+        for data in parts:
+            for offset in range(0, len(data), self.INPUT_SLICE):
+                output = self._process(data[offset:offset + self.INPUT_SLICE])
+                if output:
+                    yield output
+
+    def flush(self):
+        return ()
+
+
+def _build_decoder(coding, chunk_size):
+    if coding in ('gzip', 'x-gzip'):
+        return _ZlibDecoder(16 + zlib.MAX_WBITS, chunk_size)
+    if coding == 'deflate':
+        return _ZlibDecoder(zlib.MAX_WBITS, chunk_size)
+    if coding == 'br' and brotli is not None:
+        return _BrotliDecoder(chunk_size)
+    return None
+
+
+class ContentDecoder(object):
+    """Decoder of response body compressed by one or more encodings
+
+    Use :func:`get_decoder` to build it by ``Content-Encoding`` header.
+
+    :param codings: list of codings in order they were applied
+    :param chunk_size: max size in bytes of decoded part
+    """
+
+    def __init__(self, codings, chunk_size=DECODE_CHUNK_SIZE):
+        self.codings = codings
+        self._decoders = [
+            _build_decoder(coding, chunk_size) for coding in reversed(codings)
+        ]
+
+    def decode(self, data):
+        """Decode next chunk of body
+
+        :rtype: iterator of decoded parts
+        """
+        parts = (data, )
+        for decoder in self._decoders:
+            parts = decoder.decode(parts)
+        return parts
+
+    def flush(self):
+        """Decode the rest of body when body is read
+
+        :rtype: iterator of decoded parts
+        """
+        parts = ()
+        for decoder in self._decoders:
+            parts = _chain(decoder.decode(parts), decoder.flush())
+        return parts
+
+
+def _chain(*iterables):
+    for iterable in iterables:
+        for value in iterable:
+            yield value
+
+
+def get_decoder(content_encoding, chunk_size=DECODE_CHUNK_SIZE):
+    """Build decoder by ``Content-Encoding`` header value
+
+    :param content_encoding: header value
+    :param chunk_size: max size in bytes of decoded part
+    :rtype: :class:`ContentDecoder` or ``None`` if body is not encoded or
+            encoding is not supported, such body is passed as is
+    """
+    if not content_encoding:
+        return None
+    codings = [
+        coding.strip().lower() for coding in content_encoding.split(',')
+        if coding.strip() and coding.strip().lower() != 'identity'
+    ]
+    if not codings:
+        return None
+    for coding in codings:
+        if _build_decoder(coding, chunk_size) is None:
+            log.warning('Unsupported content encoding: %s', content_encoding)
+            return None
+    return ContentDecoder(codings, chunk_size=chunk_size)
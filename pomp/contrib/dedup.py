@@ -0,0 +1,302 @@
+"""
+Requests deduplication
+
+:class:`DedupMiddleware` skips requests seen before by their fingerprints.
+Seen fingerprints are kept by one of storages:
+
+- :class:`SetStorage` - exact in-memory set
+- :class:`BloomFilterStorage` - compact probabilistic set with fixed
+  memory size, may skip unseen request with `error_rate` probability
+- :class:`SqliteStorage` - exact set in sqlite database on disk
+"""
+import sys
+import math
+import time
+import struct
+import hashlib
+import logging
+import sqlite3
+
+try:
+    from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+except ImportError:  # pragma: no cover
+    from urlparse import urlsplit, urlunsplit, parse_qsl
+    from urllib import urlencode
+
+from pomp.core.base import BaseMiddleware
+from pomp.core.utils import isstring
+
+
+log = logging.getLogger('pomp.contrib.dedup')
+
+
+DEFAULT_PORTS = {
+    'http': 80,
+    'https': 443,
+}
+
+
+def normalize_url(url, keep_fragment=False):
+    """Canonical form of url
+
+    Lowercase scheme and host, drop default port and fragment,
+    sort query params.
+
+    :param url: url
+    :param keep_fragment: do not drop fragment
+    :rtype: normalized url
+    """
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    netloc = (parts.hostname or '').lower()
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        netloc = '%s:%s' % (netloc, parts.port)
+    if parts.username:
+        auth = parts.username
+        if parts.password:
+            auth = '%s:%s' % (auth, parts.password)
+        netloc = '%s@%s' % (auth, netloc)
+    query = urlencode(
+        sorted(parse_qsl(parts.query, keep_blank_values=True))
+    )
+    return urlunsplit((
+        scheme,
+        netloc,
+        parts.path or '/',
+        query,
+        parts.fragment if keep_fragment else '',
+    ))
+
+
+def request_fingerprint(request, include_body=True):
+    """Fingerprint of request by normalized url, method and body
+
+    Method is taken from `method` attribute or `get_method()` of
+    ``urllib.request.Request``, body from `data` attribute.
+
+    :param request: instance of :class:`pomp.core.base.BaseRequest` or url
+                    of GET request
+    :param include_body: use request body
+    :rtype: sha1 digest bytes
+    """
+    url = request if isstring(request) else request.url
+    method = getattr(request, 'method', None)
+    if method is None and hasattr(request, 'get_method'):
+        method = request.get_method()
+
+    fingerprint = hashlib.sha1()
+    fingerprint.update((method or 'GET').upper().encode('utf-8'))
+    fingerprint.update(b' ')
+    fingerprint.update(normalize_url(url).encode('utf-8'))
+    body = getattr(request, 'data', None) if include_body else None
+    if body:
+        fingerprint.update(b' ')
+        fingerprint.update(
+            body if isinstance(body, bytes) else body.encode('utf-8')
+        )
+    return fingerprint.digest()
+
+
+class BaseSeenStorage(object):
+    """Storage of seen fingerprints interface"""
+
+    def add(self, fingerprint):
+        """Add fingerprint
+
+        :param fingerprint: fingerprint bytes
+        :rtype: ``True`` if fingerprint was not seen before
+        """
+        raise NotImplementedError()
+
+    def get_memory_usage(self):
+        """Approximate memory used by storage
+
+        :rtype: size in bytes
+        """
+        raise NotImplementedError()
+
+    def close(self):
+        """Release storage resources"""
+        pass
+
+
+class SetStorage(BaseSeenStorage):
+    """Exact in-memory set of fingerprints"""
+
+    def __init__(self):
+        self.seen = set()
+        self._items_size = 0
+
+    def add(self, fingerprint):
+        if fingerprint in self.seen:
+            return False
+        self.seen.add(fingerprint)
+        self._items_size += sys.getsizeof(fingerprint)
+        return True
+
+    def __len__(self):
+        return len(self.seen)
+
+    def get_memory_usage(self):
+        return sys.getsizeof(self.seen) + self._items_size
+
+
+class BloomFilterStorage(BaseSeenStorage):
+    """Bloom filter of fingerprints
+
+    Memory size is fixed and calculated by `capacity` and `error_rate`.
+    Not seen fingerprint is reported as seen with `error_rate` probability
+    while count of fingerprints is below `capacity`.
+
+    :param capacity: expected count of fingerprints
+    :param error_rate: false positive probability
+    """
+
+    def __init__(self, capacity=10 ** 6, error_rate=0.001):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.bits_count = int(math.ceil(
+            -capacity * math.log(error_rate) / math.log(2) ** 2
+        ))
+        self.hashes_count = max(1, int(round(
+            self.bits_count / float(capacity) * math.log(2)
+        )))
+        self.bits = bytearray((self.bits_count + 7) // 8)
+        self.count = 0
+
+    def _get_offsets(self, fingerprint):
+        if len(fingerprint) < 16:
+            fingerprint = hashlib.md5(fingerprint).digest()
+        # double hashing by two halves of fingerprint
+        h1, h2 = struct.unpack('<QQ', fingerprint[:16])
+        for i in range(self.hashes_count):
+            yield (h1 + i * h2) % self.bits_count
+
+    def add(self, fingerprint):
+        bits = self.bits
+        added = False
+        for offset in self._get_offsets(fingerprint):
+            index, mask = offset >> 3, 1 << (offset & 7)
+            if not bits[index] & mask:
+                bits[index] |= mask
+                added = True
+        if added:
+            self.count += 1
+        return added
+
+    def __len__(self):
+        return self.count
+
+    def get_memory_usage(self):
+        return sys.getsizeof(self.bits)
+
+
+class SqliteStorage(BaseSeenStorage):
+    """Exact set of fingerprints in sqlite database
+
+    Memory usage is bounded by sqlite page cache. Added fingerprints are
+    committed by `commit_every` count or `commit_interval` seconds, not
+    committed fingerprints are lost if process is killed. Engine does not
+    close middlewares - call `close` of the storage or
+    :meth:`DedupMiddleware.close` when crawling is done.
+
+    :param path: database file path, existing fingerprints are kept
+    :param cache_size: sqlite page cache size in KiB
+    :param commit_every: commit after this count of added fingerprints
+    :param commit_interval: max time in seconds between commits of added
+                            fingerprints
+    """
+
+    def __init__(
+            self, path, cache_size=2048, commit_every=1000,
+            commit_interval=1):
+        self.path = path
+        self.cache_size = cache_size
+        self.commit_every = commit_every
+        self.commit_interval = commit_interval
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute('PRAGMA cache_size = -%d' % cache_size)
+        # committed data survives process crash, not an OS crash
+        self.connection.execute('PRAGMA synchronous = OFF')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS seen '
+            '(fingerprint BLOB PRIMARY KEY) WITHOUT ROWID'
+        )
+        self.connection.commit()
+        self._uncommitted = 0
+        self._committed_at = time.time()
+
+    def add(self, fingerprint):
+        cursor = self.connection.execute(
+            'INSERT OR IGNORE INTO seen VALUES (?)',
+            (sqlite3.Binary(fingerprint), ),
+        )
+        if cursor.rowcount != 1:
+            return False
+        self._uncommitted += 1
+        if self._uncommitted >= self.commit_every or (
+                self.commit_interval is not None and
+                time.time() - self._committed_at >= self.commit_interval):
+            self.commit()
+        return True
+
+    def commit(self):
+        """Commit added fingerprints"""
+        self.connection.commit()
+        self._uncommitted = 0
+        self._committed_at = time.time()
+
+    def __len__(self):
+        return self.connection.execute(
+            'SELECT COUNT(*) FROM seen'
+        ).fetchone()[0]
+
+    def get_memory_usage(self):
+        return self.cache_size * 1024
+
+    def close(self):
+        self.commit()
+        self.connection.close()
+
+
+class DedupMiddleware(BaseMiddleware):
+    """Skip requests seen before
+
+    Request with true `dont_filter` attribute is never skipped.
+
+    :param storage: instance of :class:`BaseSeenStorage`,
+                    :class:`SetStorage` by default
+    :param fingerprint: callable to get request fingerprint bytes,
+                        :func:`request_fingerprint` by default
+    """
+
+    def __init__(self, storage=None, fingerprint=None):
+        self.storage = storage or SetStorage()
+        self.fingerprint = fingerprint or request_fingerprint
+        self.duplicates = 0
+
+    def process_request(self, request, crawler, downloader):
+        if getattr(request, 'dont_filter', False):
+            return request
+        if self.storage.add(self.fingerprint(request)):
+            return request
+        self.duplicates += 1
+        log.debug('Skip duplicate %s', request)
+        return None
+
+    def get_stats(self):
+        """Dedup stats
+
+        :rtype: dict with `seen` - count of fingerprints, `duplicates` -
+                count of skipped requests and `memory` - memory usage of
+                storage in bytes
+        """
+        return {
+            'seen': len(self.storage),
+            'duplicates': self.duplicates,
+            'memory': self.storage.get_memory_usage(),
+        }
+
+    def close(self):
+        """Close storage"""
+        self.storage.close()
@@ -0,0 +1,192 @@
+"""
+Disk-backed queue
+
+:class:`SpilloverQueue` keeps a bounded window of requests in memory and
+spills the rest to append-only segment files, so memory usage does not
+depend on the count of queued requests.
+"""
+import os
+import shutil
+import struct
+import pickle
+import logging
+import tempfile
+import threading
+from collections import deque
+
+from pomp.core.engine import SimpleQueue, StopCommand
+from pomp.core.utils import iterator
+
+
+log = logging.getLogger('pomp.contrib.diskqueue')
+
+
+_LENGTH = struct.Struct('<I')
+
+
+def _write_segment(path, requests):
+    with open(path, 'wb') as f:
+        for request in requests:
+            data = pickle.dumps(request, pickle.HIGHEST_PROTOCOL)
+            f.write(_LENGTH.pack(len(data)))
+            f.write(data)
+
+
+def _read_segment(path):
+    requests = []
+    with open(path, 'rb') as f:
+        while True:
+            header = f.read(_LENGTH.size)
+            if not header:
+                break
+            length, = _LENGTH.unpack(header)
+            requests.append(pickle.loads(f.read(length)))
+    return requests
+
+
+class SpilloverQueue(SimpleQueue):
+    """Queue with bounded memory window spilled to disk
+
+    Requests over `memory_size` are written by `segment_size` batches to
+    segment files with length prefixed pickles and are read back by whole
+    segments when memory window is drained. `get_requests` returns up to
+    `count` requests, reading as many segments as needed.
+
+    In FIFO mode new requests are kept in memory while there are no
+    spilled requests, otherwise they are buffered and written to the next
+    segment. In LIFO mode the oldest requests of memory window are
+    spilled and segments are read back from the newest one.
+
+    It is an internal queue of the engine - crawling is stopped when all
+    requests are done.
+
+    :param path: directory of segment files, temporary directory removed
+                 on :meth:`close` if not set
+    :param memory_size: max count of requests kept in memory
+    :param segment_size: count of requests in one segment file
+    :param lifo: take the latest request first
+    """
+
+    def __init__(
+            self, path=None, memory_size=10000, segment_size=1000,
+            lifo=False):
+        self.memory_size = memory_size
+        self.segment_size = min(segment_size, memory_size)
+        self.lifo = lifo
+        self._is_temporary = path is None
+        self.path = path or tempfile.mkdtemp(prefix='pomp-queue-')
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+
+        # requests ready to get
+        self._memory = deque()
+        # FIFO mode - requests put after spilled ones
+        self._tail = []
+        # paths of segment files in order they were written
+        self._segments = deque()
+        self._spilled = 0
+        self._segment_counter = 0
+        self._condition = threading.Condition()
+
+    def __len__(self):
+        return len(self._memory) + len(self._tail) + self._spilled
+
+    def get_requests(self, count=None):
+        with self._condition:
+            while not len(self):
+                self._condition.wait()
+
+            r = self._pop()
+            if not count or count <= 1 or isinstance(r, StopCommand):
+                return r
+
+            # drain up to `count` requests without blocking
+            requests = [r]
+            while len(requests) < count and len(self):
+                r = self._pop()
+                if isinstance(r, StopCommand):
+                    # leave command for the next call
+                    self._push_back(r)
+                    break
+                requests.append(r)
+            return requests
+
+    def put_requests(self, requests):
+        with self._condition:
+            for request in iterator(requests):
+                if self.lifo:
+                    self._memory.append(request)
+                    if len(self._memory) > self.memory_size:
+                        # the oldest requests go to disk
+                        self._spill([
+                            self._memory.popleft()
+                            for _ in range(self.segment_size)
+                        ])
+                elif self._segments or self._tail or \
+                        len(self._memory) >= self.memory_size:
+                    # keep order after spilled requests
+                    self._tail.append(request)
+                    if len(self._tail) >= self.segment_size:
+                        self._spill(self._tail)
+                        self._tail = []
+                else:
+                    self._memory.append(request)
+            self._condition.notify_all()
+
+    def get_stats(self):
+        """Live stats
+
+        :rtype: dict with `memory` - count of requests in memory,
+                `spilled` - count of requests on disk and `segments` -
+                count of segment files
+        """
+        return {
+            'memory': len(self._memory) + len(self._tail),
+            'spilled': self._spilled,
+            'segments': len(self._segments),
+        }
+
+    def close(self):
+        """Remove segment files"""
+        with self._condition:
+            for path in self._segments:
+                os.remove(path)
+            self._segments.clear()
+            self._spilled = 0
+            if self._is_temporary:
+                shutil.rmtree(self.path, ignore_errors=True)
+
+    def _pop(self):
+        if not self._memory:
+            self._load()
+        return self._memory.pop() if self.lifo else self._memory.popleft()
+
+    def _push_back(self, request):
+        if self.lifo:
+            self._memory.append(request)
+        else:
+            self._memory.appendleft(request)
+
+    def _spill(self, requests):
+        self._segment_counter += 1
+        path = os.path.join(
+            self.path, '%012d.segment' % self._segment_counter,
+        )
+        _write_segment(path, requests)
+        self._segments.append(path)
+        self._spilled += len(requests)
+        log.debug('Spilled %s requests to %s', len(requests), path)
+
+    def _load(self):
+        if not self._segments:
+            # FIFO mode - buffered requests are after all segments
+            self._memory.extend(self._tail)
+            self._tail = []
+            return
+        path = self._segments.pop() if self.lifo \
+            else self._segments.popleft()
+        requests = _read_segment(path)
+        os.remove(path)
+        self._spilled -= len(requests)
+        self._memory.extend(requests)
+        log.debug('Loaded %s requests from %s', len(requests), path)
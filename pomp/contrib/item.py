@@ -1,52 +1,173 @@
 """
 Item and Field
 """
-import inspect
 from collections import OrderedDict
+try:
+    from collections.abc import MutableMapping
+except ImportError:  # pragma: no cover
+    from collections import MutableMapping
 
 
-class Item(OrderedDict):
+class Field(object):
+    """Item field
+
+    Descriptor of :class:`Item` field value, fields order is the
+    order of their creation.
+    """
+    counter = 0
+
+    def __init__(self):
+        self.counter = Field.counter
+        self.name = None
+        Field.counter += 1
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        return instance[self.name]
+
+    def __set__(self, instance, value):
+        OrderedDict.__setitem__(instance, self.name, value)
+
+
+class ItemMeta(type):
+    """Collects ordered item fields once per class to `_fields`
+
+    Fields of slotted items are removed from the class namespace and
+    declared as `__slots__`.
+    """
+
+    def __new__(mcs, name, bases, namespace):
+        slotted = namespace.get('_slotted') or \
+            any(getattr(base, '_slotted', False) for base in bases)
+        declared = dict(
+            (key, value) for key, value in namespace.items()
+            if isinstance(value, Field)
+        )
+        if slotted:
+            inherited = set()
+            for base in bases:
+                inherited.update(getattr(base, '_fields', ()))
+            for key in declared:
+                del namespace[key]
+            namespace['__slots__'] = tuple(
+                key for key in sorted(declared) if key not in inherited
+            ) + tuple(namespace.get('__slots__', ()))
+        namespace['_declared_fields'] = declared
+
+        cls = super(ItemMeta, mcs).__new__(mcs, name, bases, namespace)
+
+        # resolve fields by MRO like attributes lookup does
+        members = {}
+        for klass in reversed(cls.__mro__):
+            members.update(vars(klass))
+            members.update(vars(klass).get('_declared_fields', {}))
+        fields = sorted(
+            (value.counter, key) for key, value in members.items()
+            if isinstance(value, Field)
+        )
+        cls._fields = tuple(key for _, key in fields)
+        for key in declared:
+            declared[key].name = key
+        return cls
+
+
+class Item(ItemMeta('_ItemBase', (OrderedDict, ), {})):
     """OrderedDict subclass"""
 
     def __init__(self, *args, **kwargs):
         # Initialize empty ordered dict
-        super(Item, self).__init__(self)
+        super(Item, self).__init__()
 
         # Populate ordered dict
-        _args = list(args[:])
-        _args.reverse()
-        fields_by_creation_counter = {}
-        for field, obj in inspect.getmembers(self.__class__):
-            if isinstance(obj, Field):
-                fields_by_creation_counter[obj.counter] = field
+        fields = self._fields
+        if len(args) < len(fields):
+            args = args + tuple(
+                kwargs.get(field) for field in fields[len(args):]
+            )
+        OrderedDict.update(self, zip(fields, args))
 
-        for key in sorted(fields_by_creation_counter):
-            field = fields_by_creation_counter[key]
-            value = _args.pop() if _args else kwargs.get(field, None)
-            super(Item, self).__setitem__(field, value)
+    # determine pickling
+    def __reduce__(self):
+        return (self.__class__, tuple(self.values()), )
 
-    def __setattr__(self, key, value):
-        if key in self:
-            super(Item, self).__setitem__(key, value)
-        super(Item, self).__setattr__(key, value)
 
-    def __getattribute__(self, key):
-        value = super(Item, self).__getattribute__(key)
+class SlottedItem(ItemMeta('_SlottedItemBase', (object, ), {
+        '__slots__': (), '_slotted': True})):
+    """Compact item without instance dict
 
-        # if attribute is a item field return it`s value, not a Field object
-        if isinstance(value, Field):
-            return self[key]
+    Field values are stored in `__slots__`, item has dict-like interface of
+    :class:`Item` with fixed set of keys and pickled as tuple of values.
+    Use it when millions of items are created.
+    """
+    __slots__ = ()
 
-        return value
+    def __init__(self, *args, **kwargs):
+        fields = self._fields
+        if len(args) < len(fields):
+            args = args + tuple(
+                kwargs.get(field) for field in fields[len(args):]
+            )
+        for field, value in zip(fields, args):
+            object.__setattr__(self, field, value)
+
+    def __getitem__(self, key):
+        if key not in self._fields:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key not in self._fields:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __delitem__(self, key):
+        raise TypeError('item fields can not be deleted')
+
+    def __iter__(self):
+        return iter(self._fields)
+
+    def __len__(self):
+        return len(self._fields)
+
+    def __contains__(self, key):
+        return key in self._fields
+
+    def keys(self):
+        return list(self._fields)
+
+    def values(self):
+        return [getattr(self, field) for field in self._fields]
+
+    def items(self):
+        return [(field, getattr(self, field)) for field in self._fields]
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in self._fields else default
+
+    def __eq__(self, other):
+        if isinstance(other, SlottedItem):
+            return self._fields == other._fields \
+                and self.values() == other.values()
+        if isinstance(other, dict):
+            return dict(self.items()) == other
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    __hash__ = None
+
+    def __repr__(self):
+        return '%s(%s)' % (
+            self.__class__.__name__,
+            ', '.join('%s=%r' % item for item in self.items()),
+        )
 
     # determine pickling
     def __reduce__(self):
         return (self.__class__, tuple(self.values()), )
 
 
-class Field(object):
-    counter = 0
-
-    def __init__(self):
-        self.counter = Field.counter
-        Field.counter += 1
+MutableMapping.register(SlottedItem)
@@ -0,0 +1,264 @@
+"""
+Journal of crawl state
+
+:class:`Journal` is a write-ahead log of requests put to the queue and
+requests done by the engine. Requests of interrupted crawl which were
+queued or in flight are replayed by the engine on the next
+:meth:`pomp.core.engine.Pomp.pump` call instead of ``ENTRY_REQUESTS``::
+
+    journal = Journal('crawl.journal')
+    pomp = Pomp(downloader=UrllibDownloader(), journal=journal)
+    pomp.pump(Crawler())
+    journal.close()
+"""
+import os
+import struct
+import pickle
+import logging
+import threading
+
+from pomp.contrib.dedup import request_fingerprint
+
+
+log = logging.getLogger('pomp.contrib.journal')
+
+
+_HEADER = struct.Struct('<cI')
+_KEY_LENGTH = struct.Struct('<H')
+PUT = b'p'
+DONE = b'd'
+
+
+def _pack(kind, payload):
+    return _HEADER.pack(kind, len(payload)) + payload
+
+
+def _pack_put(key, request):
+    # key is read without unpickling of request
+    return _pack(PUT, b''.join((
+        _KEY_LENGTH.pack(len(key)), key,
+        pickle.dumps(request, pickle.HIGHEST_PROTOCOL),
+    )))
+
+
+def _get_put_key(payload):
+    length, = _KEY_LENGTH.unpack_from(payload)
+    return payload[_KEY_LENGTH.size:_KEY_LENGTH.size + length]
+
+
+def _get_put_request(payload):
+    length, = _KEY_LENGTH.unpack_from(payload)
+    return pickle.loads(payload[_KEY_LENGTH.size + length:])
+
+
+def _read_records(f):
+    # yield (kind, payload, end offset), stop on truncated tail of log
+    offset = 0
+    while True:
+        header = f.read(_HEADER.size)
+        if len(header) < _HEADER.size:
+            return
+        kind, length = _HEADER.unpack(header)
+        payload = f.read(length)
+        if len(payload) < length or kind not in (PUT, DONE):
+            return
+        offset += _HEADER.size + length
+        yield kind, payload, offset
+
+
+class Journal(object):
+    """Write-ahead log of queued and done requests
+
+    Each put request is logged with its key - fingerprint of the request,
+    each done request is logged by the key. Request is pending while
+    count of its puts is more than count of dones, so the same request
+    put twice, for example by retry, is pending until it is done twice.
+
+    Engine gets key of done request from request of response after
+    middlewares, middlewares should not change url, method and body of
+    requests taken from the queue.
+
+    Log is appended by every call and flushed to OS, so it survives crash
+    of the process, `fsync` makes it durable to crash of OS. Log is
+    compacted when count of done records reaches `compact_threshold` -
+    it is rewritten with put records of pending requests only.
+
+    :param path: path of log file
+    :param fingerprint: callable to get request key bytes,
+                        :func:`pomp.contrib.dedup.request_fingerprint`
+                        by default
+    :param compact_threshold: count of done records to compact log
+    :param fsync: call ``os.fsync`` after every write
+    """
+
+    def __init__(
+            self, path, fingerprint=None, compact_threshold=10000,
+            fsync=False):
+        self.path = path
+        self.fingerprint = fingerprint or request_fingerprint
+        self.compact_threshold = compact_threshold
+        self.fsync = fsync
+        self.compactions = 0
+
+        # key -> count of pending puts
+        self._pending = {}
+        self._pending_count = 0
+        self._done_records = 0
+        self._lock = threading.Lock()
+        self._file = None
+
+    def replay(self):
+        """Read log and open it for writing
+
+        Called by engine once before crawling.
+
+        :rtype: list of pending requests of interrupted crawl
+        """
+        with self._lock:
+            if self._file is not None:
+                # the next crawl by the same journal
+                self._file.flush()
+            requests, size = self._read()
+            if self._file is None:
+                if os.path.exists(self.path) and \
+                        os.path.getsize(self.path) > size:
+                    log.warning('Truncate broken tail of %s', self.path)
+                    with open(self.path, 'r+b') as f:
+                        f.truncate(size)
+                self._file = open(self.path, 'ab')
+            if requests:
+                log.info(
+                    'Replay %s pending requests of %s',
+                    len(requests), self.path,
+                )
+            return requests
+
+    def put(self, requests):
+        """Log requests put to the queue
+
+        :param requests: list of requests
+        """
+        chunks = []
+        with self._lock:
+            self._ensure_open()
+            for request in requests:
+                key = self.fingerprint(request)
+                chunks.append(_pack_put(key, request))
+                self._pending[key] = self._pending.get(key, 0) + 1
+                self._pending_count += 1
+            self._write(b''.join(chunks))
+
+    def done(self, request):
+        """Log request done by engine
+
+        :param request: request taken from the queue
+        """
+        key = self.fingerprint(request)
+        with self._lock:
+            count = self._pending.get(key)
+            if not count:
+                log.warning('Done request is not journaled: %s', request)
+                return
+            self._ensure_open()
+            self._write(_pack(DONE, key))
+            if count > 1:
+                self._pending[key] = count - 1
+            else:
+                del self._pending[key]
+            self._pending_count -= 1
+            self._done_records += 1
+            if self._done_records >= self.compact_threshold:
+                self._compact()
+
+    def compact(self):
+        """Rewrite log with pending requests only"""
+        with self._lock:
+            self._ensure_open()
+            self._compact()
+
+    def get_stats(self):
+        """Live stats
+
+        :rtype: dict with `pending` - count of pending requests,
+                `done_records` - count of done records in log and
+                `compactions` - count of log compactions
+        """
+        return {
+            'pending': self._pending_count,
+            'done_records': self._done_records,
+            'compactions': self.compactions,
+        }
+
+    def close(self):
+        """Compact and close log"""
+        with self._lock:
+            if self._file is None:
+                return
+            self._compact()
+            self._file.close()
+            self._file = None
+
+    def _ensure_open(self):
+        if self._file is None:
+            raise RuntimeError('Journal is not replayed: %s' % self.path)
+
+    def _write(self, data):
+        self._file.write(data)
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+    def _read(self):
+        # restore pending counts by the first pass, collect pending requests
+        # by the second one
+        self._pending = {}
+        size = 0
+        if not os.path.exists(self.path):
+            return [], size
+        with open(self.path, 'rb') as f:
+            for kind, payload, size in _read_records(f):
+                if kind == PUT:
+                    key = _get_put_key(payload)
+                    self._pending[key] = self._pending.get(key, 0) + 1
+                    continue
+                count = self._pending.get(payload, 0)
+                if count > 1:
+                    self._pending[payload] = count - 1
+                elif count:
+                    del self._pending[payload]
+        remaining = dict(self._pending)
+        requests = []
+        with open(self.path, 'rb') as f:
+            for kind, payload, _ in _read_records(f):
+                if kind != PUT:
+                    continue
+                key = _get_put_key(payload)
+                # keep the first puts of each pending key
+                if remaining.get(key):
+                    remaining[key] -= 1
+                    requests.append(_get_put_request(payload))
+        self._pending_count = len(requests)
+        return requests, size
+
+    def _compact(self):
+        # stream old log to the new one with pending puts only, pending
+        # requests are not kept in memory
+        remaining = dict(self._pending)
+        tmp_path = self.path + '.compact'
+        self._file.flush()
+        with open(self.path, 'rb') as source, open(tmp_path, 'wb') as f:
+            for kind, payload, _ in _read_records(source):
+                if kind != PUT:
+                    continue
+                key = _get_put_key(payload)
+                if remaining.get(key):
+                    remaining[key] -= 1
+                    f.write(_pack(PUT, payload))
+            f.flush()
+            os.fsync(f.fileno())
+        self._file.close()
+        os.rename(tmp_path, self.path)
+        self._file = open(self.path, 'ab')
+        self._done_records = 0
+        self.compactions += 1
+        log.debug('Compacted %s, pending: %s', self.path, self._pending_count)
@@ -2,7 +2,9 @@
 """
 Simple pipelines
 """
+import io
 import csv
+import time
 import codecs
 
 try:
@@ -40,7 +42,7 @@ class UnicodeCsvWriter:
         # empty queue
         self.queue.truncate(0)
 
-    def writerows(self, rows):  # pragma: no cover
+    def writerows(self, rows):
         for row in rows:
             self.writerow(row)
 
@@ -55,13 +57,29 @@ class CsvPipeline(BasePipeline):
 
     Params `*args` and `**kwargs` passed to ``csv.writer`` constuctor.
 
+    In batched mode rows are accumulated and written by ``writerows`` when
+    `batch_size` rows are collected or `flush_interval` seconds passed
+    since the last write, output file is opened in binary mode with
+    `buffer_size` buffer. Row is a snapshot of item values in order of item
+    fields, so item may be changed by the next pipelines.
+
     :param output_file: Filename of file-like object or a file object. If
                         `output_file` is a file-like object, then the file will
                         remain open after the pipe is stopped.
+    :param batch_size: count of rows written at once, enables batched mode
+    :param flush_interval: max time in seconds between writes of collected
+                           rows, enables batched mode
+    :param buffer_size: buffer size of the output file in batched mode
+    :param encoding: output file encoding in batched mode
     """
 
     def __init__(self, output_file, *args, **kwargs):
         self.output_file = output_file
+        self.batch_size = kwargs.pop('batch_size', None)
+        self.flush_interval = kwargs.pop('flush_interval', None)
+        self.buffer_size = kwargs.pop('buffer_size', 256 * 1024)
+        self.encoding = kwargs.pop('encoding', 'utf-8')
+        self.batched = bool(self.batch_size or self.flush_interval)
         self._csv_args = args
         self._csv_kwargs = kwargs
 
@@ -69,6 +87,9 @@ class CsvPipeline(BasePipeline):
         self._need_close = False
 
     def start(self, crawler):
+        if self.batched:
+            return self._start_batched()
+
         if isstring(self.output_file):
             if PY3:
                 self.csvfile = codecs.open(
@@ -89,10 +110,67 @@ class CsvPipeline(BasePipeline):
                 self.csvfile, *self._csv_args, **self._csv_kwargs
             )
 
+    def _start_batched(self):
+        if isstring(self.output_file):
+            self.csvfile = io.open(
+                self.output_file, 'wb', buffering=self.buffer_size,
+            )
+            self._need_close = True
+        else:
+            self.csvfile = self.output_file
+        self._binary = isinstance(
+            self.csvfile, (io.RawIOBase, io.BufferedIOBase),
+        )
+
+        self._rows = []
+        self._flushed_at = time.time()
+        if PY3:
+            # serialize batch to the string and write it by one call
+            self._batch = StringIO()
+            self.writer = csv.writer(
+                self._batch, *self._csv_args, **self._csv_kwargs
+            )
+        else:
+            self.writer = UnicodeCsvWriter(
+                self.csvfile, *self._csv_args,
+                encoding=self.encoding, **self._csv_kwargs
+            )
+
     def process(self, crawler, item):
-        self.writer.writerow(item.values())
+        if not self.batched:
+            self.writer.writerow(item.values())
+            return item
+
+        fields = getattr(item, '_fields', None)
+        if fields is None:
+            self._rows.append(tuple(item.values()))
+        else:
+            # keys of item may be deleted or added by previous pipelines
+            self._rows.append(tuple(item.get(field) for field in fields))
+        if (self.batch_size and len(self._rows) >= self.batch_size) or \
+                (self.flush_interval and
+                 time.time() - self._flushed_at >= self.flush_interval):
+            self.flush()
         return item
 
+    def flush(self):
+        """Write collected rows in batched mode"""
+        rows, self._rows = self._rows, []
+        self._flushed_at = time.time()
+        if not rows:
+            return
+        self.writer.writerows(rows)
+        if PY3:
+            data = self._batch.getvalue()
+            self._batch.seek(0)
+            self._batch.truncate()
+            self.csvfile.write(
+                data.encode(self.encoding) if self._binary else data
+            )
+
     def stop(self, crawler):
+        if self.batched:
+            self.flush()
+            self.csvfile.flush()
         if self._need_close:
             self.csvfile.close()
@@ -0,0 +1,514 @@
+"""
+Distributed queue
+
+:class:`QueueServer` keeps one frontier of requests shared by many crawling
+processes on many hosts, :class:`QueueClient` is the queue of the engine
+connected to the server::
+
+    # frontier host
+    server = QueueServer(host='0.0.0.0', port=9999)
+    server.serve_forever()
+
+    # worker hosts
+    queue = QueueClient(('frontier', 9999))
+    pomp = Pomp(downloader=UrllibDownloader(), queue=queue)
+    pomp.pump(Crawler())
+
+Requests are leased to clients - the leased request is redelivered to the
+next client when it is not done by the engine during visibility timeout,
+for example when the worker process is crashed. Requests are delivered at
+least once.
+
+.. note::
+
+    Requests are pickled by clients, use the server in trusted network
+    only. The server itself does not unpickle requests.
+"""
+import json
+import time
+import heapq
+import pickle
+import socket
+import struct
+import logging
+import itertools
+import threading
+from collections import deque
+
+try:
+    import SocketServer as socketserver
+except ImportError:
+    import socketserver
+
+from pomp.core.base import BaseQueue, BaseCommand
+from pomp.core.engine import StopCommand
+from pomp.core.utils import iterator
+from pomp.contrib.dedup import request_fingerprint
+
+
+log = logging.getLogger('pomp.contrib.queueserver')
+
+
+# message is command and length of body
+_HEADER = struct.Struct('<cI')
+_LENGTH = struct.Struct('<I')
+_LEASE = struct.Struct('<Q')
+# count of requests and timeout of long poll
+_GET = struct.Struct('<Id')
+# flags of items reply
+_FLAGS = struct.Struct('<B')
+DRAINED = 1
+
+PUT = b'p'
+GET = b'g'
+ACK = b'a'
+STATS = b's'
+OK = b'o'
+ITEMS = b'i'
+
+
+def _recv_exactly(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 16))
+        if not chunk:
+            if chunks:
+                raise socket.error('Connection closed in message')
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def _recv(sock):
+    # (command, body) or None on closed connection
+    header = _recv_exactly(sock, _HEADER.size)
+    if header is None:
+        return None
+    command, length = _HEADER.unpack(header)
+    body = _recv_exactly(sock, length) if length else b''
+    if body is None:
+        raise socket.error('Connection closed in message')
+    return command, body
+
+
+def _send(sock, command, body=b''):
+    sock.sendall(_HEADER.pack(command, len(body)) + body)
+
+
+def _pack_payloads(payloads):
+    return b''.join(_LENGTH.pack(len(p)) + p for p in payloads)
+
+
+def _unpack_payloads(body, offset=0):
+    payloads = []
+    while offset < len(body):
+        length, = _LENGTH.unpack_from(body, offset)
+        offset += _LENGTH.size
+        payloads.append(body[offset:offset + length])
+        offset += length
+    return payloads
+
+
+def _pack_items(items, drained):
+    return _FLAGS.pack(DRAINED if drained else 0) + b''.join(
+        _LEASE.pack(lease) + _LENGTH.pack(len(payload)) + payload
+        for lease, payload in items
+    )
+
+
+def _unpack_items(body):
+    flags, = _FLAGS.unpack_from(body)
+    offset = _FLAGS.size
+    items = []
+    while offset < len(body):
+        lease, = _LEASE.unpack_from(body, offset)
+        offset += _LEASE.size
+        length, = _LENGTH.unpack_from(body, offset)
+        offset += _LENGTH.size
+        items.append((lease, body[offset:offset + length]))
+        offset += length
+    return items, bool(flags & DRAINED)
+
+
+class _Handler(socketserver.BaseRequestHandler):
+
+    def handle(self):
+        queue = self.server.queue
+        while True:
+            try:
+                message = _recv(self.request)
+                if message is None:
+                    return
+                command, body = message
+                if command == PUT:
+                    queue.put(_unpack_payloads(body))
+                    _send(self.request, OK)
+                elif command == GET:
+                    count, timeout = _GET.unpack(body)
+                    items, drained = queue.get(count, timeout)
+                    _send(self.request, ITEMS, _pack_items(items, drained))
+                elif command == ACK:
+                    queue.ack([
+                        _LEASE.unpack_from(body, offset)[0]
+                        for offset in range(0, len(body), _LEASE.size)
+                    ])
+                    _send(self.request, OK)
+                elif command == STATS:
+                    _send(
+                        self.request, STATS,
+                        json.dumps(queue.get_stats()).encode('utf-8'),
+                    )
+                else:
+                    log.warning(
+                        'Unknown command %r from %s',
+                        command, self.client_address,
+                    )
+                    return
+            except (socket.error, struct.error) as e:
+                log.warning('Connection %s: %s', self.client_address, e)
+                return
+
+
+class _TCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+    # do not wait for connections of clients on close
+    block_on_close = False
+
+
+class QueueServer(object):
+    """TCP server of requests queue
+
+    Server keeps pickled requests as they are put by clients, in FIFO
+    order. Get of client blocks up to the timeout of long poll until any
+    request is ready and returns up to `count` requests, each one is leased
+    to the client until it is acknowledged or `visibility_timeout` is
+    passed. Expired leases are returned to the head of the queue.
+
+    :param host: host to listen
+    :param port: port to listen, 0 - any free port, see :attr:`address`
+    :param visibility_timeout: seconds to wait acknowledge of leased
+                               request before its redelivery
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, visibility_timeout=300):
+        self.visibility_timeout = visibility_timeout
+        self.put_count = 0
+        self.acked = 0
+        self.redelivered = 0
+
+        # pickled requests ready to get
+        self._ready = deque()
+        # lease -> (pickled request, deadline)
+        self._leases = {}
+        # heap of (deadline, lease), acknowledged leases are skipped
+        self._deadlines = []
+        self._lease_ids = itertools.count(1)
+        self._condition = threading.Condition()
+        self._closed = False
+        self._serving = False
+        self._thread = None
+
+        self._server = _TCPServer((host, port), _Handler)
+        self._server.queue = self
+
+    @property
+    def address(self):
+        """(host, port) of listening socket"""
+        return self._server.server_address[:2]
+
+    def serve_forever(self):
+        """Serve clients until :meth:`stop`"""
+        log.info('Serve queue on %s:%s', *self.address)
+        self._serving = True
+        self._server.serve_forever()
+
+    def start(self):
+        """Serve clients by the daemon thread"""
+        self._thread = threading.Thread(
+            target=self.serve_forever, name='pomp-queue-server',
+        )
+        self._thread.daemon = True
+        self._serving = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop serving and wake up waiting clients"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        if self._serving:
+            self._server.shutdown()
+            self._serving = False
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def put(self, payloads):
+        """Put pickled requests
+
+        :param payloads: list of pickled requests
+        """
+        with self._condition:
+            self._ready.extend(payloads)
+            self.put_count += len(payloads)
+            self._condition.notify_all()
+
+    def get(self, count, timeout):
+        """Lease ready requests
+
+        :param count: max count of requests
+        :param timeout: seconds to wait for the first request
+        :rtype: tuple of list of (lease, pickled request) and drained flag -
+                there are no ready and leased requests
+        """
+        deadline = time.time() + timeout
+        with self._condition:
+            while True:
+                now = time.time()
+                self._expire(now)
+                if self._ready or self._closed or now >= deadline:
+                    break
+                wait = deadline - now
+                if self._deadlines:
+                    # wake up to redeliver the expired lease
+                    wait = min(wait, self._deadlines[0][0] - now)
+                self._condition.wait(max(wait, 0.001))
+
+            items = []
+            expires = time.time() + self.visibility_timeout
+            while self._ready and len(items) < max(count, 1):
+                payload = self._ready.popleft()
+                lease = next(self._lease_ids)
+                self._leases[lease] = (payload, expires)
+                heapq.heappush(self._deadlines, (expires, lease))
+                items.append((lease, payload))
+            return items, not self._ready and not self._leases
+
+    def ack(self, leases):
+        """Acknowledge leased requests, expired leases are ignored
+
+        :param leases: list of leases
+        """
+        with self._condition:
+            for lease in leases:
+                if self._leases.pop(lease, None) is not None:
+                    self.acked += 1
+            if not self._leases:
+                self._deadlines = []
+            # drained state may be waited
+            self._condition.notify_all()
+
+    def get_stats(self):
+        """Live stats
+
+        :rtype: dict with `ready` - count of requests ready to get,
+                `leased` - count of leased requests, `put` - count of put
+                requests, `acked` - count of acknowledged requests and
+                `redelivered` - count of expired leases
+        """
+        with self._condition:
+            self._expire(time.time())
+            return {
+                'ready': len(self._ready),
+                'leased': len(self._leases),
+                'put': self.put_count,
+                'acked': self.acked,
+                'redelivered': self.redelivered,
+            }
+
+    def _expire(self, now):
+        while self._deadlines and self._deadlines[0][0] <= now:
+            _, lease = heapq.heappop(self._deadlines)
+            item = self._leases.pop(lease, None)
+            if item is None:
+                continue
+            log.info('Lease %s is expired, redeliver request', lease)
+            self._ready.appendleft(item[0])
+            self.redelivered += 1
+
+
+class _Connection(object):
+
+    def __init__(self, address, timeout):
+        self.address = address
+        self.timeout = timeout
+        self._sock = None
+
+    def call(self, command, body=b'', timeout=None):
+        # reconnect once on broken connection, so message may be delivered
+        # twice
+        for attempt in range(2):
+            try:
+                if self._sock is None:
+                    self._sock = socket.create_connection(
+                        self.address, self.timeout,
+                    )
+                self._sock.settimeout(timeout or self.timeout)
+                _send(self._sock, command, body)
+                reply = _recv(self._sock)
+                if reply is None:
+                    raise socket.error('Connection closed by server')
+                return reply
+            except socket.error as e:
+                self.close()
+                if attempt:
+                    raise
+                log.warning('Reconnect to %s on %s', self.address, e)
+
+    def close(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+
+class QueueClient(BaseQueue):
+    """Queue of engine connected to :class:`QueueServer`
+
+    Follow-up requests are put to the server by one message. Requests are
+    got by long poll - the server holds get up to `poll_timeout` and
+    returns as soon as any request is ready, up to `count` requests of
+    the engine.
+
+    Each got request is acknowledged when engine is done with it. Engine
+    gives back request after request middlewares, so client finds lease by
+    the fingerprint of request - middlewares should not change url, method
+    and body of requests. Acknowledge of request which is returned to the
+    queue later, like request retried with backoff by
+    :class:`pomp.contrib.retry.RetryMiddleware`, is deferred until it is
+    put again, so the server does not see frontier drained meanwhile.
+
+    Engine does not stop on the external queue. With `stop_when_drained`
+    client returns :class:`pomp.core.engine.StopCommand` when the server
+    has no ready and leased requests - entry requests must be put before
+    workers are started or by the worker itself.
+
+    Client is not for :class:`pomp.contrib.asynciotools.AioPomp`, calls of
+    it block the event loop.
+
+    :param address: (host, port) of the server
+    :param poll_timeout: seconds of the one long poll
+    :param timeout: seconds of connect and other socket operations
+    :param fingerprint: callable to get request key,
+                        :func:`pomp.contrib.dedup.request_fingerprint`
+                        by default
+    :param stop_when_drained: stop engine when frontier is drained
+    """
+
+    def __init__(
+            self, address, poll_timeout=10, timeout=30, fingerprint=None,
+            stop_when_drained=False):
+        self.address = tuple(address)
+        self.poll_timeout = poll_timeout
+        self.timeout = timeout
+        self.fingerprint = fingerprint or request_fingerprint
+        self.stop_when_drained = stop_when_drained
+
+        # long poll is made by engine loop, so it does not block put of
+        # follow-up requests and acknowledges by other threads
+        self._poll_connection = _Connection(self.address, timeout)
+        self._connection = _Connection(self.address, timeout)
+        self._lock = threading.Lock()
+        # key -> list of leases of got requests
+        self._leases = {}
+        # key -> list of leases acknowledged by the next put
+        self._deferred = {}
+        self._stopped = False
+
+    def get_requests(self, count=None):
+        while not self._stopped:
+            command, body = self._poll_connection.call(
+                GET, _GET.pack(count or 1, self.poll_timeout),
+                timeout=self.poll_timeout + self.timeout,
+            )
+            items, drained = _unpack_items(body)
+            if items:
+                requests = self._lease(items)
+                if not count or count <= 1:
+                    return requests[0]
+                return requests
+            if drained and self.stop_when_drained:
+                log.info('Queue %s:%s is drained', *self.address)
+                break
+        self._stopped = False
+        return StopCommand()
+
+    def put_requests(self, requests):
+        payloads = []
+        keys = []
+        for request in iterator(requests):
+            if isinstance(request, BaseCommand):
+                # commands are not shared with other workers
+                self._stopped = True
+                continue
+            payloads.append(pickle.dumps(request, pickle.HIGHEST_PROTOCOL))
+            if self._deferred:
+                keys.append(self.fingerprint(request))
+        if not payloads:
+            return
+        with self._lock:
+            self._connection.call(PUT, _pack_payloads(payloads))
+            deferred = [
+                self._pop_lease(self._deferred, key)
+                for key in keys if key in self._deferred
+            ]
+            if deferred:
+                self._ack(deferred)
+
+    def done_request(self, request):
+        key = self.fingerprint(request)
+        with self._lock:
+            lease = self._pop_lease(self._leases, key)
+            if lease is None:
+                log.warning('Done request is not leased: %s', request)
+                return
+            not_before = getattr(request, 'not_before', None)
+            if not_before is not None and not_before > time.time():
+                # request will be put again after its delay
+                self._deferred.setdefault(key, []).append(lease)
+                return
+            self._ack([lease])
+
+    def get_stats(self):
+        """Live stats of the server
+
+        :rtype: dict of :meth:`QueueServer.get_stats`
+        """
+        with self._lock:
+            _, body = self._connection.call(STATS)
+        return json.loads(body.decode('utf-8'))
+
+    def close(self):
+        """Close connections, not acknowledged requests are redelivered
+        after visibility timeout"""
+        self._poll_connection.close()
+        with self._lock:
+            self._connection.close()
+
+    def _lease(self, items):
+        requests = []
+        with self._lock:
+            for lease, payload in items:
+                request = pickle.loads(payload)
+                self._leases.setdefault(
+                    self.fingerprint(request), [],
+                ).append(lease)
+                requests.append(request)
+        return requests
+
+    def _ack(self, leases):
+        self._connection.call(
+            ACK, b''.join(_LEASE.pack(lease) for lease in leases),
+        )
+
+    def _pop_lease(self, leases, key):
+        keyed = leases.get(key)
+        if not keyed:
+            return None
+        # the latest lease of redelivered request is the live one
+        lease = keyed.pop()
+        if not keyed:
+            del leases[key]
+        return lease
@@ -0,0 +1,149 @@
+"""
+Retry of failed requests
+
+:class:`RetryMiddleware` returns failed request back to the engine with
+`not_before` timestamp of exponential backoff. Engine holds the request
+by timer and puts it to the queue when backoff is passed, waiting request
+does not hold in-flight slots of the scheduler.
+"""
+import time
+import random
+import logging
+
+from pomp.core.base import (
+    BaseMiddleware, BaseCrawlException, BodySizeCrawlException,
+)
+
+
+log = logging.getLogger('pomp.contrib.retry')
+
+
+RETRY_STATUSES = (408, 429, 500, 502, 503, 504)
+
+
+class RetryMiddleware(BaseMiddleware):
+    """Retry failed requests with exponential backoff and jitter
+
+    Request is retried when download is failed without response (connection
+    errors, timeouts) and when response status is in `statuses`. Backoff
+    before retry ``n`` (from zero) is ``backoff * factor ** n`` but not
+    more than `max_backoff`, random part of it up to `jitter` fraction is
+    dropped, so retries of many requests failed at once are spread in time.
+    ``Retry-After`` header in seconds is honored up to `max_backoff`.
+
+    Attempts are counted by `retries` attribute of request, `max_retries`
+    attribute of request overrides the budget. Retried request has
+    `not_before` timestamp and true `dont_filter` attribute to pass
+    :class:`pomp.contrib.dedup.DedupMiddleware`.
+
+    Response middlewares are called in reverse order, put this middleware
+    after middlewares which should not see retried failures.
+
+    :param max_retries: max count of retries of one request
+    :param backoff: delay in seconds before the first retry
+    :param factor: multiplier of delay for each next retry
+    :param max_backoff: max delay in seconds
+    :param jitter: max dropped fraction of delay from 0 to 1
+    :param statuses: http statuses of retried responses
+    """
+
+    def __init__(
+            self, max_retries=3, backoff=1.0, factor=2.0, max_backoff=60,
+            jitter=0.5, statuses=RETRY_STATUSES):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.factor = factor
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.statuses = statuses
+        self.retried = 0
+        self.given_up = 0
+
+    def process_response(self, response, crawler, downloader):
+        status = getattr(response, 'status', None)
+        if status not in self.statuses:
+            return response
+        return self._retry(
+            response.get_request(), response,
+            getattr(response, 'headers', None),
+        ) or response
+
+    def process_exception(self, exception, crawler, downloader):
+        if not self.is_retryable(exception):
+            return exception
+        headers = getattr(exception.response, 'headers', None) or \
+            getattr(exception.exception, 'headers', None)
+        return self._retry(exception.request, exception, headers) or \
+            exception
+
+    def is_retryable(self, exception):
+        """Exception is retried
+
+        :param exception: instance of
+                          :class:`pomp.core.base.BaseCrawlException`
+        :rtype: ``True`` if request should be retried
+        """
+        if not isinstance(exception, BaseCrawlException) or \
+                exception.request is None or \
+                isinstance(exception, BodySizeCrawlException):
+            return False
+        status = getattr(exception.response, 'status', None) or \
+            getattr(exception.exception, 'code', None)
+        if status is not None:
+            return status in self.statuses
+        # exceptions of crawler and pipelines have response
+        return exception.response is None
+
+    def get_backoff(self, retries, retry_after=None):
+        """Delay before retry
+
+        :param retries: count of done retries
+        :param retry_after: delay in seconds requested by server
+        :rtype: delay in seconds
+        """
+        delay = min(self.max_backoff, self.backoff * self.factor ** retries)
+        delay -= delay * self.jitter * random.random()
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_backoff))
+        return delay
+
+    def get_stats(self):
+        """Live stats
+
+        :rtype: dict with `retried` - count of retries and `given_up` -
+                count of requests failed after all retries
+        """
+        return {
+            'retried': self.retried,
+            'given_up': self.given_up,
+        }
+
+    def _retry(self, request, failure, headers):
+        if request is None:
+            return None
+        retries = getattr(request, 'retries', 0)
+        max_retries = getattr(request, 'max_retries', None)
+        if max_retries is None:
+            max_retries = self.max_retries
+        if retries >= max_retries:
+            log.debug('Give up %s after %s retries: %s', request, retries,
+                      failure)
+            self.given_up += 1
+            return None
+        delay = self.get_backoff(retries, _get_retry_after(headers))
+        log.debug('Retry %s in %.2fs: %s', request, delay, failure)
+        request.retries = retries + 1
+        request.not_before = time.time() + delay
+        request.dont_filter = True
+        self.retried += 1
+        return request
+
+
+def _get_retry_after(headers):
+    # headers of urllib and asyncio responses are ``HTTPMessage``
+    value = headers.get('Retry-After') if headers is not None else None
+    try:
+        return max(0, int(value)) if value is not None else None
+    except (TypeError, ValueError):
+        # http date is not supported
+        return None
@@ -0,0 +1,210 @@
+"""
+Shared memory transport of response bodies
+
+Pool worker process puts response body bigger than threshold to shared
+memory segment or to memory-mapped temporary file and passes back only
+:class:`SharedBodyHandle` with pickled response. Engine process maps the
+segment and copies it to `body` bytes, so body is not pickled through the
+result pipe.
+
+With `view` option of :func:`attach_body` body is not copied - `body` of
+the response is read-only ``memoryview`` of the segment and it is freed by
+`release` method of the response called by engine when request processing
+is done, `body` is not available after that. Keep ``bytes(response.body)``
+to use body later. Middleware replacing response object must call
+`release` of the original response, otherwise segment is freed only when
+the original response is garbage collected.
+
+Name of the segment is removed as soon as engine process maps it, so
+segments are not left in the system after engine exits.
+
+Transports:
+
+- :attr:`SHM` - ``multiprocessing.shared_memory`` segment, python 3.8+
+- :attr:`MMAP` - temporary file in ``/dev/shm`` if it exists, otherwise in
+  the default temporary directory
+"""
+import os
+import copy
+import mmap
+import logging
+import tempfile
+
+try:
+    from multiprocessing import shared_memory, resource_tracker
+except ImportError:  # pragma: no cover
+    shared_memory = None
+
+
+log = logging.getLogger('pomp.contrib.sharedbody')
+
+
+SHM = 'shm'
+MMAP = 'mmap'
+
+DEFAULT_TRANSPORT = SHM if shared_memory is not None else MMAP
+MMAP_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+
+class SharedBodyHandle(object):
+    """Handle of response body put to shared segment
+
+    :param transport: :attr:`SHM` or :attr:`MMAP`
+    :param name: segment name or temporary file path
+    :param size: body size in bytes
+    """
+
+    def __init__(self, transport, name, size):
+        self.transport = transport
+        self.name = name
+        self.size = size
+
+    def __len__(self):
+        return self.size
+
+    def __repr__(self):
+        return '<SharedBodyHandle {s.transport}:{s.name} {s.size}>'.format(
+            s=self,
+        )
+
+
+class SharedSegment(object):
+    """Shared segment mapped by engine process
+
+    Name of the segment is removed after mapping, memory is freed by
+    :meth:`release` or when segment and its views are garbage collected.
+
+    :param handle: instance of :class:`SharedBodyHandle`
+    """
+
+    def __init__(self, handle):
+        self.handle = handle
+        if handle.transport == SHM:
+            self._shm = shared_memory.SharedMemory(name=handle.name)
+            self._mmap = None
+            self.view = self._shm.buf[:handle.size].toreadonly()
+            self._shm.unlink()
+        else:
+            self._shm = None
+            with open(handle.name, 'rb') as f:
+                self._mmap = mmap.mmap(
+                    f.fileno(), 0, access=mmap.ACCESS_READ,
+                )
+            self.view = memoryview(self._mmap)[:handle.size]
+            os.unlink(handle.name)
+
+    def release(self):
+        """Unmap segment"""
+        if self.view is None:
+            return
+        self.view.release()
+        self.view = None
+        try:
+            if self._shm is not None:
+                self._shm.close()
+            else:
+                self._mmap.close()
+        except BufferError:
+            # slices of body are still used, memory is unmapped
+            # when they are garbage collected
+            log.warning('Body of %s is still exported', self.handle)
+
+
+def _create_shm(size):
+    try:
+        return shared_memory.SharedMemory(
+            create=True, size=size, track=False,
+        )
+    except TypeError:  # pragma: no cover
+        # python < 3.13 - segment is owned by the engine process
+        shm = shared_memory.SharedMemory(create=True, size=size)
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+
+def share_body(response, threshold, transport=None):
+    """Put response body to shared segment if body is big enough
+
+    Called by pool worker process.
+
+    :param response: response with `body` attribute
+    :param threshold: min body size in bytes to share
+    :param transport: :attr:`SHM` or :attr:`MMAP`,
+                      :attr:`DEFAULT_TRANSPORT` by default
+    :rtype: the same response
+    """
+    body = getattr(response, 'body', None)
+    if not isinstance(body, bytes) or len(body) < max(threshold, 1):
+        return response
+
+    transport = transport or DEFAULT_TRANSPORT
+    size = len(body)
+    if transport == SHM:
+        shm = _create_shm(size)
+        shm.buf[:size] = body
+        name = shm.name
+        shm.close()
+    else:
+        fd, name = tempfile.mkstemp(prefix='pomp-body-', dir=MMAP_DIR)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(body)
+    response.body = SharedBodyHandle(transport, name, size)
+    return response
+
+
+def attach_body(response, view=False):
+    """Map shared body of response
+
+    Called by engine process, `body` of response is set to bytes copied
+    from the segment and the segment is freed.
+
+    :param response: response passed from pool worker process
+    :param view: set `body` to read-only ``memoryview`` of the segment
+                 without copying, `release` method of response frees
+                 segment
+    :rtype: the same response
+    """
+    handle = getattr(response, 'body', None)
+    if not isinstance(handle, SharedBodyHandle):
+        return response
+
+    segment = SharedSegment(handle)
+    if not view:
+        body = segment.view.tobytes()
+        segment.release()
+        response.body = body
+        return response
+
+    release = getattr(response, 'release', None)
+
+    def _release():
+        # restore method of the class
+        response.__dict__.pop('release', None)
+        segment.release()
+        if release is not None:
+            release()
+
+    response.body = segment.view
+    response.release = _release
+    return response
+
+
+def detach_body(response):
+    """Copy of response with mapped body as bytes
+
+    Use it to pickle response with mapped body.
+
+    :param response: response with mapped body
+    :rtype: copy of response or the same response if body is not mapped
+    """
+    if 'release' not in getattr(response, '__dict__', {}) or \
+            not isinstance(response.body, memoryview):
+        return response
+    response = copy.copy(response)
+    del response.release
+    response.body = response.body.tobytes()
+    return response
+
+
+def _run_sharing_body(threshold, transport, fn, *args):
+    return share_body(fn(*args), threshold, transport)
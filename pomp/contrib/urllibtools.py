@@ -3,61 +3,647 @@ Downloader and middleware implementations.
 
 - Downloaders: Fetches data by standard `urllib.urlopen` (Python 3.x) or
   `urllib2.urlopen` (Python 2.7+)
+- Pooled downloaders: Fetches data by `http.client` (Python 3.x) or
+  `httplib` (Python 2.7+) over keep-alive connections
+
+Timeouts of downloaders:
+
+- `connect_timeout` - connection establishment timeout in seconds
+- `read_timeout` - timeout of each socket read in seconds
+- `total_timeout` - deadline for the whole request in seconds,
+  including slow body transfer
+
+`timeout` param is a default value for `connect_timeout` and
+`read_timeout`. Each value may be overridden per request by
+the same attribute of :class:`UrllibHttpRequest`. Timed out requests
+are returned as :class:`pomp.core.base.TimeoutCrawlException`.
+
+Response body options of downloaders:
+
+- `max_body_size` - max size of response body in bytes, larger responses
+  are aborted and returned as :class:`pomp.core.base.BodySizeCrawlException`
+- `stream` - do not read body on download, crawler and middlewares read it
+  incrementally by :meth:`UrllibHttpResponse.iter_body`
+- `spool_threshold` - body larger than this size in bytes is spooled to
+  temporary file, see :attr:`UrllibHttpResponse.body_file`
+
+`max_body_size` and `stream` may be overridden per request by the same
+attribute of :class:`UrllibHttpRequest`.
+
+Downloaders send ``Accept-Encoding`` header and decode compressed body
+while it is read, `max_body_size` limits the decoded body. Disable it by
+`decode_content` param, see :mod:`pomp.contrib.decoding`.
 """
 import sys
+import time
+import socket
+import logging
+import tempfile
+import threading
+import collections
+from functools import partial
 try:
-    from urllib.request import urlopen, Request
+    from urllib.request import (
+        Request, AbstractHTTPHandler, HTTPHandler, HTTPSHandler,
+        HTTPRedirectHandler, build_opener,
+    )
+    from urllib.error import HTTPError, URLError
+    from urllib.parse import urlsplit
+    from http.client import HTTPConnection, HTTPSConnection
 except ImportError:  # pragma: no cover
-    from urllib2 import urlopen, Request
-
-import logging
+    from urllib2 import (
+        Request, AbstractHTTPHandler, HTTPHandler, HTTPSHandler,
+        HTTPRedirectHandler, build_opener, HTTPError, URLError,
+    )
+    from urlparse import urlsplit
+    from httplib import HTTPConnection, HTTPSConnection
 
 from pomp.core.base import (
     BaseDownloadWorker, BaseDownloader,
     BaseHttpRequest, BaseHttpResponse, BaseMiddleware,
-    BaseCrawlException,
+    BaseCrawlException, TimeoutCrawlException, BodySizeCrawlException,
 )
+from pomp.contrib.decoding import ACCEPT_ENCODING, get_decoder
 
 
 log = logging.getLogger('pomp.contrib.urllib')
 
 
+READ_CHUNK_SIZE = 64 * 1024
+
+
+class _Deadline(object):
+    """Timeouts of one request"""
+
+    def __init__(
+            self, connect_timeout=None, read_timeout=None,
+            total_timeout=None):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.total_timeout = total_timeout
+        self.started = time.time()
+        self.sock = None
+
+    def get_timeout(self, timeout):
+        """Limit timeout by the rest of total timeout"""
+        if self.total_timeout is None:
+            return timeout
+        remaining = self.total_timeout - (time.time() - self.started)
+        if remaining <= 0:
+            raise socket.timeout('total timeout exceeded')
+        return remaining if timeout is None else min(timeout, remaining)
+
+    def attach(self, sock):
+        """Track socket of the request and apply read timeout to it"""
+        self.sock = sock
+        self.update_read_timeout()
+
+    def update_read_timeout(self):
+        if self.sock is not None:
+            self.sock.settimeout(self.get_timeout(self.read_timeout))
+
+
+def _is_timeout(exception):
+    if isinstance(exception, URLError):
+        exception = exception.reason
+    return isinstance(exception, socket.timeout)
+
+
+class _DeadlineReader(object):
+    """Read response body by chunks and respect request deadline and max
+    body size
+
+    :param on_close: callback called once with completeness flag when body
+                     is read or reading is aborted, closes response by
+                     default
+    :param decode_content: decode body by ``Content-Encoding`` header,
+                           `max_body_size` limits decoded body
+    """
+
+    def __init__(
+            self, response, deadline, request=None, max_body_size=None,
+            on_close=None, decode_content=False):
+        self.response = response
+        self.deadline = deadline
+        self.request = request
+        self.max_body_size = max_body_size
+        self.on_close = on_close
+        self.status = getattr(response, 'status', None)
+        self.headers = getattr(response, 'headers', None)
+        self.content_encoding = None
+        if decode_content and self.headers is not None:
+            self.content_encoding = self.headers.get('Content-Encoding')
+        self.size = 0
+        self.closed = False
+
+        if max_body_size is not None and self.headers is not None:
+            length = self.headers.get('Content-Length')
+            if length and length.isdigit() and int(length) > max_body_size:
+                # close response before body is read, otherwise server
+                # keeps sending it
+                self.close()
+                raise self._get_size_exception()
+
+    def _get_size_exception(self):
+        return BodySizeCrawlException(
+            self.request,
+            exception=ValueError(
+                'Response body exceeds %s bytes' % self.max_body_size
+            ),
+        )
+
+    def _count(self, chunks):
+        for chunk in chunks:
+            self.size += len(chunk)
+            if self.max_body_size is not None and \
+                    self.size > self.max_body_size:
+                raise self._get_size_exception()
+            yield chunk
+
+    def iter_chunks(self, chunk_size=READ_CHUNK_SIZE):
+        # `read1` returns after one socket read, so deadline is checked
+        # even if server sends body byte by byte
+        read = getattr(self.response, 'read1', self.response.read)
+        # compressed chunk is expanded by parts not bigger than chunk size
+        decoder = get_decoder(self.content_encoding, chunk_size=chunk_size)
+        try:
+            while True:
+                self.deadline.update_read_timeout()
+                chunk = read(chunk_size)
+                if not chunk:
+                    break
+                chunks = (chunk, ) if decoder is None \
+                    else decoder.decode(chunk)
+                for chunk in self._count(chunks):
+                    yield chunk
+            if decoder is not None:
+                for chunk in self._count(decoder.flush()):
+                    yield chunk
+        except BaseException:
+            # including stop of iteration by consumer
+            self.close()
+            raise
+        self.close(complete=True)
+
+    def read(self):
+        return b''.join(self.iter_chunks())
+
+    def close(self, complete=False):
+        if self.closed:
+            return
+        self.closed = True
+        if self.on_close is not None:
+            self.on_close(complete)
+        else:
+            self.response.close()
+
+
+class _DeadlineHandlerMixin(object):
+
+    def do_open(self, http_class, req, **http_conn_args):
+        deadline = getattr(req, 'deadline', None)
+        if deadline is None:
+            return AbstractHTTPHandler.do_open(
+                self, http_class, req, **http_conn_args
+            )
+
+        def build_connection(*args, **kwargs):
+            conn = http_class(*args, **kwargs)
+            connect = conn.connect
+
+            def connect_with_deadline():
+                conn.timeout = deadline.get_timeout(deadline.connect_timeout)
+                connect()
+                deadline.attach(conn.sock)
+
+            conn.connect = connect_with_deadline
+            return conn
+
+        return AbstractHTTPHandler.do_open(
+            self, build_connection, req, **http_conn_args
+        )
+
+
+class _DeadlineHTTPHandler(_DeadlineHandlerMixin, HTTPHandler):
+    pass
+
+
+class _DeadlineHTTPSHandler(_DeadlineHandlerMixin, HTTPSHandler):
+    pass
+
+
+class _DeadlineRedirectHandler(HTTPRedirectHandler):
+
+    def redirect_request(self, req, *args, **kwargs):
+        new_req = HTTPRedirectHandler.redirect_request(
+            self, req, *args, **kwargs
+        )
+        if new_req is not None:
+            new_req.deadline = getattr(req, 'deadline', None)
+        return new_req
+
+
 class UrllibDownloadWorker(BaseDownloadWorker):
+    """Download worker on `urllib.urlopen`
+
+    :param timeout: connect and read timeout in seconds
+    :param connect_timeout: connect timeout in seconds, `timeout` by default
+    :param read_timeout: socket read timeout in seconds, `timeout` by default
+    :param total_timeout: deadline for the whole request in seconds
+    :param max_body_size: max size of response body in bytes
+    :param stream: read response body by consumer
+    :param spool_threshold: spool body larger than this size in bytes to
+                            temporary file
+    :param decode_content: request compressed body and decode it
+    """
+
+    def __init__(
+            self, timeout=None, connect_timeout=None, read_timeout=None,
+            total_timeout=None, max_body_size=None, stream=False,
+            spool_threshold=None, decode_content=True):
+        self.timeout = timeout
+        self.connect_timeout = timeout if connect_timeout is None \
+            else connect_timeout
+        self.read_timeout = timeout if read_timeout is None \
+            else read_timeout
+        self.total_timeout = total_timeout
+        self.max_body_size = max_body_size
+        self.stream = stream
+        self.spool_threshold = spool_threshold
+        self.decode_content = decode_content
+        self.opener = build_opener(
+            _DeadlineHTTPHandler,
+            _DeadlineHTTPSHandler,
+            _DeadlineRedirectHandler,
+        )
 
-    def __init__(self, timeout=None):
-        self.timeout = None
+    def get_option(self, request, name):
+        """Option of worker, request attribute overrides it"""
+        value = getattr(request, name, None)
+        return getattr(self, name) if value is None else value
+
+    def get_deadline(self, request):
+        """Build timeouts of request, request attributes override
+        worker timeouts"""
+        return _Deadline(
+            connect_timeout=self.get_option(request, 'connect_timeout'),
+            read_timeout=self.get_option(request, 'read_timeout'),
+            total_timeout=self.get_option(request, 'total_timeout'),
+        )
 
     def process(self, request):
         try:
             log.info("Fetch %s %s %s", type(request), request, request.url)
-            res = urlopen(request.url, timeout=self.timeout)
-            return UrllibHttpResponse(request, res)
+            return self._fetch(request, self.get_deadline(request))
+        except BodySizeCrawlException as e:
+            log.warning('Abort %s: %s', request, e.exception)
+            return e
         except Exception as e:
             log.exception('Exception on %s', request)
-            return BaseCrawlException(
+            exception_class = TimeoutCrawlException if _is_timeout(e) \
+                else BaseCrawlException
+            return exception_class(
                 request,
                 exception=e,
                 exc_info=sys.exc_info(),
             )
 
+    def _fetch(self, request, deadline):
+        req = Request(request.url)
+        req.deadline = deadline
+        if isinstance(request, Request):
+            for name, value in request.header_items():
+                req.add_header(name, value)
+        if self.decode_content and not req.has_header('Accept-encoding'):
+            req.add_header('Accept-Encoding', ACCEPT_ENCODING)
+        res = self.opener.open(
+            req, timeout=deadline.get_timeout(deadline.connect_timeout),
+        )
+        return self._build_response(request, res, deadline)
+
+    def _build_response(self, request, res, deadline, on_close=None):
+        return UrllibHttpResponse(
+            request,
+            _DeadlineReader(
+                res, deadline,
+                request=request,
+                max_body_size=self.get_option(request, 'max_body_size'),
+                on_close=on_close,
+                decode_content=self.decode_content,
+            ),
+            stream=self.get_option(request, 'stream'),
+            spool_threshold=self.spool_threshold,
+        )
+
 
 class UrllibDownloader(BaseDownloader):
     """Simplest downloader
 
-    :param timeout: request timeout in seconds
+    :param timeout: connect and read timeout in seconds
+    :param connect_timeout: connect timeout in seconds
+    :param read_timeout: socket read timeout in seconds
+    :param total_timeout: deadline for the whole request in seconds
+    :param max_body_size: max size of response body in bytes
+    :param stream: read response body by consumer
+    :param spool_threshold: spool body larger than this size in bytes to
+                            temporary file
+    :param decode_content: request compressed body and decode it
     """
     WORKER_CLASS = UrllibDownloadWorker
 
-    def __init__(self, timeout=None):
+    def __init__(
+            self, timeout=None, connect_timeout=None, read_timeout=None,
+            total_timeout=None, max_body_size=None, stream=False,
+            spool_threshold=None, decode_content=True):
         super(UrllibDownloader, self).__init__()
-        self.worker = UrllibDownloadWorker(timeout=timeout)
+        self.worker = UrllibDownloadWorker(
+            timeout=timeout,
+            connect_timeout=connect_timeout,
+            read_timeout=read_timeout,
+            total_timeout=total_timeout,
+            max_body_size=max_body_size,
+            stream=stream,
+            spool_threshold=spool_threshold,
+            decode_content=decode_content,
+        )
 
     def process(self, crawler, request):
         return self.worker.process(request)
 
 
+class HttpConnectionPool(object):
+    """Per host pool of keep-alive `http.client` connections
+
+    :param maxsize: max count of idle connections kept for each host,
+                    released connections over the limit are closed
+    :param idle_timeout: idle connection older than this value in seconds
+                         is evicted from the pool
+    :param timeout: socket timeout in seconds for new connections
+    """
+    CONNECTION_CLASSES = {
+        'http': HTTPConnection,
+        'https': HTTPSConnection,
+    }
+
+    def __init__(self, maxsize=10, idle_timeout=60, timeout=None):
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        # (scheme, host, port) -> deque of (connection, released at)
+        self._idle = {}
+
+    def get_connection(self, scheme, host, port=None):
+        """Pop idle connection to the host or build new one
+
+        :rtype: tuple of connection and reused flag
+        """
+        key = (scheme, host, port)
+        now = time.time()
+        with self._lock:
+            idle = self._idle.get(key)
+            while idle:
+                conn, released_at = idle.pop()
+                if now - released_at <= self.idle_timeout \
+                        and conn.sock is not None:
+                    return conn, True
+                conn.close()
+
+        kwargs = {}
+        if self.timeout is not None:
+            kwargs['timeout'] = self.timeout
+        return self.CONNECTION_CLASSES[scheme](host, port, **kwargs), False
+
+    def release(self, conn, scheme, host, port=None):
+        """Return connection to the pool for following requests"""
+        key = (scheme, host, port)
+        with self._lock:
+            idle = self._idle.setdefault(key, collections.deque())
+            if len(idle) < self.maxsize:
+                idle.append((conn, time.time()))
+                return
+        conn.close()
+
+    def evict_idle(self):
+        """Close connections idle more than `idle_timeout`"""
+        now = time.time()
+        with self._lock:
+            for idle in self._idle.values():
+                # oldest connections are in the left side
+                while idle and now - idle[0][1] > self.idle_timeout:
+                    idle.popleft()[0].close()
+
+    def get_idle_count(self):
+        with self._lock:
+            return sum(len(idle) for idle in self._idle.values())
+
+    def close(self):
+        """Close all idle connections"""
+        with self._lock:
+            for idle in self._idle.values():
+                while idle:
+                    idle.pop()[0].close()
+            self._idle.clear()
+
+
+class PooledUrllibDownloadWorker(UrllibDownloadWorker):
+    """Download worker over pool of keep-alive connections
+
+    Unlike :class:`UrllibDownloadWorker` redirects are not followed.
+
+    :param timeout: connect and read timeout in seconds
+    :param connect_timeout: connect timeout in seconds, `timeout` by default
+    :param read_timeout: socket read timeout in seconds, `timeout` by default
+    :param total_timeout: deadline for the whole request in seconds
+    :param pool_maxsize: max count of idle connections for each host
+    :param idle_timeout: idle connection lifetime in seconds
+    :param max_body_size: max size of response body in bytes
+    :param stream: read response body by consumer, connection is returned
+                   to the pool when body is read completely
+    :param spool_threshold: spool body larger than this size in bytes to
+                            temporary file
+    :param decode_content: request compressed body and decode it
+    """
+    # exceptions raised when server closed keep-alive connection
+    RETRY_EXCEPTIONS = (IOError, ) if sys.version_info < (3, 0) \
+        else (ConnectionError, )
+    # methods safe to resend, same as urllib3 retries
+    IDEMPOTENT_METHODS = frozenset((
+        'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE', 'TRACE',
+    ))
+
+    def __init__(
+            self, timeout=None, connect_timeout=None, read_timeout=None,
+            total_timeout=None, pool_maxsize=10, idle_timeout=60,
+            max_body_size=None, stream=False, spool_threshold=None,
+            decode_content=True):
+        super(PooledUrllibDownloadWorker, self).__init__(
+            timeout=timeout,
+            connect_timeout=connect_timeout,
+            read_timeout=read_timeout,
+            total_timeout=total_timeout,
+            max_body_size=max_body_size,
+            stream=stream,
+            spool_threshold=spool_threshold,
+            decode_content=decode_content,
+        )
+        self.pool = HttpConnectionPool(
+            maxsize=pool_maxsize,
+            idle_timeout=idle_timeout,
+        )
+
+    def _request(self, conn, deadline, method, path, body, headers):
+        if conn.sock is None:
+            conn.timeout = deadline.get_timeout(deadline.connect_timeout)
+            conn.connect()
+        deadline.attach(conn.sock)
+        conn.request(method, path, body=body, headers=headers)
+        return conn.getresponse()
+
+    def _fetch(self, request, deadline):
+        url = urlsplit(request.url)
+        path = url.path or '/'
+        if url.query:
+            path = '%s?%s' % (path, url.query)
+
+        if isinstance(request, Request):
+            method = request.get_method()
+            body = request.data
+            headers = dict(request.header_items())
+        else:
+            method, body, headers = 'GET', None, {}
+        if self.decode_content and not any(
+                name.lower() == 'accept-encoding' for name in headers):
+            headers['Accept-Encoding'] = ACCEPT_ENCODING
+
+        self.pool.evict_idle()
+        conn, reused = self.pool.get_connection(
+            url.scheme, url.hostname, url.port,
+        )
+        try:
+            res = self._request(conn, deadline, method, path, body, headers)
+        except self.RETRY_EXCEPTIONS:
+            conn.close()
+            if not reused or method.upper() not in self.IDEMPOTENT_METHODS:
+                raise
+            # keep-alive connection was closed by server - retry once
+            conn, _ = self.pool.get_connection(
+                url.scheme, url.hostname, url.port,
+            )
+            try:
+                res = self._request(
+                    conn, deadline, method, path, body, headers,
+                )
+            except Exception:
+                conn.close()
+                raise
+        except Exception:
+            conn.close()
+            raise
+
+        try:
+            response = self._build_response(
+                request, res, deadline,
+                on_close=partial(self._release_connection, conn, res, url),
+            )
+        except Exception:
+            conn.close()
+            raise
+
+        if res.status >= 400:
+            # same behavior as `urlopen`
+            return BaseCrawlException(
+                request,
+                response=response,
+                exception=HTTPError(
+                    request.url, res.status, res.reason, res.msg, None,
+                ),
+            )
+        return response
+
+    def _release_connection(self, conn, res, url, complete):
+        # connection with not read body can not be reused
+        if complete and not res.will_close:
+            self.pool.release(conn, url.scheme, url.hostname, url.port)
+        else:
+            # response owns socket when server closes connection
+            res.close()
+            conn.close()
+
+    def close(self):
+        self.pool.close()
+
+
+class PooledUrllibDownloader(BaseDownloader):
+    """Downloader with pool of keep-alive connections for each host
+
+    :param timeout: connect and read timeout in seconds
+    :param connect_timeout: connect timeout in seconds
+    :param read_timeout: socket read timeout in seconds
+    :param total_timeout: deadline for the whole request in seconds
+    :param pool_maxsize: max count of idle connections for each host
+    :param idle_timeout: idle connection lifetime in seconds
+    :param max_body_size: max size of response body in bytes
+    :param stream: read response body by consumer
+    :param spool_threshold: spool body larger than this size in bytes to
+                            temporary file
+    :param decode_content: request compressed body and decode it
+    """
+    WORKER_CLASS = PooledUrllibDownloadWorker
+
+    def __init__(
+            self, timeout=None, connect_timeout=None, read_timeout=None,
+            total_timeout=None, pool_maxsize=10, idle_timeout=60,
+            max_body_size=None, stream=False, spool_threshold=None,
+            decode_content=True):
+        super(PooledUrllibDownloader, self).__init__()
+        self.worker = self.WORKER_CLASS(
+            timeout=timeout,
+            connect_timeout=connect_timeout,
+            read_timeout=read_timeout,
+            total_timeout=total_timeout,
+            pool_maxsize=pool_maxsize,
+            idle_timeout=idle_timeout,
+            max_body_size=max_body_size,
+            stream=stream,
+            spool_threshold=spool_threshold,
+            decode_content=decode_content,
+        )
+
+    def process(self, crawler, request):
+        return self.worker.process(request)
+
+    def stop(self, crawler):
+        self.worker.close()
+
+
 class UrllibHttpRequest(Request, BaseHttpRequest):
-    """Adapter for urllib request to :class:`pomp.core.base.BaseHttpRequest`"""
+    """Adapter for urllib request to :class:`pomp.core.base.BaseHttpRequest`
+
+    Params `*args` and `**kwargs` passed to ``urllib.request.Request``
+    constructor.
+
+    :param connect_timeout: connect timeout in seconds
+    :param read_timeout: socket read timeout in seconds
+    :param total_timeout: deadline for the whole request in seconds
+    :param max_body_size: max size of response body in bytes
+    :param stream: read response body by consumer
+
+    Timeouts and body options override downloader options for this request.
+    """
+    connect_timeout = None
+    read_timeout = None
+    total_timeout = None
+    max_body_size = None
+    stream = None
+
+    def __init__(self, *args, **kwargs):
+        self.connect_timeout = kwargs.pop('connect_timeout', None)
+        self.read_timeout = kwargs.pop('read_timeout', None)
+        self.total_timeout = kwargs.pop('total_timeout', None)
+        self.max_body_size = kwargs.pop('max_body_size', None)
+        self.stream = kwargs.pop('stream', None)
+        Request.__init__(self, *args, **kwargs)
 
     @property
     def url(self):
@@ -67,15 +653,110 @@ class UrllibHttpRequest(Request, BaseHttpRequest):
         return '<UrllibHttpRequest {s.url}>'.format(s=self)
 
 
+def _iter_chunks(response, chunk_size):
+    iter_chunks = getattr(response, 'iter_chunks', None)
+    if iter_chunks is not None:
+        return iter_chunks(chunk_size)
+    return _iter_file(response, chunk_size)
+
+
+def _iter_file(f, chunk_size):
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
+
 class UrllibHttpResponse(BaseHttpResponse):
     """Adapter for urllib response to
-    :class:`pomp.core.base.BaseHttpResponse`"""
+    :class:`pomp.core.base.BaseHttpResponse`
 
-    def __init__(self, request, response):
+    :param request: request
+    :param response: urllib response or file-like object of body
+    :param stream: do not read body, read it on `body` access or by
+                   :meth:`iter_body`
+    :param spool_threshold: spool body larger than this size in bytes to
+                            :attr:`body_file`
+
+    Not read body is read on pickling, so stream mode has sense only
+    in the process of the engine.
+    """
+    body_file = None
+
+    def __init__(self, request, response, stream=False, spool_threshold=None):
         self.request = request
+        self.status = getattr(response, 'status', None)
+        self.headers = getattr(response, 'headers', None)
+        self._body = None
+        self._stream = None
+
+        if isinstance(response, Exception):
+            return
+        if stream:
+            self._stream = response
+        elif spool_threshold is not None:
+            self.body_file = tempfile.SpooledTemporaryFile(
+                max_size=spool_threshold,
+            )
+            for chunk in _iter_chunks(response, READ_CHUNK_SIZE):
+                self.body_file.write(chunk)
+            self.body_file.seek(0)
+        else:
+            self._body = response.read()
+
+    @property
+    def body(self):
+        """Whole body, not read body of stream or spooled body is read
+        into memory"""
+        if self._body is None:
+            if self._stream is not None:
+                stream, self._stream = self._stream, None
+                self._body = stream.read()
+            elif self.body_file is not None:
+                self.body_file.seek(0)
+                self._body = self.body_file.read()
+        return self._body
+
+    @body.setter
+    def body(self, value):
+        self._body = value
+
+    def iter_body(self, chunk_size=READ_CHUNK_SIZE):
+        """Iterate body by chunks
+
+        Not read body is read from the connection and is not kept, so it
+        can be iterated only once.
+
+        :param chunk_size: max size of chunk in bytes
+        """
+        if self._body is not None:
+            for i in range(0, len(self._body), chunk_size):
+                yield self._body[i:i + chunk_size]
+        elif self._stream is not None:
+            stream, self._stream = self._stream, None
+            for chunk in _iter_chunks(stream, chunk_size):
+                yield chunk
+        elif self.body_file is not None:
+            self.body_file.seek(0)
+            for chunk in _iter_file(self.body_file, chunk_size):
+                yield chunk
+
+    def release(self):
+        """Close not read stream and spooled body file"""
+        stream, self._stream = self._stream, None
+        if stream is not None:
+            stream.close()
+        if self.body_file is not None:
+            self.body_file.close()
 
-        if not isinstance(response, Exception):
-            self.body = response.read()
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if self._stream is not None or self.body_file is not None:
+            state['_body'] = self.body
+        state['_stream'] = None
+        state.pop('body_file', None)
+        return state
 
     def get_request(self):
         return self.request
@@ -88,7 +88,9 @@ class BaseQueue(object):  # pragma: no cover
 
         :param count: count of requests to be processed by downloader
                       in concurrent mode, None - downloader have not
-                      concurrency (workers). This param can be ignored.
+                      concurrency (workers). Queue may return batch up to
+                      `count` requests, waiting only for the first one.
+                      This param can be ignored.
         :rtype: instance of :class:`BaseRequest` or :class:`.Planned`
                 or list of them
         """
@@ -97,10 +99,27 @@ class BaseQueue(object):  # pragma: no cover
     def put_requests(self, requests):
         """Put to queue
 
+        Engine puts all follow-up requests of one response by one call.
+
         :param requests: instance of :class:`BaseRequest` or list of them
         """
         raise NotImplementedError()
 
+    def done_request(self, request):
+        """Called by engine when request taken from the queue is done
+
+        Queue with leases may acknowledge the request, it is done when
+        its response or exception is fully processed, dropped by
+        middlewares or returned by them to the queue again.
+
+        :note:
+            Subclass may not implement this method.
+
+        :param request: request taken from the queue after request
+                        middlewares
+        """
+        pass
+
 
 class BaseDownloadWorker(object):  # pragma: no cover
     """Download worker interface"""
@@ -219,7 +238,9 @@ class BaseMiddleware(object):
         :param request: instance of :class:`BaseHttpRequest`
         :param crawler: instance of :class:`BaseCrawler`
         :param downloader: instance of :class:`BaseDownloader`
-        :rtype: changed request or ``None`` to skip execution of this request
+        :rtype: changed request, ``None`` to skip execution of this request
+                or instance of :class:`BaseResponse` to pass it to
+                response middlewares instead of download
         """
         return request
 
@@ -231,8 +252,10 @@ class BaseMiddleware(object):
         :param response: instance of :class:`BaseHttpResponse`
         :param crawler: instance of :class:`BaseCrawler`
         :param downloader: instance of :class:`BaseDownloader`
-        :rtype: changed response or ``None`` to skip
-                processing of this response
+        :rtype: changed response, ``None`` to skip
+                processing of this response or instance of
+                :class:`BaseRequest` to put it to the queue instead of
+                response, not before its `not_before` timestamp if set
         """
         return response
 
@@ -244,20 +267,34 @@ class BaseMiddleware(object):
         :param exception: instance of :class:`BaseCrawlException`
         :param crawler: instance of :class:`BaseCrawler`
         :param downloader: instance of :class:`BaseDownloader`
-        :rtype: changed response or ``None`` to skip
-                processing of this exception
+        :rtype: changed exception, ``None`` to skip processing of this
+                exception, instance of :class:`BaseResponse` passed to
+                `process_response` of following middlewares and to crawler
+                or instance of :class:`BaseRequest` to put it to the queue,
+                not before its `not_before` timestamp if set
         """
         return exception
 
 
 class BaseRequest(object):  # pragma: no cover
-    """Request interface"""
-    pass
+    """Request interface
+
+    :attr:`priority` is honored by priority queues, requests with higher
+    priority are taken first. Engine sets `depth` attribute of follow-up
+    request if it is not set, to depth of the request of response plus one.
+    """
+    priority = 0
 
 
 class BaseResponse(object):  # pragma: no cover
     """Response interface"""
-    pass
+
+    def release(self):
+        """Free resources of response
+
+        Called by engine when response processing is done.
+        """
+        pass
 
 
 class BaseHttpRequest(BaseRequest):  # pragma: no cover
@@ -291,7 +328,7 @@ class BaseCrawlException(Exception):  # pragma: no cover
 
     def __reduce__(self):
         return (
-            BaseCrawlException,
+            self.__class__,
             (),
             {
                 'request': self.request,
@@ -307,6 +344,23 @@ class BaseCrawlException(Exception):  # pragma: no cover
         )
 
 
+class TimeoutCrawlException(BaseCrawlException):  # pragma: no cover
+    """Request timed out
+
+    Returned by downloaders when request exceeds connect, read or
+    total timeout. Middlewares may count and retry it.
+    """
+    pass
+
+
+class BodySizeCrawlException(BaseCrawlException):  # pragma: no cover
+    """Response body is too large
+
+    Returned by downloaders when response body exceeds max body size.
+    """
+    pass
+
+
 class BaseEngine(object):  # pragma: no cover
 
     def pump(self, crawler):
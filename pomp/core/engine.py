@@ -2,9 +2,10 @@
 Engine
 """
 import sys
+import time
 import types
 import logging
-import threading
+import itertools
 
 from pomp.core.base import (
     BaseEngine,
@@ -15,7 +16,8 @@ from pomp.core.base import (
     BaseHttpResponse,
     BaseCrawlException,
 )
-from pomp.core.utils import iterator
+from pomp.core.utils import iterator, Timer
+from pomp.core.scheduler import InFlightScheduler
 
 try:
     import Queue as queue
@@ -36,11 +38,74 @@ class SimpleQueue(BaseQueue):
         self.q = queue.Queue() if use_lifo else queue.LifoQueue()
 
     def get_requests(self, count=None):
-        r = self.q.get()
-        return r
+        r = self._unwrap(self.q.get())
+        if not count or count <= 1 or isinstance(r, StopCommand):
+            return r
+
+        # drain up to `count` requests without blocking
+        requests = [r]
+        while len(requests) < count:
+            try:
+                r = self._unwrap(self.q.get_nowait())
+            except queue.Empty:
+                break
+            if isinstance(r, StopCommand):
+                # leave command for the next call
+                self.q.put(self._wrap(r))
+                break
+            requests.append(r)
+        return requests
 
     def put_requests(self, requests):
-        self.q.put(requests)
+        for request in iterator(requests):
+            self.q.put(self._wrap(request))
+
+    def _wrap(self, request):
+        return request
+
+    def _unwrap(self, entry):
+        return entry
+
+
+def get_request_priority(request, depth_bias=0):
+    """Priority of request in priority queues
+
+    :param request: instance of :class:`pomp.core.base.BaseRequest` or url
+    :param depth_bias: priority decrease for each level of request `depth`,
+                       negative value prefers deep requests
+    :rtype: priority, higher is taken first
+    """
+    if isinstance(request, BaseCommand):
+        # commands are taken after all requests
+        return float('-inf')
+    return getattr(request, 'priority', 0) - \
+        depth_bias * getattr(request, 'depth', 0)
+
+
+class PriorityQueue(SimpleQueue):
+    """Queue ordered by `priority` of requests
+
+    Requests with the same priority are taken in order they were put.
+
+    :param depth_bias: priority decrease for each level of request `depth`,
+                       positive value takes shallow requests first
+    """
+
+    def __init__(self, depth_bias=0):
+        self.depth_bias = depth_bias
+        self.q = queue.PriorityQueue()
+        # monotonic tie-breaker, requests are never compared
+        self._counter = itertools.count()
+
+    def _wrap(self, request):
+        return (
+            -get_request_priority(request, self.depth_bias),
+            next(self._counter),
+            request,
+        )
+
+    def _unwrap(self, entry):
+        return entry[-1]
 
 
 class Pomp(BaseEngine):
@@ -58,15 +123,23 @@ class Pomp(BaseEngine):
     :param pipelines: list of item pipelines
                       :class:`pomp.core.base.BasePipeline`
     :param queue: external queue, instance of :class:`pomp.core.base.BaseQueue`
+                  or internal :class:`SimpleQueue` or :class:`PriorityQueue`
     :param breadth_first: use BFO order or DFO order, sensibly if used internal
                           queue only
+    :param scheduler: in-flight scheduler, instance of
+                      :class:`pomp.core.scheduler.InFlightScheduler`,
+                      by default limited by downloader workers count
+    :param journal: log of queued and done requests, instance of
+                    :class:`pomp.contrib.journal.Journal`, pending
+                    requests of interrupted crawl are put to the queue
+                    instead of ``ENTRY_REQUESTS``
     """
     DEFAULT_QUEUE_CLASS = SimpleQueue
-    LOCK_FACTORY = threading.Lock
+    SCHEDULER_CLASS = InFlightScheduler
 
     def __init__(
             self, downloader, middlewares=None, pipelines=None,
-            queue=None, breadth_first=False):
+            queue=None, breadth_first=False, scheduler=None, journal=None):
         self.downloader = downloader
 
         self.middlewares = middlewares or []
@@ -74,25 +147,29 @@ class Pomp(BaseEngine):
             self.middlewares = list(self.middlewares)
 
         self.pipelines = pipelines or tuple()
-        self.queue = queue or self.DEFAULT_QUEUE_CLASS(
+        # empty queue with `__len__` is false
+        self.queue = queue if queue is not None else self.DEFAULT_QUEUE_CLASS(
             use_lifo=not breadth_first
         )
-        self.queue_lock = None
-        self.queue_semaphore_value = None
-        self.workers_count = None
+        self.scheduler = scheduler or self.SCHEDULER_CLASS()
+        self.journal = journal
+        self._timer = None
         self._is_internal_queue = isinstance(
             self.queue, self.DEFAULT_QUEUE_CLASS,
         )
+        self._has_queue_done = getattr(
+            type(self.queue), 'done_request', None,
+        ) not in (None, BaseQueue.done_request)
 
-    def response_callback(self, crawler, response):  # asyncio: async
+    def response_callback(self, crawler, response):
         try:
             if not isinstance(response, BaseCrawlException):
-                self.on_response(crawler, response)  # asyncio: await
+                self.on_response(crawler, response)
             else:
-                self._request_done(response, crawler)  # asyncio: await
+                self._request_done(response, crawler)
         except Exception as e:
             log.exception("On response processing")
-            self._exception_middlewares(  # asyncio: await
+            self._exception_middlewares(
                 BaseCrawlException(
                     request=response.get_request(),
                     response=response,
@@ -102,49 +179,44 @@ class Pomp(BaseEngine):
                 crawler,
             )
 
-    def on_parse_result(self, crawler, result, response):  # asyncio: async
-        if isinstance(result, types.GeneratorType):
-            for items in result:
-                for request in self._process_items(crawler, iterator(items), response=response):  # asyncio: async  # noqa
-                    self._put_requests(   # asyncio: await
-                        iterator(request),
-                        crawler=crawler,
-                        response=response,
-                    )
-        else:
-            for request in self._process_items(crawler, iterator(result), response=response):  # asyncio: async  # noqa
-                self._put_requests(   # asyncio: await
-                    iterator(request),
-                    crawler=crawler,
-                    response=response,
-                )
+    def on_parse_result(self, crawler, result, response):
+        try:
+            # collect requests of the page and put them to the queue at once
+            requests = []
+            if isinstance(result, types.GeneratorType):
+                for items in result:
+                    for request in self._process_items(
+                            crawler, iterator(items), response=response):
+                        requests.extend(iterator(request))
+            else:
+                for request in self._process_items(
+                        crawler, iterator(result), response=response):
+                    requests.extend(iterator(request))
 
-        next_requests = (
-            crawler.next_requests(response)  # asyncio: await _co(REPLACE)
-        )
+            next_requests = (
+                crawler.next_requests(response)
+            )
 
-        if hasattr(next_requests, '__anext__'):  # support async generators
-            for request in next_requests:  # asyncio: async
-                self._put_requests(  # asyncio: await
-                    iterator(request),
-                    crawler=crawler,
-                    response=response,
-                )
-        else:
-            self._put_requests(  # asyncio: await
-                iterator(next_requests),
+            if hasattr(next_requests, '__anext__'):  # support async generators
+                for request in next_requests:
+                    requests.extend(iterator(request))
+            elif next_requests is not None:
+                requests.extend(iterator(next_requests))
+
+            self._put_requests(
+                requests,
                 crawler=crawler,
                 response=response,
             )
+        finally:
+            self._request_done(response, crawler)
 
-        self._request_done(response, crawler)  # asyncio: await
-
-    def on_response(self, crawler, response):  # asyncio: async
+    def on_response(self, crawler, response):
 
         try:
-            result = crawler.process(response)  # asyncio: await _co(REPLACE)
+            result = crawler.process(response)
         except Exception as e:
-            self._exception_middlewares(e, crawler)  # asyncio: await
+            self._exception_middlewares(e, crawler)
             result = None
 
         if hasattr(result, 'add_done_callback'):  # if Planned or Future object
@@ -152,67 +224,90 @@ class Pomp(BaseEngine):
             def _(r):
                 result = r.result()
                 if isinstance(result, BaseCrawlException):
-                    def x():  # asyncio: async
-                        self._exception_middlewares(result, crawler)  # asyncio: await  # noqa
-                        self._request_done(response, crawler)  # asyncio: await  # noqa
-                    x()  # asyncio: ensure_future(REPLACE)
+                    def x():
+                        self._exception_middlewares(result, crawler)
+                        self._request_done(response, crawler)
+                    x()
                 else:
-                    self.on_parse_result(crawler, result, response)  # asyncio: ensure_future(REPLACE)  # noqa
+                    self.on_parse_result(crawler, result, response)
 
             result.add_done_callback(_)
 
         else:
-            self.on_parse_result(crawler, result, response)  # asyncio: await
+            self.on_parse_result(crawler, result, response)
 
-    def process_requests(self, requests, crawler):  # asyncio: async
+    def process_requests(self, requests, crawler):
 
         # process requests by middlewares
-        for request in self._req_middlewares(requests, crawler):  # asyncio: async  # noqa
+        for request in self._req_middlewares(requests, crawler):
 
             if isinstance(request, BaseCrawlException):
-                self._resp_middlewares(request, crawler)  # asyncio: await
+                # request processing is already done by middlewares
+                self._resp_middlewares(request, crawler)
                 continue
 
-            # execute requests by downloader
-            try:
-                response = self.downloader.process(crawler, request)  # asyncio: _wrap_to_future(REPLACE)  # noqa
-            except Exception as e:
-                log.exception("On downloader process")
-                self._exception_middlewares(  # asyncio: await
-                    BaseCrawlException(
-                        request=request,
-                        response=None,
-                        exception=e,
-                        exc_info=sys.exc_info(),
-                    ),
-                    crawler,
-                )
-                self._request_done(None, crawler)  # asyncio: await
+            if isinstance(request, BaseResponse):
+                # download is skipped by middlewares
+                self._process_response(request, crawler)
                 continue
 
-            if isinstance(response, (BaseResponse, BaseCrawlException)):
-                # process response by crawler
-                self.response_callback(  # asyncio: await
-                    crawler,
-                    # pass response to middlewares
-                    self._resp_middlewares(response, crawler)  # asyncio: await  # noqa
+            # hold host slot while request is downloading, request to busy
+            # host is parked and downloaded when the slot is released
+            self.scheduler.acquire_host(
+                request, callback=lambda r: self._download(r, crawler),
+            )
+
+    def _download(self, request, crawler):
+        # execute requests by downloader
+        try:
+            response = self.downloader.process(crawler, request)
+        except Exception as e:
+            log.exception("On downloader process")
+            self.scheduler.release_host(request, failed=True)
+            exception = BaseCrawlException(
+                request=request,
+                response=None,
+                exception=e,
+                exc_info=sys.exc_info(),
+            )
+            self._exception_middlewares(exception, crawler)
+            self._request_done(exception, crawler)
+            return
+
+        if isinstance(response, (BaseResponse, BaseCrawlException)):
+            self.scheduler.release_host(
+                request, failed=isinstance(response, BaseCrawlException),
+            )
+            # process response by middlewares and crawler
+            self._process_response(response, crawler)
+        else:  # async behaviour
+            def _(r):
+                try:
+                    result = r.result()
+                except BaseException:
+                    self.scheduler.release_host(request, failed=True)
+                    raise
+                self.scheduler.release_host(
+                    request, failed=isinstance(result, BaseCrawlException),
                 )
-            else:  # async behaviour
-                def _(r):
-                    def x():  # asyncio: async
-                        response = self._resp_middlewares(r.result(), crawler)  # asyncio: await  # noqa
-                        self.response_callback(crawler, response)  # asyncio: ensure_future(REPLACE) # noqa
-                    x()  # asyncio: ensure_future(REPLACE)
-                response.add_done_callback(_)
-
-    def prepare(self, crawler):  # asyncio: async
-        # prepare middleware chain
-        self.request_middlewares = self.middlewares
-        self.response_middlewares = self.middlewares[:]
-        self.response_middlewares.reverse()
+                self._process_response(result, crawler)
+            response.add_done_callback(_)
+
+    def _process_response(self, response, crawler):
+        # pass response to middlewares
+        processed = self._resp_middlewares(response, crawler)
+        if processed is None:
+            # response skipped by middlewares
+            self._request_done(response, crawler)
+        else:
+            # process response by crawler
+            self.response_callback(crawler, processed)
+
+    def prepare(self, crawler):
+        self._prepare_middlewares()
 
         log.info('Prepare downloader: %s', self.downloader)
-        self.downloader.start(crawler)  # asyncio: await _co(REPLACE)
+        self.downloader.start(crawler)
         self.in_progress = 0
 
         log.info('Start crawler: %s', crawler)
@@ -220,10 +315,10 @@ class Pomp(BaseEngine):
         for pipe in self.pipelines:
             log.info('Start pipe: %s', pipe)
             try:
-                pipe.start(crawler)  # asyncio: await _co(REPLACE)
+                pipe.start(crawler)
             except Exception as e:
                 log.exception("On pipe start")
-                self._exception_middlewares(  # asyncio: await
+                self._exception_middlewares(
                     BaseCrawlException(
                         request=None,
                         response=None,
@@ -233,15 +328,26 @@ class Pomp(BaseEngine):
                     crawler,
                 )
 
-        # configure queue semaphore
-        self.queue_lock = self.get_queue_lock()
+        self._prepare_scheduler()
+
+    def _prepare_middlewares(self):
+        # prepare middleware chain
+        self.request_middlewares = self.middlewares
+        self.response_middlewares = self.middlewares[:]
+        self.response_middlewares.reverse()
+
+    def _prepare_scheduler(self):
+        # limit requests in flight by downloader workers count
+        workers_count = self.downloader.get_workers_count()
+        if self.scheduler.limit is None and workers_count >= 1:
+            self.scheduler.limit = workers_count
 
-    def finish(self, crawler):  # asyncio: async
+    def finish(self, crawler):
         try:
-            self.downloader.stop(crawler)  # asyncio: await _co(REPLACE)
+            self.downloader.stop(crawler)
         except Exception as e:
             log.exception("On downloader stop")
-            self._exception_middlewares(  # asyncio: await
+            self._exception_middlewares(
                 BaseCrawlException(
                     request=None,
                     response=None,
@@ -253,10 +359,10 @@ class Pomp(BaseEngine):
         for pipe in self.pipelines:
             log.info('Stop pipe: %s', pipe)
             try:
-                pipe.stop(crawler)  # asyncio: await _co(REPLACE)
+                pipe.stop(crawler)
             except Exception as e:
                 log.exception("On pipe stop")
-                self._exception_middlewares(  # asyncio: await
+                self._exception_middlewares(
                     BaseCrawlException(
                         request=None,
                         response=None,
@@ -274,39 +380,39 @@ class Pomp(BaseEngine):
         """
         self.prepare(crawler)
 
-        # add ENTRY_REQUESTS to the queue
-        next_requests = getattr(crawler, 'ENTRY_REQUESTS', None)
-        if next_requests:
-            self._put_requests(
-                iterator(next_requests), None,
-            )
+        replayed = self.journal.replay() if self.journal is not None else None
+        if replayed:
+            # resume interrupted crawl, requests are already journaled
+            self.queue.put_requests(self._count_requests(replayed))
+        else:
+            # add ENTRY_REQUESTS to the queue
+            next_requests = getattr(crawler, 'ENTRY_REQUESTS', None)
+            if next_requests:
+                self._put_requests(
+                    iterator(next_requests), None,
+                )
 
         while True:
 
-            if self.queue_lock and self.queue_semaphore_value <= 0:
-                self.queue_lock.acquire(True)
+            # wait for free slot
+            self.scheduler.wait()
 
             next_requests = self.queue.get_requests(
-                count=self.queue_semaphore_value
+                count=self.scheduler.available()
             )
 
             if isinstance(next_requests, StopCommand):
                 break
 
-            self.process_requests(
-                iterator(next_requests), crawler,
-            )
+            for request in iterator(next_requests):
+                if not request:
+                    continue
+                self.scheduler.acquire()
+                self.process_requests((request, ), crawler)
 
         self.finish(crawler)
 
-    def get_queue_lock(self):
-        workers_count = self.downloader.get_workers_count()
-        if workers_count >= 1:
-            self.workers_count = workers_count
-            self.queue_semaphore_value = workers_count
-            return self.LOCK_FACTORY()
-
-    def _process_items(self, crawler, items, response=None):  # asyncio: async
+    def _process_items(self, crawler, items, response=None):
 
         for item in items:
 
@@ -320,10 +426,10 @@ class Pomp(BaseEngine):
                 # proccess item as data item by pipes
                 for pipe in self.pipelines:
                     try:
-                        item = pipe.process(crawler, item)  # asyncio: await _co(REPLACE)  # noqa
+                        item = pipe.process(crawler, item)
                     except Exception as e:
                         log.exception("On pipe process")
-                        self._exception_middlewares(  # asyncio: await
+                        self._exception_middlewares(
                             BaseCrawlException(
                                 request=response.get_request(),
                                 response=response,
@@ -341,17 +447,16 @@ class Pomp(BaseEngine):
                             )
                             break
 
-    def _req_middlewares(self, requests, crawler):  # asyncio: async
+    def _req_middlewares(self, requests, crawler):
         # pass requests to middlewares
         for request in requests:
-
-            # decrement count of available requests to fetch
-            if self.queue_lock:
-                self.queue_semaphore_value -= 1
+            source = request
 
             for middleware in self.request_middlewares:
                 try:
-                    request = middleware.process_request(request, crawler, self.downloader)  # asyncio: await _co(REPLACE) # noqa
+                    request = middleware.process_request(
+                        request, crawler, self.downloader,
+                    )
                 except Exception as e:
                     log.exception(
                         'Exception on process %s by %s', request, middleware)
@@ -368,31 +473,37 @@ class Pomp(BaseEngine):
                     # mark to stop request processing
                     request = None
 
+                # response instead of download, e.g. from cache
+                if isinstance(request, BaseResponse):
+                    break
+
                 # stop middleware chain
                 if not request:
                     log.debug(
                         "Stop request processing. Middleware %s on %s",
                         middleware, request,
                     )
-                    self._request_done(None, crawler)  # asyncio: await
+                    self._request_done(None, crawler, request=source)
                     break
 
             if request:
                 yield request
 
-    def _resp_middlewares(self, response, crawler):  # asyncio: async
+    def _resp_middlewares(self, response, crawler):
         # pass response to middlewares
-        is_error = isinstance(response, BaseCrawlException)
-        func = 'process_response' if not is_error else 'process_exception'
-
         for middleware in self.response_middlewares:
+            # exception may be replaced by response, e.g. from cache
+            is_error = isinstance(response, BaseCrawlException)
+            func = 'process_response' if not is_error else 'process_exception'
             try:
-                value = getattr(middleware, func)(response, crawler, self.downloader)  # asyncio: await _co(REPLACE) # noqa
+                value = getattr(middleware, func)(
+                    response, crawler, self.downloader,
+                )
             except Exception as e:
                 log.exception(
                     'Exception on process %s by %s', response, middleware,
                 )
-                response = self._exception_middlewares(  # asyncio: await
+                response = self._exception_middlewares(
                     BaseCrawlException(
                         request=response.get_request() if isinstance(response, BaseHttpResponse) else None,  # noqa
                         response=response,
@@ -402,22 +513,30 @@ class Pomp(BaseEngine):
                     crawler,
                 )
                 value = None  # stop processing response by middlewares
+            if isinstance(value, BaseRequest):
+                # request is returned to the queue, e.g. for retry
+                self._put_returned_request(value, crawler)
+                return None
             if not value:
                 log.debug(
                     "Stop response processing. Middleware %s on %s",
                     middleware, response,
                 )
-                self._request_done(response, crawler)  # asyncio: await
-                break
+                return None
             response = value
 
         return response
 
-    def _exception_middlewares(self, exception, crawler):  # asyncio: async
+    def _exception_middlewares(self, exception, crawler):
         value = None
         for middleware in self.response_middlewares:
             try:
-                value = middleware.process_exception(exception, crawler, self.downloader)  # asyncio: await _co(REPLACE)  # noqa
+                value = middleware.process_exception(
+                    exception, crawler, self.downloader,
+                )
+                if isinstance(value, BaseRequest):
+                    self._put_returned_request(value, crawler)
+                    return None
                 if value is None:  # stop processing exception
                     log.debug(
                         "Stop exception processing. Middleware %s on %s",
@@ -430,16 +549,22 @@ class Pomp(BaseEngine):
                 )
         return value
 
-    def _put_requests(self, requests, response=None, crawler=None):  # asyncio: async  # noqa
+    def _put_requests(
+            self, requests, response=None, crawler=None, not_before=None):
 
-        def _put(items):  # asyncio: async
+        def _put(items):
+            items = self._count_requests(items, response)
             if not items:
                 return
-            for item in items:
-                if not item:
-                    continue
-                self.in_progress += 1
-                self.queue.put_requests(item)  # asyncio: await _co(REPLACE)
+            self._journal_put(items)
+            if not_before is not None and not_before > time.time():
+                # delayed requests are counted in progress, but do not
+                # hold slots of the scheduler while they wait
+                if self._timer is None:
+                    self._timer = Timer(name='pomp-delayed')
+                self._timer.call_at(not_before, self.queue.put_requests, items)
+            else:
+                self.queue.put_requests(items)
 
         if hasattr(requests, 'add_done_callback'):
             # "hold" engine and wait future/planned
@@ -447,35 +572,101 @@ class Pomp(BaseEngine):
 
             def _(r):
                 self.in_progress -= 1
-                _put(r.result())  # asyncio: ensure_future(REPLACE)
+                _put(r.result())
 
             requests.add_done_callback(_)
         else:
-            _put(requests)  # asyncio: await
-
-    def _request_done(self, response, crawler):  # asyncio: async
-        if self.queue_lock:
-            # increment counter, but not more then workers count
-            self.queue_semaphore_value = min(
-                self.workers_count,
-                self.queue_semaphore_value + 1,
-            )
-            if self.queue_semaphore_value > 0 and self.queue_lock.locked():
-                self.queue_lock.release()
+            _put(requests)
+
+    def _put_returned_request(self, request, crawler):
+        # request returned by response middlewares is put to the queue
+        # not before its `not_before` timestamp
+        self._put_requests(
+            (request, ), crawler=crawler,
+            not_before=getattr(request, 'not_before', None),
+        )
+
+    def _count_requests(self, requests, response=None):
+        # count requests in progress before put them to the queue
+        requests = [request for request in requests or () if request]
+        if not requests:
+            return None
+        if response is not None:
+            self._set_depth(requests, response)
+        self.in_progress += len(requests)
+        # bulk put of many requests
+        return requests if len(requests) > 1 else requests[0]
+
+    def _set_depth(self, requests, response):
+        # follow-up requests are one level deeper than request of response
+        get_request = getattr(response, 'get_request', None)
+        depth = getattr(get_request(), 'depth', 0) + 1 if get_request else 1
+        for request in requests:
+            if isinstance(request, BaseRequest) and \
+                    getattr(request, 'depth', None) is None:
+                try:
+                    request.depth = depth
+                except AttributeError:
+                    pass
+
+    def _journal_put(self, requests):
+        if self.journal is not None:
+            self.journal.put(iterator(requests))
+
+    def _get_done_request(self, response, request):
+        # request taken from the queue, done by response or exception
+        if request is None:
+            request = getattr(response, 'request', None) \
+                if isinstance(response, BaseCrawlException) else None
+            get_request = getattr(response, 'get_request', None)
+            if request is None and get_request is not None:
+                request = get_request()
+        if request is None:
+            log.warning('Done request is unknown for %s', response)
+        return request
+
+    def _journal_done(self, request):
+        if self.journal is None:
+            return
+        try:
+            self.journal.done(request)
+        except Exception:
+            log.exception('On journal done of %s', request)
+
+    def _queue_done(self, request):
+        # queues with leases acknowledge done requests
+        done_request = getattr(self.queue, 'done_request', None)
+        if done_request is None:
+            return None
+        try:
+            return done_request(request)
+        except Exception:
+            log.exception('On queue done of %s', request)
 
+    def _is_done(self):
+        # free slot of the done request
+        self.scheduler.release()
         self.in_progress -= 1
 
-        # send StopCommand if all jobs are done and running on internal queue
-        if self._is_internal_queue and self.in_progress == 0:
+        # all jobs are done and running on internal queue
+        return self._is_internal_queue and self.in_progress == 0
+
+    def _request_done(self, response, crawler, request=None):
+        if self.journal is not None or self._has_queue_done:
+            request = self._get_done_request(response, request)
+            if request is not None:
+                self._journal_done(request)
+                self._queue_done(request)
+        if self._is_done():
             # work done
-            self.queue.put_requests(StopCommand())  # asyncio: await
+            self.queue.put_requests(StopCommand())
 
         # response processing complete
         try:
-            crawler.on_processing_done(response)  # asyncio: await _co(REPLACE)
+            crawler.on_processing_done(response)
         except Exception as e:
             log.exception("On done processing exception")
-            self._exception_middlewares(  # asyncio: await
+            self._exception_middlewares(
                 BaseCrawlException(
                     request=response.get_request(),
                     response=response,
@@ -484,3 +675,16 @@ class Pomp(BaseEngine):
                 ),
                 crawler,
             )
+        finally:
+            self._release_response(response)
+
+    def _release_response(self, response):
+        if isinstance(response, BaseCrawlException):
+            response = response.response
+        release = getattr(response, 'release', None)
+        if release is None:
+            return
+        try:
+            release()
+        except Exception:
+            log.exception("On response release")
@@ -0,0 +1,381 @@
+"""
+In-flight scheduler
+"""
+import time
+import logging
+import threading
+from collections import deque, OrderedDict
+
+try:
+    from urllib.parse import urlsplit
+except ImportError:  # pragma: no cover
+    from urlparse import urlsplit
+
+from pomp.core.utils import Timer
+
+
+log = logging.getLogger('pomp.scheduler')
+
+
+class InFlightScheduler(object):
+    """Bounded scheduler of requests in flight with politeness to hosts
+
+    Engine acquires global slot for each request taken from the queue and
+    releases it when request processing is done. Host slot is held by
+    request while it is being downloaded.
+
+    Politeness to hosts:
+
+    - `per_host_limit` and `host_limits` - max count of requests
+      downloaded at the same time from one host
+    - `delay` and `host_delays` - min delay in seconds between starts of
+      downloads from one host
+    - `autothrottle` - delay of host follows observed download latency
+      divided by `target_concurrency`, it is not lower than min delay of
+      the host and not higher than `max_delay`, failed downloads do not
+      decrease it
+
+    Thread safe, `acquire` and `wait` block the calling thread. Request to
+    busy or delayed host is parked by `acquire_host` with callback and
+    gives back its global slot, so requests to other hosts are not
+    blocked. Parked request takes global slot again and is passed to
+    callback when the host is ready - by `release_host`, `release` or by
+    timer thread of delays. Parked requests are resumed before new
+    requests take global slots, `wait` blocks while count of parked
+    requests reaches `max_parked`.
+
+    :param limit: max count of requests in flight, ``None`` - unlimited.
+                  Engine uses workers count of the downloader if not set.
+    :param per_host_limit: max count of requests downloaded at the same time
+                           from one host, ``None`` - unlimited
+    :param host_limits: dict of `per_host_limit` values by host
+    :param delay: min delay in seconds between downloads from one host
+    :param host_delays: dict of `delay` values by host
+    :param autothrottle: adjust delay of host by latency
+    :param target_concurrency: average count of requests downloaded from
+                               one host at the same time by autothrottle
+    :param max_delay: max delay in seconds set by autothrottle
+    :param max_parked: max count of parked requests, ``None`` - unlimited
+    """
+
+    def __init__(
+            self, limit=None, per_host_limit=None, host_limits=None,
+            delay=0, host_delays=None, autothrottle=False,
+            target_concurrency=1.0, max_delay=60, max_parked=10000):
+        self.limit = limit
+        self.per_host_limit = per_host_limit
+        self.host_limits = host_limits or {}
+        self.delay = delay
+        self.host_delays = host_delays or {}
+        self.autothrottle = autothrottle
+        self.target_concurrency = target_concurrency
+        self.max_delay = max_delay
+        self.max_parked = max_parked
+
+        self.in_flight = 0
+        self.waiting = 0
+        self.acquired = 0
+        self.wait_time = 0
+        self.max_wait_time = 0
+        self.hosts = {}
+        # host -> deque of parked (request, callback)
+        self.parked = {}
+        self.parked_count = 0
+        # host -> delay adjusted by autothrottle
+        self.delays = {}
+        # host -> time of the next download start
+        self.next_at = {}
+
+        # hosts with parked requests waiting for global slot
+        self._ready = OrderedDict()
+        # hosts with armed timer of delay
+        self._timers = set()
+        self._timer = None
+        # id of request -> download start time for autothrottle
+        self._started = {}
+        self._condition = threading.Condition()
+        self._local = threading.local()
+
+    def get_host(self, request):
+        """Host of request for per host limit
+
+        :param request: instance of :class:`pomp.core.base.BaseRequest`
+        :rtype: host or ``None`` if request does not have url
+        """
+        url = getattr(request, 'url', None)
+        return urlsplit(url).netloc or None if url else None
+
+    def get_delay(self, host):
+        """Current delay between downloads from host
+
+        :param host: host
+        :rtype: delay in seconds
+        """
+        if self.autothrottle:
+            delay = self.delays.get(host)
+            if delay is not None:
+                return delay
+        return self.host_delays.get(host, self.delay)
+
+    def available(self):
+        """Count of free slots
+
+        :rtype: count or ``None`` if scheduler is unlimited
+        """
+        if self.limit is None:
+            return None
+        return max(0, self.limit - self.in_flight)
+
+    def wait(self):
+        """Block until global slot is free"""
+        with self._condition:
+            self._wait_for(self._is_free)
+
+    def acquire(self):
+        """Acquire global slot, block until it is free"""
+        with self._condition:
+            self._wait_for(self._is_free)
+            self._take()
+
+    def release(self):
+        """Release global slot
+
+        Slot is passed to parked request of ready host if any.
+        """
+        with self._condition:
+            self.in_flight -= 1
+            runnable = self._resume_ready(time.time())
+            self._condition.notify_all()
+        self._run_callbacks(runnable)
+
+    def acquire_host(self, request, callback=None):
+        """Acquire host slot for request
+
+        Without `callback` block until slot is free and delay of host is
+        passed. With `callback` never block - ``callback(request)`` is
+        called at once if host is ready, otherwise request is parked and
+        callback is called with request holding host and global slots
+        when host is ready.
+
+        :param request: instance of :class:`pomp.core.base.BaseRequest`
+        :param callback: called with request holding host slot
+        """
+        if not self.is_polite():
+            if callback is not None:
+                self._run_callback(request, callback)
+            return
+        host = self.get_host(request)
+        with self._condition:
+            if callback is None:
+                self._wait_for(
+                    lambda: self._can_start(host, time.time()),
+                    lambda: self.next_at.get(host),
+                )
+                self._take_host(host, request, time.time())
+                return
+            now = time.time()
+            if self.parked.get(host) or not self._can_start(host, now):
+                self.parked.setdefault(host, deque()).append(
+                    (request, callback),
+                )
+                self.parked_count += 1
+                # parked request does not hold global slot
+                self.in_flight -= 1
+                self._arm_timer(host, now)
+                runnable = self._resume_ready(now)
+                self._condition.notify_all()
+            else:
+                self._take_host(host, request, now)
+                runnable = ((request, callback), )
+        self._run_callbacks(runnable)
+
+    def release_host(self, request, failed=False):
+        """Release host slot of request
+
+        Slot is passed to the first parked request of the host if host
+        is ready.
+
+        :param request: instance of :class:`pomp.core.base.BaseRequest`
+        :param failed: download is failed, autothrottle does not decrease
+                       delay of the host by its latency
+        """
+        if not self.is_polite():
+            return
+        host = self.get_host(request)
+        now = time.time()
+        with self._condition:
+            started = self._started.pop(id(request), None)
+            if self.autothrottle and started is not None:
+                self._throttle(host, now - started, failed)
+            self._release_host(host)
+            runnable = self._resume(host, now)
+            self._condition.notify_all()
+        self._run_callbacks(runnable)
+
+    def is_polite(self):
+        """Scheduler limits hosts
+
+        :rtype: ``False`` if host slots are not used
+        """
+        return self.per_host_limit is not None or bool(self.host_limits) \
+            or bool(self.delay) or bool(self.host_delays) \
+            or self.autothrottle
+
+    def get_stats(self):
+        """Live stats
+
+        :rtype: dict with `in_flight`, `waiting` - count of blocked
+                acquirers, `acquired` - total count of acquired slots,
+                `wait_time` and `max_wait_time` in seconds,
+                `hosts` - in flight requests by host,
+                `parked` - count of requests waiting for host,
+                `delays` - delays in seconds by host set by autothrottle
+        """
+        return {
+            'in_flight': self.in_flight,
+            'waiting': self.waiting,
+            'acquired': self.acquired,
+            'wait_time': self.wait_time,
+            'max_wait_time': self.max_wait_time,
+            'hosts': dict(self.hosts),
+            'parked': self.parked_count,
+            'delays': dict(self.delays),
+        }
+
+    def _throttle(self, host, latency, failed):
+        # same as autothrottle of scrapy - move delay halfway to latency
+        # divided by target concurrency
+        delay = self.get_delay(host)
+        target = latency / float(self.target_concurrency)
+        new_delay = max(target, (delay + target) / 2.0)
+        new_delay = min(
+            max(self.host_delays.get(host, self.delay), new_delay),
+            self.max_delay,
+        )
+        if failed and new_delay < delay:
+            return
+        self.delays[host] = new_delay
+
+    def _resume(self, host, now):
+        # take slots for parked requests of ready host
+        parked = self.parked.get(host)
+        runnable = []
+        while parked and self._can_start(host, now):
+            if not self._has_slot():
+                # resumed by release of global slot
+                self._ready[host] = True
+                break
+            request, callback = parked.popleft()
+            self.parked_count -= 1
+            # slot given back on parking is not counted as acquired
+            self.in_flight += 1
+            self._take_host(host, request, now)
+            runnable.append((request, callback))
+        if parked:
+            self._arm_timer(host, now)
+        else:
+            self.parked.pop(host, None)
+        return runnable
+
+    def _resume_ready(self, now):
+        runnable = []
+        while self._ready and self._has_slot():
+            host, _ = self._ready.popitem(last=False)
+            runnable.extend(self._resume(host, now))
+        return runnable
+
+    def _arm_timer(self, host, now):
+        next_at = self.next_at.get(host)
+        if next_at is None or next_at <= now or host in self._timers or \
+                not self._is_host_free(host):
+            return
+        self._timers.add(host)
+        if self._timer is None:
+            self._timer = Timer(name='pomp-scheduler')
+        self._timer.call_at(next_at, self._on_timer, host)
+
+    def _on_timer(self, host):
+        with self._condition:
+            self._timers.discard(host)
+            runnable = self._resume(host, time.time())
+            self._condition.notify_all()
+        self._run_callbacks(runnable)
+
+    def _run_callbacks(self, runnable):
+        for request, callback in runnable:
+            self._run_callback(request, callback)
+
+    def _run_callback(self, request, callback):
+        # callback may release host slot and run callback of parked request
+        # in the same thread - run them one by one without recursion
+        pending = getattr(self._local, 'pending', None)
+        if pending is not None:
+            pending.append((request, callback))
+            return
+        self._local.pending = pending = deque([(request, callback)])
+        try:
+            while pending:
+                request, callback = pending.popleft()
+                try:
+                    callback(request)
+                except Exception:
+                    log.exception('On host slot callback of %s', request)
+        finally:
+            self._local.pending = None
+
+    def _has_slot(self):
+        return self.limit is None or self.in_flight < self.limit
+
+    def _is_free(self):
+        # slots of parked requests are taken before new requests
+        return self._has_slot() and not self._ready and (
+            self.max_parked is None or self.parked_count < self.max_parked
+        )
+
+    def _is_host_free(self, host):
+        limit = self.host_limits.get(host, self.per_host_limit)
+        return limit is None or self.hosts.get(host, 0) < limit
+
+    def _can_start(self, host, now):
+        return self._is_host_free(host) and \
+            self.next_at.get(host, 0) <= now
+
+    def _take(self):
+        self.in_flight += 1
+        self.acquired += 1
+
+    def _take_host(self, host, request, now):
+        self.hosts[host] = self.hosts.get(host, 0) + 1
+        delay = self.get_delay(host)
+        if delay:
+            self.next_at[host] = now + delay
+        if self.autothrottle:
+            self._started[id(request)] = now
+
+    def _release_host(self, host):
+        count = self.hosts.get(host, 0) - 1
+        if count > 0:
+            self.hosts[host] = count
+        else:
+            self.hosts.pop(host, None)
+
+    def _account_wait(self, started):
+        waited = time.time() - started
+        self.wait_time += waited
+        self.max_wait_time = max(self.max_wait_time, waited)
+
+    def _wait_for(self, predicate, get_wake_at=None):
+        if predicate():
+            return
+        started = time.time()
+        self.waiting += 1
+        try:
+            while not predicate():
+                wake_at = get_wake_at() if get_wake_at else None
+                self._condition.wait(
+                    None if wake_at is None
+                    else max(0, wake_at - time.time())
+                )
+        finally:
+            self.waiting -= 1
+            self._account_wait(started)
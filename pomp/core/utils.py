@@ -1,8 +1,11 @@
 import sys
+import time
+import heapq
 import types
 import logging
 import inspect
 import itertools
+import threading
 
 
 PY3 = False if sys.version_info < (3, 0) else True
@@ -27,6 +30,55 @@ def isstring(obj):
     return isinstance(obj, str)
 
 
+class Timer(object):
+    """Call functions at given time by one daemon thread
+
+    Thread is started on demand and exits when there are no scheduled
+    calls. Functions are called one by one in the thread of timer.
+    """
+
+    def __init__(self, name='pomp-timer'):
+        self.name = name
+        self._heap = []
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def call_at(self, when, func, *args):
+        """Call ``func(*args)`` at `when` timestamp of `time.time()`"""
+        with self._condition:
+            # counter keeps order of calls with the same time
+            heapq.heappush(self._heap, (when, next(self._counter), func, args))
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name=self.name,
+                )
+                self._thread.daemon = True
+                self._thread.start()
+            else:
+                self._condition.notify()
+
+    def __len__(self):
+        return len(self._heap)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while True:
+                    if not self._heap:
+                        self._thread = None
+                        return
+                    timeout = self._heap[0][0] - time.time()
+                    if timeout <= 0:
+                        break
+                    self._condition.wait(timeout)
+                _, _, func, args = heapq.heappop(self._heap)
+            try:
+                func(*args)
+            except Exception:
+                log.exception('On timer call of %s', func)
+
+
 def switch_to_asyncio(method, skip_spaces=4):
     for line in inspect.getsourcelines(method)[0]:
         if '# asyncio:' not in line:
@@ -2,6 +2,8 @@ import os
 import sys
 import time
 import json
+import gzip
+import zlib
 import logging
 import multiprocessing
 from wsgiref.util import setup_testing_defaults
@@ -50,9 +52,52 @@ def sitemap_app(environ, start_response):
     status = '200 OK'
     headers = [('Content-type', 'text/plain')]
 
+    requested_url = environ['PATH_INFO']
+    if requested_url == '/bomb':
+        # small compressed body expanded to 10 MiB
+        start_response(status, headers + [('Content-Encoding', 'gzip')])
+        return [bomb_body()]
+
+    if requested_url.startswith('/flaky/'):
+        # /flaky/<key>/<count> fails first `count` times with 503
+        count = requested_url.rsplit('/', 1)[-1]
+        hits = flaky_hits[requested_url] = \
+            flaky_hits.get(requested_url, 0) + 1
+        if hits <= int(count):
+            start_response(
+                '503 Service Unavailable',
+                headers + [('Retry-After', '0')],
+            )
+            return [b'']
+        start_response(status, headers)
+        return [json.dumps({'hits': hits}).encode('utf-8')]
+
+    # sitemap pages are compressed if client accepts it and are not
+    # changed for conditional requests
+    encoding = None
+    if requested_url not in ('/tarpit', '/big', '/endless', '/sleep'):
+        etag = '"%s"' % zlib.crc32(requested_url.encode('utf-8'))
+        if environ.get('HTTP_IF_NONE_MATCH') == etag:
+            start_response('304 Not Modified', [('ETag', etag)])
+            return []
+        headers.append(('ETag', etag))
+        for coding in ('gzip', 'deflate'):
+            if coding in environ.get('HTTP_ACCEPT_ENCODING', ''):
+                encoding = coding
+                headers.append(('Content-Encoding', coding))
+                break
+
     start_response(status, headers)
 
-    requested_url = environ['PATH_INFO']
+    if requested_url == '/tarpit':
+        # slow body transfer
+        return tarpit_body()
+    if requested_url == '/big':
+        # body with content length
+        return [b'x' * 1024 * 1024]
+    if requested_url == '/endless':
+        # body without content length
+        return endless_body()
     if requested_url == '/sleep':
         time.sleep(2)
         response = 'Done'
@@ -63,10 +108,35 @@ def sitemap_app(environ, start_response):
         ret = [json.dumps(response).encode('utf-8')]
     except Exception:
         log.exception("bla-bla")
+    if encoding == 'gzip':
+        ret = [gzip.compress(ret[0])]
+    elif encoding == 'deflate':
+        ret = [zlib.compress(ret[0])]
     log.debug('Requested url: %s, ret: %s', requested_url, ret)
     return ret
 
 
+# hits of flaky urls in the server process
+flaky_hits = {}
+
+
+def bomb_body(size=10 * 1024 * 1024):
+    if not hasattr(bomb_body, 'body'):
+        bomb_body.body = gzip.compress(b'\0' * size)
+    return bomb_body.body
+
+
+def tarpit_body(chunks=20, delay=0.1):
+    for _ in range(chunks):
+        time.sleep(delay)
+        yield b' '
+
+
+def endless_body(chunk_size=64 * 1024, limit=1024 * 1024 * 1024):
+    for _ in range(limit // chunk_size):
+        yield b'x' * chunk_size
+
+
 def make_reponse_body(items, links):
     return {
         'items': items,
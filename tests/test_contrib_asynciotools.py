@@ -1,4 +1,6 @@
+import os
 import sys
+import signal
 import pytest
 
 asyncio = pytest.importorskip("asyncio")  # noqa
@@ -20,7 +22,7 @@ from pomp.core.utils import Planned
 
 
 from mockserver import HttpServer, make_sitemap
-from tools import DummyCrawler
+from tools import DummyCrawler, DummyRequest, DummyResponse
 from tools import RequestResponseMiddleware, CollectRequestResponseMiddleware
 
 
@@ -94,7 +96,7 @@ class AiohttpDownloader(BaseDownloader):
 
     async def stop(self, *args, **kwargs):
         log.debug("[AiohttpDownloader] Close session")
-        self.session.close()
+        await self.session.close()
 
     async def _fetch(self, request, future=None):
         log.debug("[AiohttpDownloader] Start fetch: %s", request.url)
@@ -177,7 +179,7 @@ class TestContribAsyncio(object):
     def teardown_class(cls):
         cls.httpd.stop()
 
-    def setup(self):
+    def setup_method(self):
         self.req_resp_midlleware = RequestResponseMiddleware(
             prefix_url=self.httpd.location,
             request_factory=lambda x: x,
@@ -292,3 +294,307 @@ class TestContribAsyncio(object):
         assert sync_pipeline.items_count
         assert async_pipeline.items_count
         assert sync_pipeline.items_count == async_pipeline.items_count
+
+
+def test_native_coroutine_methods():
+    # engine methods are defined in the module, not built from
+    # sources of the sync engine
+    import inspect
+    import pomp.contrib.asynciotools
+
+    for name in (
+            'prepare', 'finish', 'pump', 'process_requests',
+            'response_callback', 'on_response', 'on_parse_result',
+            '_process_response', '_put_requests', '_request_done',
+            '_resp_middlewares', '_exception_middlewares'):
+        method = getattr(AioPomp, name)
+        assert inspect.iscoroutinefunction(method), name
+        assert inspect.getsourcefile(method) == \
+            pomp.contrib.asynciotools.__file__
+
+
+def test_one_task_per_request():
+
+    class MemoryDownloader(BaseDownloader):
+
+        def get_workers_count(self):
+            return 10
+
+        async def process(self, crawler, request):
+            await asyncio.sleep(0.01)
+            return DummyResponse(request, 'some html code')
+
+    loop = asyncio.new_event_loop()
+    tasks = []
+
+    def task_factory(loop, coro, **kwargs):
+        task = asyncio.Task(coro, loop=loop, **kwargs)
+        tasks.append(task)
+        return task
+
+    loop.set_task_factory(task_factory)
+    collect_middleware = CollectRequestResponseMiddleware()
+    pomp = AioPomp(
+        downloader=MemoryDownloader(),
+        middlewares=(collect_middleware, ),
+    )
+    try:
+        loop.run_until_complete(pomp.pump(ManyRequestsCrawler()))
+    finally:
+        loop.close()
+
+    assert len(collect_middleware.responses) == 50
+    # one task for each request, the pump and its dispatcher
+    assert len(tasks) == 52
+
+
+class SleepingDownloader(BaseDownloader):
+
+    def __init__(self, delay=0.01, workers=0):
+        self.delay = delay
+        self.workers = workers
+        self.running = 0
+        self.max_running = 0
+
+    def get_workers_count(self):
+        return self.workers
+
+    async def process(self, crawler, request):
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.running -= 1
+        return DummyResponse(request, 'some html code')
+
+
+class ManyRequestsCrawler(DummyCrawler):
+    ENTRY_REQUESTS = [
+        DummyRequest('http://localhost/%s' % i) for i in range(50)
+    ]
+
+    def next_requests(self, response):
+        pass
+
+
+def test_max_tasks():
+    loop = asyncio.new_event_loop()
+    downloader = SleepingDownloader()
+    collect_middleware = CollectRequestResponseMiddleware()
+    # scheduler is unlimited without downloader workers count
+    pomp = AioPomp(
+        downloader=downloader,
+        middlewares=(collect_middleware, ),
+        max_tasks=5,
+    )
+    try:
+        loop.run_until_complete(pomp.pump(ManyRequestsCrawler()))
+    finally:
+        loop.close()
+
+    assert len(collect_middleware.responses) == 50
+    assert downloader.max_running == 5
+    assert len(pomp.tasks) == 0
+
+
+def test_priority_queue():
+    from pomp.contrib.asynciotools import PriorityAsyncioQueue
+    from pomp.core.engine import StopCommand
+
+    class Crawler(DummyCrawler):
+        ENTRY_REQUESTS = DummyRequest('http://localhost/root')
+
+        def next_requests(self, response):
+            if response.get_request().url.endswith('root'):
+                for i in range(3):
+                    request = DummyRequest('http://localhost/deep/%s' % i)
+                    request.depth = 3
+                    yield request
+                yield DummyRequest('http://localhost/shallow')
+
+    loop = asyncio.new_event_loop()
+    queue = PriorityAsyncioQueue(depth_bias=1)
+    collect_middleware = CollectRequestResponseMiddleware()
+    pomp = AioPomp(
+        downloader=SleepingDownloader(workers=1),
+        middlewares=(collect_middleware, ),
+        queue=queue,
+    )
+    try:
+        loop.run_until_complete(pomp.pump(Crawler()))
+
+        # command after all requests
+        loop.run_until_complete(queue.put_requests([
+            StopCommand(), DummyRequest('a'),
+        ]))
+        assert loop.run_until_complete(queue.get_requests()).url == 'a'
+        assert isinstance(
+            loop.run_until_complete(queue.get_requests()), StopCommand,
+        )
+    finally:
+        loop.close()
+
+    # depth set by crawler is kept, shallow requests are taken first
+    assert [
+        r.get_request().url.replace('http://localhost/', '')
+        for r in collect_middleware.responses
+    ] == ['root', 'shallow', 'deep/0', 'deep/1', 'deep/2']
+
+
+def test_polite_scheduler():
+    from pomp.contrib.asynciotools import AioInFlightScheduler
+
+    class Crawler(ManyRequestsCrawler):
+        ENTRY_REQUESTS = [
+            DummyRequest('http://slow/%s' % i) for i in range(3)
+        ] + [
+            DummyRequest('http://fast/%s' % i) for i in range(6)
+        ]
+
+    class Downloader(SleepingDownloader):
+        async def process(self, crawler, request):
+            started[request.url] = loop.time()
+            return await super(Downloader, self).process(crawler, request)
+
+    started = {}
+    loop = asyncio.new_event_loop()
+    scheduler = AioInFlightScheduler(
+        limit=2, per_host_limit=1, host_delays={'slow': 0.1},
+    )
+    collect_middleware = CollectRequestResponseMiddleware()
+    pomp = AioPomp(
+        downloader=Downloader(),
+        middlewares=(collect_middleware, ),
+        scheduler=scheduler,
+    )
+    try:
+        loop.run_until_complete(pomp.pump(Crawler()))
+    finally:
+        loop.close()
+
+    assert len(collect_middleware.responses) == 9
+    slow = sorted(v for k, v in started.items() if 'slow' in k)
+    assert all(b - a >= 0.09 for a, b in zip(slow, slow[1:]))
+    # delayed host does not hold global slots
+    fast = sorted(v for k, v in started.items() if 'fast' in k)
+    assert fast[-1] < slow[-1]
+    assert scheduler.get_stats()['in_flight'] == 0
+    assert scheduler.get_stats()['parked'] == 0
+
+
+def test_stop_drain_timeout():
+    loop = asyncio.new_event_loop()
+    downloader = SleepingDownloader(delay=0.1, workers=5)
+    collect_middleware = CollectRequestResponseMiddleware()
+    pipeline = SyncPipeline()
+    pomp = AioPomp(
+        downloader=downloader,
+        middlewares=(collect_middleware, ),
+        pipelines=(pipeline, ),
+        drain_timeout=1,
+    )
+    loop.call_later(0.15, pomp.stop)
+    try:
+        loop.run_until_complete(pomp.pump(ManyRequestsCrawler()))
+    finally:
+        loop.close()
+
+    # running requests are drained, no new requests are taken
+    assert len(collect_middleware.responses) == 10
+    assert pipeline.items_count == 10
+
+    # running requests are cancelled after drain timeout
+    loop = asyncio.new_event_loop()
+    downloader = SleepingDownloader(delay=60, workers=5)
+    pipeline = SyncPipeline()
+    pomp = AioPomp(
+        downloader=downloader,
+        pipelines=(pipeline, ),
+        drain_timeout=0.1,
+    )
+    loop.call_later(0.05, pomp.stop)
+    started = loop.time()
+    try:
+        loop.run_until_complete(pomp.pump(ManyRequestsCrawler()))
+        assert loop.time() - started < 1
+    finally:
+        loop.close()
+
+    assert downloader.max_running == 5
+    assert downloader.running == 0
+    assert pipeline.items_count == 0
+
+
+def test_stop_returns_not_dispatched_requests():
+    loop = asyncio.new_event_loop()
+    collect_middleware = CollectRequestResponseMiddleware()
+    # dispatcher takes batch of 10 requests and waits for free task
+    pomp = AioPomp(
+        downloader=SleepingDownloader(delay=0.1, workers=10),
+        middlewares=(collect_middleware, ),
+        max_tasks=2,
+    )
+    loop.call_later(0.05, pomp.stop)
+    try:
+        loop.run_until_complete(pomp.pump(ManyRequestsCrawler()))
+    finally:
+        loop.close()
+
+    assert len(collect_middleware.responses) == 2
+    # the rest of the batch is returned to the queue
+    assert pomp.queue.q.qsize() == 48
+    assert pomp.in_progress == 48
+    assert pomp.scheduler.in_flight == 0
+
+
+@pytest.mark.skipif(
+    not hasattr(signal, 'SIGTERM') or sys.platform == 'win32',
+    reason='unix signals are required',
+)
+def test_stop_on_signal():
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    downloader = SleepingDownloader(delay=60, workers=5)
+    pomp = AioPomp(downloader=downloader, drain_timeout=0)
+    previous = signal.getsignal(signal.SIGTERM)
+
+    # stop taking of new requests and cancel running ones without waiting
+    loop.call_later(0.05, os.kill, os.getpid(), signal.SIGTERM)
+    started = loop.time()
+    try:
+        loop.run_until_complete(pomp.pump(ManyRequestsCrawler()))
+        assert loop.time() - started < 1
+    finally:
+        loop.close()
+        asyncio.set_event_loop(None)
+
+    assert downloader.running == 0
+    assert signal.getsignal(signal.SIGTERM) == previous
+
+
+@pytest.mark.skipif(
+    not hasattr(signal, 'SIGTERM') or sys.platform == 'win32',
+    reason='unix signals are required',
+)
+def test_keep_application_signal_handler():
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    handled = []
+
+    def handler(signum, frame):
+        handled.append(signum)
+
+    previous = signal.signal(signal.SIGTERM, handler)
+    pomp = AioPomp(downloader=SleepingDownloader(delay=0.1, workers=5))
+    loop.call_later(0.05, os.kill, os.getpid(), signal.SIGTERM)
+    try:
+        loop.run_until_complete(pomp.pump(ManyRequestsCrawler()))
+    finally:
+        loop.close()
+        asyncio.set_event_loop(None)
+        signal.signal(signal.SIGTERM, previous)
+
+    # handler of application is called, crawling is not stopped
+    assert handled == [signal.SIGTERM]
+    assert not pomp.stopping
@@ -0,0 +1,287 @@
+import gc
+import gzip
+import pytest
+
+asyncio = pytest.importorskip("asyncio")  # noqa
+
+import logging
+from pomp.core.base import (
+    BaseCrawlException, TimeoutCrawlException, BodySizeCrawlException,
+)
+from pomp.contrib.asynciotools import (
+    AioPomp, AsyncioHttpDownloader, AsyncioHttpRequest, AsyncioHttpResponse,
+)
+
+from mockserver import HttpServer, make_sitemap
+from tools import DummyCrawler
+from tools import RequestResponseMiddleware, CollectRequestResponseMiddleware
+
+
+logging.basicConfig(level=logging.DEBUG)
+log = logging.getLogger(__name__)
+
+
+class KeepAliveServer(object):
+    """HTTP/1.1 server in the current event loop"""
+
+    def __init__(self):
+        self.connections = 0
+
+    async def start(self):
+        self.server = await asyncio.start_server(
+            self.handle, '127.0.0.1', 0,
+        )
+        self.location = 'http://127.0.0.1:%s' % (
+            self.server.sockets[0].getsockname()[1]
+        )
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                break
+            while (await reader.readline()) not in (b'\r\n', b''):
+                pass
+            path = request_line.split()[1]
+            if path == b'/hang':
+                # wait until client gives up
+                await reader.read()
+                break
+            elif path == b'/slow':
+                await asyncio.sleep(0.3)
+                writer.write(
+                    b'HTTP/1.1 200 OK\r\n'
+                    b'Content-Length: 2\r\n\r\nok'
+                )
+            elif path == b'/chunked':
+                writer.write(
+                    b'HTTP/1.1 200 OK\r\n'
+                    b'Transfer-Encoding: chunked\r\n\r\n'
+                    b'5\r\nhello\r\n6\r\n world\r\n0\r\n\r\n'
+                )
+            elif path == b'/gzip':
+                body = gzip.compress(b'ok' * 1024 * 1024)
+                writer.write(
+                    b'HTTP/1.1 200 OK\r\n'
+                    b'Content-Encoding: gzip\r\n'
+                    b'Content-Length: %d\r\n\r\n' % len(body) + body
+                )
+            elif path == b'/missing':
+                writer.write(
+                    b'HTTP/1.1 404 Not Found\r\n'
+                    b'Content-Length: 0\r\n\r\n'
+                )
+            else:
+                writer.write(
+                    b'HTTP/1.1 200 OK\r\n'
+                    b'Content-Length: 2\r\n\r\nok'
+                )
+            await writer.drain()
+        writer.close()
+
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+class TestAsyncioHttpDownloader(object):
+
+    @classmethod
+    def setup_class(cls):
+        cls.httpd = HttpServer(sitemap=make_sitemap(level=2, links_on_page=2))
+        cls.httpd.start()
+
+    @classmethod
+    def teardown_class(cls):
+        cls.httpd.stop()
+
+    def test_asyncio_http_downloader(self):
+        collect_middleware = CollectRequestResponseMiddleware()
+        pomp = AioPomp(
+            downloader=AsyncioHttpDownloader(concurrency=2),
+            middlewares=(
+                RequestResponseMiddleware(
+                    prefix_url=self.httpd.location,
+                    request_factory=AsyncioHttpRequest,
+                ),
+                collect_middleware,
+            ),
+            pipelines=[],
+        )
+
+        class Crawler(DummyCrawler):
+            ENTRY_REQUESTS = '/root'
+
+        run(pomp.pump(Crawler()))
+
+        assert \
+            set([r.url.replace(self.httpd.location, '')
+                for r in collect_middleware.requests]) == \
+            set(self.httpd.sitemap.keys())
+        assert not collect_middleware.exceptions
+        assert pomp.downloader.get_workers_count() == 2
+
+        # in-flight scheduler limited by downloader concurrency
+        stats = pomp.scheduler.get_stats()
+        assert pomp.scheduler.limit == 2
+        assert stats['in_flight'] == 0
+        assert stats['acquired'] == len(self.httpd.sitemap)
+
+    def test_keep_alive(self):
+        server = KeepAliveServer()
+        downloader = AsyncioHttpDownloader(timeout=5)
+
+        async def _test():
+            await server.start()
+            downloader.start(None)
+            try:
+                for _ in range(5):
+                    response = await downloader.process(
+                        None, AsyncioHttpRequest('%s/' % server.location),
+                    )
+                    assert isinstance(response, AsyncioHttpResponse)
+                    assert response.status == 200
+                    assert response.body == b'ok'
+
+                response = await downloader.process(
+                    None, AsyncioHttpRequest('%s/chunked' % server.location),
+                )
+                assert response.body == b'hello world'
+
+                response = await downloader.process(
+                    None, AsyncioHttpRequest('%s/missing' % server.location),
+                )
+                assert isinstance(response, BaseCrawlException)
+                assert response.response.status == 404
+
+                # one connection for all requests
+                assert server.connections == 1
+                assert downloader.pool.get_idle_count() == 1
+
+                # timeout
+                response = await downloader.process(
+                    None,
+                    AsyncioHttpRequest(
+                        '%s/hang' % server.location, total_timeout=0.3,
+                    ),
+                )
+                assert isinstance(response, TimeoutCrawlException)
+            finally:
+                downloader.stop(None)
+                await server.stop()
+
+        run(_test())
+
+    def test_decode_content(self):
+        server = KeepAliveServer()
+        downloader = AsyncioHttpDownloader(timeout=5)
+
+        async def _test():
+            await server.start()
+            downloader.start(None)
+            try:
+                url = '%s/gzip' % server.location
+                response = await downloader.process(
+                    None, AsyncioHttpRequest(url),
+                )
+                assert response.body == b'ok' * 1024 * 1024
+
+                # size of decoded body is limited
+                response = await downloader.process(
+                    None, AsyncioHttpRequest(url, max_body_size=1024),
+                )
+                assert isinstance(response, BodySizeCrawlException)
+            finally:
+                downloader.stop(None)
+                await server.stop()
+
+        run(_test())
+
+    def test_deadline_without_tasks(self):
+        server = KeepAliveServer()
+        downloader = AsyncioHttpDownloader(timeout=5, total_timeout=5)
+        created = []
+
+        def task_factory(loop, coro, **kwargs):
+            created.append(coro)
+            return asyncio.Task(coro, loop=loop, **kwargs)
+
+        async def _test():
+            await server.start()
+            downloader.start(None)
+            try:
+                # open keep-alive connection
+                await downloader.process(
+                    None, AsyncioHttpRequest('%s/' % server.location),
+                )
+                asyncio.get_event_loop().set_task_factory(task_factory)
+                for path in ('/', '/chunked', '/slow') * 3:
+                    response = await downloader.process(
+                        None, AsyncioHttpRequest(server.location + path),
+                    )
+                    assert response.status == 200
+                # timeouts do not wrap reads to tasks
+                assert not created
+
+                # read timeout
+                response = await downloader.process(
+                    None,
+                    AsyncioHttpRequest(
+                        '%s/hang' % server.location, read_timeout=0.3,
+                    ),
+                )
+                assert isinstance(response, TimeoutCrawlException)
+                assert not created
+            finally:
+                asyncio.get_event_loop().set_task_factory(None)
+                downloader.stop(None)
+                await server.stop()
+
+        run(_test())
+
+    def test_tasks_survive_gc(self):
+        server = KeepAliveServer()
+        collect_middleware = CollectRequestResponseMiddleware()
+        pomp = AioPomp(
+            downloader=AsyncioHttpDownloader(),
+            middlewares=(collect_middleware, ),
+            pipelines=[],
+        )
+
+        class Crawler(DummyCrawler):
+            def extract_items(self, response):
+                pass
+
+            def next_requests(self, response):
+                pass
+
+        async def _collect():
+            # download task waits for weakly referenced stream reader
+            for _ in range(5):
+                await asyncio.sleep(0.05)
+                gc.collect()
+
+        async def _test():
+            await server.start()
+            try:
+                crawler = Crawler()
+                crawler.ENTRY_REQUESTS = [
+                    AsyncioHttpRequest('%s/slow' % server.location),
+                ]
+                await asyncio.wait_for(
+                    asyncio.gather(pomp.pump(crawler), _collect()), 5,
+                )
+            finally:
+                await server.stop()
+
+        run(_test())
+        assert len(collect_middleware.responses) == 1
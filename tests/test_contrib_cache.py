@@ -0,0 +1,259 @@
+import os
+import time
+import shutil
+import logging
+import tempfile
+import multiprocessing
+
+import pytest
+
+from pomp.core.engine import Pomp
+from pomp.contrib.cache import (
+    HttpCacheMiddleware, FilesystemCacheStorage, CacheEntry,
+    CachedHttpResponse,
+)
+from pomp.contrib.dedup import request_fingerprint
+from pomp.contrib.urllibtools import (
+    UrllibDownloader, PooledUrllibDownloader, UrllibAdapterMiddleware,
+)
+
+from mockserver import HttpServer, make_sitemap
+from tools import DummyCrawler, DummyRequest
+from tools import RequestResponseMiddleware, CollectRequestResponseMiddleware
+
+
+logging.basicConfig(level=logging.DEBUG)
+
+
+def _fingerprint(i):
+    return request_fingerprint(DummyRequest('http://localhost/%s' % i))
+
+
+def _entry(i, size=10, stored_at=None):
+    return CacheEntry(
+        'http://localhost/%s' % i, 200, [('ETag', '"%s"' % i)],
+        b'x' * size, stored_at=stored_at,
+    )
+
+
+def _fill(path, start):
+    storage = FilesystemCacheStorage(path, max_entries=50)
+    for i in range(start, start + 40):
+        storage.set(_fingerprint(i), _entry(i))
+        storage.get(_fingerprint(i - 10))
+    storage.close()
+
+
+class TestContribCache(object):
+
+    @classmethod
+    def setup_class(cls):
+        cls.httpd = HttpServer(sitemap=make_sitemap(level=2, links_on_page=2))
+        cls.httpd.start()
+
+    @classmethod
+    def teardown_class(cls):
+        cls.httpd.stop()
+
+    def setup_method(self, method):
+        self.path = tempfile.mkdtemp(prefix='pomp-cache-')
+
+    def teardown_method(self, method):
+        shutil.rmtree(self.path)
+
+    def test_storage(self):
+        storage = FilesystemCacheStorage(self.path)
+        storage.set(_fingerprint(0), _entry(0))
+        entry = storage.get(_fingerprint(0))
+        assert entry.body == b'x' * 10
+        assert entry.get_header('etag') == '"0"'
+        assert storage.get(_fingerprint(1)) is None
+
+        # replaced entry is counted once
+        storage.set(_fingerprint(0), _entry(0, size=20))
+        assert len(storage) == 1
+        assert storage.get_size() == 20
+
+        # revalidated entry
+        stored_at = entry.stored_at
+        storage.touch(_fingerprint(0), [('ETag', '"new"')])
+        entry = storage.get(_fingerprint(0))
+        assert entry.stored_at > stored_at
+        assert entry.headers == [('ETag', '"new"')]
+
+        # removed body is not cached
+        os.remove(storage._get_file_path(_fingerprint(0)))
+        assert storage.get(_fingerprint(0)) is None
+        storage.delete(_fingerprint(0))
+        assert len(storage) == 0
+        assert storage.get_size() == 0
+
+        # entries are kept on disk
+        storage.set(_fingerprint(0), _entry(0))
+        storage.close()
+        storage = FilesystemCacheStorage(self.path)
+        assert storage.get(_fingerprint(0)).body == b'x' * 10
+        storage.close()
+
+    def test_eviction(self):
+        # least recently used entries are evicted by count and size
+        for limits in ({'max_entries': 3}, {'max_size': 30}):
+            path = os.path.join(self.path, str(len(os.listdir(self.path))))
+            storage = FilesystemCacheStorage(path, **limits)
+            for i in range(3):
+                storage.set(_fingerprint(i), _entry(i))
+            storage.get(_fingerprint(0))
+            storage.set(_fingerprint(3), _entry(3))
+            assert storage.get(_fingerprint(1)) is None
+            assert not os.path.exists(storage._get_file_path(_fingerprint(1)))
+            assert all(storage.get(_fingerprint(i)) for i in (0, 2, 3))
+            assert len(storage) == 3
+            storage.close()
+
+        # expired entries are evicted
+        storage = FilesystemCacheStorage(self.path, ttl=60)
+        storage.set(_fingerprint(0), _entry(0, stored_at=time.time() - 120))
+        assert storage.get(_fingerprint(0)) is None
+        storage.set(_fingerprint(1), _entry(1))
+        storage.set(_fingerprint(2), _entry(2, stored_at=time.time() - 120))
+        storage.set(_fingerprint(3), _entry(3))
+        assert len(storage) == 2
+        assert storage.get(_fingerprint(1))
+        storage.close()
+
+    def test_storage_shared_by_processes(self):
+        processes = [
+            multiprocessing.Process(target=_fill, args=(self.path, i * 20))
+            for i in range(4)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+            assert process.exitcode == 0
+
+        # totals are consistent with entries and body files
+        storage = FilesystemCacheStorage(self.path)
+        rows = storage.connection.execute(
+            'SELECT fingerprint, size FROM entries',
+        ).fetchall()
+        assert len(storage) == len(rows) == 50
+        assert storage.get_size() == sum(size for _, size in rows) == 500
+        body_files = [
+            name for directory in os.listdir(self.path)
+            if os.path.isdir(os.path.join(self.path, directory))
+            for name in os.listdir(os.path.join(self.path, directory))
+        ]
+        assert len(body_files) == 50
+        storage.close()
+
+    @pytest.mark.parametrize(
+        'downloader_class', (UrllibDownloader, PooledUrllibDownloader),
+    )
+    def test_cache_middleware(self, downloader_class):
+
+        class Crawler(DummyCrawler):
+            ENTRY_REQUESTS = '/root'
+
+        def _pump(max_age):
+            downloads = []
+
+            class Downloader(downloader_class):
+                def process(self, crawler, request):
+                    downloads.append(request)
+                    return super(Downloader, self).process(crawler, request)
+
+            cache_middleware = HttpCacheMiddleware(
+                FilesystemCacheStorage(self.path), max_age=max_age,
+            )
+            # gets responses after the cache
+            collect_middleware = CollectRequestResponseMiddleware()
+            pomp = Pomp(
+                downloader=Downloader(),
+                middlewares=(
+                    collect_middleware,
+                    RequestResponseMiddleware(
+                        prefix_url=self.httpd.location,
+                        request_factory=lambda x: x,
+                    ),
+                    UrllibAdapterMiddleware(),
+                    cache_middleware,
+                ),
+                pipelines=[],
+            )
+            pomp.pump(Crawler())
+            stats = cache_middleware.get_stats()
+            cache_middleware.close()
+
+            assert set(
+                r.get_request().url.replace(self.httpd.location, '')
+                for r in collect_middleware.responses
+            ) == set(self.httpd.sitemap.keys())
+            assert not collect_middleware.exceptions
+            return stats, collect_middleware.responses, len(downloads)
+
+        count = len(self.httpd.sitemap)
+
+        # responses are stored
+        stats, responses, downloads = _pump(max_age=60)
+        assert stats['stored'] == stats['entries'] == count
+        assert stats['hits'] == stats['revalidated'] == 0
+        assert downloads == count
+
+        # fresh responses are returned without download
+        stats, responses, downloads = _pump(max_age=60)
+        assert stats['hits'] == count
+        assert stats['stored'] == stats['revalidated'] == 0
+        assert downloads == 0
+        assert all(isinstance(r, CachedHttpResponse) for r in responses)
+
+        # stale responses are revalidated by etag
+        stats, responses, downloads = _pump(max_age=0)
+        assert stats['revalidated'] == count
+        assert stats['stored'] == stats['hits'] == 0
+        assert downloads == count
+        assert all(isinstance(r, CachedHttpResponse) for r in responses)
+
+    def test_cache_middleware_asyncio(self):
+        asyncio = pytest.importorskip('asyncio')
+        from pomp.contrib.asynciotools import (
+            AioPomp, AsyncioHttpDownloader, AsyncioHttpRequest,
+        )
+
+        class Crawler(DummyCrawler):
+            ENTRY_REQUESTS = '/root'
+
+        def _pump(max_age):
+            cache_middleware = HttpCacheMiddleware(
+                FilesystemCacheStorage(self.path), max_age=max_age,
+            )
+            collect_middleware = CollectRequestResponseMiddleware()
+            pomp = AioPomp(
+                downloader=AsyncioHttpDownloader(),
+                middlewares=(
+                    collect_middleware,
+                    RequestResponseMiddleware(
+                        prefix_url=self.httpd.location,
+                        request_factory=AsyncioHttpRequest,
+                    ),
+                    cache_middleware,
+                ),
+                pipelines=[],
+            )
+            loop = asyncio.new_event_loop()
+            try:
+                loop.run_until_complete(pomp.pump(Crawler()))
+            finally:
+                loop.close()
+            stats = cache_middleware.get_stats()
+            cache_middleware.close()
+
+            assert len(collect_middleware.responses) == \
+                len(self.httpd.sitemap)
+            assert not collect_middleware.exceptions
+            return stats
+
+        count = len(self.httpd.sitemap)
+        assert _pump(max_age=None)['stored'] == count
+        assert _pump(max_age=None)['hits'] == count
+        assert _pump(max_age=0)['revalidated'] == count
@@ -1,7 +1,12 @@
+import os
+import gc
+import glob
 import time
 import json
 import random
 import logging
+import tempfile
+import threading
 
 try:
     from io import StringIO
@@ -9,18 +14,20 @@ except Exception:
     from StringIO import StringIO
 
 
-from pomp.core.base import BaseDownloadWorker
+from pomp.core.base import BaseDownloadWorker, BaseMiddleware
 from pomp.core.engine import Pomp
 from pomp.contrib.urllibtools import (
     UrllibHttpRequest, UrllibHttpResponse, UrllibAdapterMiddleware,
 )
 from pomp.core.utils import PY3
 
+from pomp.contrib.sharedbody import MMAP, MMAP_DIR
 from pomp.contrib.concurrenttools import (
     ConcurrentCrawler, ConcurrentDownloader, ConcurrentUrllibDownloader,
+    ConcurrentPooledUrllibDownloader, SharedExecutor, ParsedResponse,
 )
 
-from tools import DummyCrawler
+from tools import DummyCrawler, DummyRequest, DummyResponse
 from tools import RequestResponseMiddleware, CollectRequestResponseMiddleware
 from mockserver import HttpServer, make_sitemap
 
@@ -45,6 +52,51 @@ class MockedDownloadWorker(BaseDownloadWorker):
             )
 
 
+class MockedReusedDownloadWorker(MockedDownloadWorker):
+
+    def __init__(self):
+        self.worker_id = '%s:%s' % (os.getpid(), id(self))
+
+    def process(self, request):
+        response = super(MockedReusedDownloadWorker, self).process(request)
+        response.worker_id = self.worker_id
+        return response
+
+
+class NamedDownloadWorker(BaseDownloadWorker):
+
+    def __init__(self, name):
+        self.name = name
+
+    def process(self, request):
+        return DummyResponse(request, self.name)
+
+
+class NamedCrawlerWorker(DummyCrawler):
+
+    def __init__(self, name):
+        self.name = name
+
+    def extract_items(self, response):
+        return ['%s:%s' % (self.name, response.resp)]
+
+    def next_requests(self, response):
+        pass
+
+
+def _fetch(downloader, request):
+    done = threading.Event()
+    results = []
+
+    def _(r):
+        results.append(r.result())
+        done.set()
+
+    downloader.process(None, request).add_done_callback(_)
+    assert done.wait(10)
+    return results[0]
+
+
 class MockedDownloadWorkerWithException(BaseDownloadWorker):
     def process(self, request):
         raise Exception('something wrong in request processing')
@@ -60,11 +112,41 @@ class MockedCrawlerWorker(DummyCrawler):
         )
 
 
+class MockedFusedCrawlerWorker(DummyCrawler):
+    ENTRY_REQUESTS = '/root'
+
+    def extract_items(self, response):
+        # response middlewares are called after parsing in fused mode
+        response.body = json.loads(response.body.decode('utf-8'))
+        return super(MockedFusedCrawlerWorker, self).extract_items(
+            response
+        )
+
+
 class MockedCrawlerWorkerWithException(MockedCrawlerWorker):
     def extract_items(self, request):
         raise Exception('something wrong in response processing')
 
 
+class SharedBodyMiddleware(BaseMiddleware):
+
+    def __init__(self):
+        self.bodies = []
+
+    def process_response(self, response, crawler, downloader):
+        self.bodies.append(response.body)
+        return response
+
+
+class ReplaceResponseMiddleware(BaseMiddleware):
+    """Pass parsed copy of response without release of the original"""
+
+    def process_response(self, response, crawler, downloader):
+        replaced = DummyResponse(response.get_request(), None)
+        replaced.body = json.loads(bytes(response.body).decode('utf-8'))
+        return replaced
+
+
 class TestContribConcurrent(object):
 
     @classmethod
@@ -106,6 +188,40 @@ class TestContribConcurrent(object):
                 for r in collect_middleware.requests]) == \
             set(MockedDownloadWorker.sitemap.keys())
 
+    def test_concurrent_downloader_worker_reuse(self):
+        req_resp_midlleware = RequestResponseMiddleware(
+            prefix_url='http://localhost',
+            request_factory=UrllibHttpRequest,
+        )
+
+        collect_middleware = CollectRequestResponseMiddleware()
+
+        downloader = ConcurrentDownloader(
+            pool_size=2,
+            worker_class=MockedReusedDownloadWorker,
+            worker_reuse=True,
+        )
+
+        pomp = Pomp(
+            downloader=downloader,
+            middlewares=(req_resp_midlleware, collect_middleware, ),
+            pipelines=[],
+        )
+
+        class Crawler(DummyCrawler):
+            ENTRY_REQUESTS = '/root'
+
+        pomp.pump(Crawler())
+
+        assert \
+            set([r.url.replace('http://localhost', '')
+                for r in collect_middleware.requests]) == \
+            set(MockedDownloadWorker.sitemap.keys())
+
+        # one worker instance per pool process
+        worker_ids = set(r.worker_id for r in collect_middleware.responses)
+        assert 1 <= len(worker_ids) <= 2
+
     def test_exception_on_downloader_worker(self):
         req_resp_midlleware = RequestResponseMiddleware(
             prefix_url='http://localhost',
@@ -164,6 +280,36 @@ class TestContribConcurrent(object):
                 for r in collect_middleware.requests]) == \
             set(self.httpd.sitemap.keys())
 
+    def test_concurrent_pooled_urllib_downloader(self):
+        req_resp_midlleware = RequestResponseMiddleware(
+            prefix_url=self.httpd.location,
+            request_factory=lambda x: x,
+        )
+
+        collect_middleware = CollectRequestResponseMiddleware()
+
+        downloader = ConcurrentPooledUrllibDownloader(pool_size=2)
+
+        pomp = Pomp(
+            downloader=downloader,
+            middlewares=(
+                req_resp_midlleware,
+                UrllibAdapterMiddleware(),
+                collect_middleware,
+            ),
+            pipelines=[],
+        )
+
+        class Crawler(DummyCrawler):
+            ENTRY_REQUESTS = '/root'
+
+        pomp.pump(Crawler())
+
+        assert \
+            set([r.url.replace(self.httpd.location, '')
+                for r in collect_middleware.requests]) == \
+            set(self.httpd.sitemap.keys())
+
     def test_concurrent_crawler(self):
         req_resp_midlleware = RequestResponseMiddleware(
             prefix_url=self.httpd.location,
@@ -196,6 +342,236 @@ class TestContribConcurrent(object):
                 for r in collect_middleware.requests]) == \
             set(self.httpd.sitemap.keys())
 
+    def test_shared_executor(self):
+        req_resp_midlleware = RequestResponseMiddleware(
+            prefix_url=self.httpd.location,
+            request_factory=lambda x: x,
+        )
+
+        collect_middleware = CollectRequestResponseMiddleware()
+
+        executor = SharedExecutor(pool_size=2)
+        downloader = ConcurrentUrllibDownloader(executor=executor)
+        assert downloader.get_workers_count() == 2
+
+        pomp = Pomp(
+            downloader=downloader,
+            middlewares=(
+                req_resp_midlleware,
+                UrllibAdapterMiddleware(),
+                collect_middleware,
+            ),
+            pipelines=[],
+        )
+
+        pomp.pump(ConcurrentCrawler(
+            worker_class=MockedCrawlerWorker,
+            executor=executor,
+        ))
+
+        assert \
+            set([r.url.replace(self.httpd.location, '')
+                for r in collect_middleware.requests]) == \
+            set(self.httpd.sitemap.keys())
+
+    def test_shared_executor_reused_workers(self):
+        executor = SharedExecutor(pool_size=1)
+        downloaders = [
+            ConcurrentDownloader(
+                worker_class=NamedDownloadWorker,
+                worker_kwargs={'name': name},
+                worker_reuse=True,
+                executor=executor,
+            ) for name in ('first', 'second')
+        ]
+        fused = [
+            ConcurrentDownloader(
+                worker_class=NamedDownloadWorker,
+                worker_kwargs={'name': name},
+                worker_reuse=True,
+                executor=executor,
+                crawler=ConcurrentCrawler(
+                    worker_class=NamedCrawlerWorker,
+                    worker_kwargs={'name': name},
+                    executor=executor,
+                ),
+            ) for name in ('third', 'fourth')
+        ]
+        request = DummyRequest('http://localhost/')
+        try:
+            # every downloader uses own worker in the same pool process
+            for _ in range(2):
+                assert [_fetch(d, request).resp for d in downloaders] == \
+                    ['first', 'second']
+                assert [_fetch(d, request).results for d in fused] == \
+                    [['third:third'], ['fourth:fourth']]
+        finally:
+            executor.shutdown()
+
+    def test_shared_executor_weights(self):
+        executor = SharedExecutor(pool_size=1, parse_weight=3)
+        order = []
+
+        def _submit(kind, fn, *args):
+            future = executor.submit(kind, fn, *args)
+            future.add_done_callback(lambda f: order.append(kind))
+            return future
+
+        # occupy the single process while queues are filled
+        _submit(SharedExecutor.DOWNLOAD, time.sleep, 0.5)
+        futures = [
+            _submit(kind, abs, -i)
+            for i in range(4)
+            for kind in (SharedExecutor.DOWNLOAD, SharedExecutor.PARSE)
+        ]
+        try:
+            assert [f.result() for f in futures] == \
+                [i for i in range(4) for _ in range(2)]
+        finally:
+            executor.shutdown()
+
+        # parse jobs take three of each four places
+        assert order == ['download'] + \
+            ['parse', 'download', 'parse', 'parse', 'parse'] + \
+            ['download'] * 3
+
+    def test_fused_mode(self):
+        req_resp_midlleware = RequestResponseMiddleware(
+            prefix_url=self.httpd.location,
+            request_factory=lambda x: x,
+            bodyjson=False,
+        )
+
+        collect_middleware = CollectRequestResponseMiddleware()
+
+        crawler = ConcurrentCrawler(worker_class=MockedFusedCrawlerWorker)
+        downloader = ConcurrentUrllibDownloader(pool_size=2, crawler=crawler)
+
+        pomp = Pomp(
+            downloader=downloader,
+            middlewares=(
+                req_resp_midlleware,
+                UrllibAdapterMiddleware(),
+                collect_middleware,
+            ),
+            pipelines=[],
+        )
+
+        pomp.pump(crawler)
+
+        assert \
+            set([r.url.replace(self.httpd.location, '')
+                for r in collect_middleware.requests]) == \
+            set(self.httpd.sitemap.keys())
+
+        # body is not passed back from pool processes
+        for response in collect_middleware.responses:
+            assert isinstance(response, ParsedResponse)
+            assert response.status == 200
+            assert not hasattr(response, 'body')
+
+        # not reused workers and exception on crawler worker
+        collect_middleware = CollectRequestResponseMiddleware()
+        crawler = ConcurrentCrawler(
+            worker_class=MockedCrawlerWorkerWithException,
+        )
+        pomp = Pomp(
+            downloader=ConcurrentUrllibDownloader(
+                pool_size=2, worker_reuse=False, crawler=crawler,
+            ),
+            middlewares=(
+                req_resp_midlleware,
+                UrllibAdapterMiddleware(),
+                collect_middleware,
+            ),
+            pipelines=[],
+        )
+
+        pomp.pump(crawler)
+
+        assert len(collect_middleware.requests) == 1
+        assert len(collect_middleware.exceptions) == 1
+
+    def test_shared_body(self):
+        req_resp_midlleware = RequestResponseMiddleware(
+            prefix_url=self.httpd.location,
+            request_factory=lambda x: x,
+        )
+
+        collect_middleware = CollectRequestResponseMiddleware()
+        shared_body_middleware = SharedBodyMiddleware()
+
+        downloader = ConcurrentUrllibDownloader(
+            pool_size=2, body_threshold=1,
+        )
+
+        pomp = Pomp(
+            downloader=downloader,
+            middlewares=(
+                req_resp_midlleware,
+                UrllibAdapterMiddleware(),
+                collect_middleware,
+                shared_body_middleware,
+            ),
+            pipelines=[],
+        )
+
+        class Crawler(DummyCrawler):
+            ENTRY_REQUESTS = '/root'
+
+        pomp.pump(Crawler())
+
+        assert \
+            set([r.url.replace(self.httpd.location, '')
+                for r in collect_middleware.requests]) == \
+            set(self.httpd.sitemap.keys())
+
+        # bodies are copied from shared memory
+        bodies = shared_body_middleware.bodies
+        assert len(bodies) == len(self.httpd.sitemap)
+        assert all(isinstance(body, bytes) for body in bodies)
+
+    def test_shared_body_view(self):
+        collect_middleware = CollectRequestResponseMiddleware()
+        shared_body_middleware = SharedBodyMiddleware()
+        downloader = ConcurrentUrllibDownloader(
+            pool_size=2, body_threshold=1, body_transport=MMAP,
+            body_view=True,
+        )
+        pomp = Pomp(
+            downloader=downloader,
+            middlewares=(
+                RequestResponseMiddleware(
+                    prefix_url=self.httpd.location,
+                    request_factory=lambda x: x,
+                    bodyjson=False,
+                ),
+                UrllibAdapterMiddleware(),
+                collect_middleware,
+                ReplaceResponseMiddleware(),
+                shared_body_middleware,
+            ),
+            pipelines=[],
+        )
+
+        class Crawler(DummyCrawler):
+            ENTRY_REQUESTS = '/root'
+
+        pomp.pump(Crawler())
+
+        assert len(collect_middleware.responses) == len(self.httpd.sitemap)
+        # bodies are views of shared memory
+        bodies = shared_body_middleware.bodies
+        assert all(isinstance(body, memoryview) for body in bodies)
+        del bodies[:]
+
+        # replaced responses are not released by engine, but segments are
+        # not left in the system
+        gc.collect()
+        assert not glob.glob(
+            os.path.join(MMAP_DIR or tempfile.gettempdir(), 'pomp-body-*')
+        )
+
     def test_exception_on_crawler_worker(self):
         req_resp_midlleware = RequestResponseMiddleware(
             prefix_url=self.httpd.location,
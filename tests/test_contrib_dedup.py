@@ -0,0 +1,133 @@
+import os
+import logging
+import tempfile
+
+from pomp.core.engine import Pomp
+from pomp.contrib.dedup import (
+    DedupMiddleware, SetStorage, BloomFilterStorage, SqliteStorage,
+    normalize_url, request_fingerprint,
+)
+
+from tools import DummyCrawler, DummyDownloader, DummyRequest
+from tools import RequestResponseMiddleware, CollectRequestResponseMiddleware
+
+
+logging.basicConfig(level=logging.DEBUG)
+
+
+class TestContribDedup(object):
+
+    def test_fingerprint(self):
+        assert normalize_url('HTTP://Example.COM:80?b=2&a=1#top') == \
+            'http://example.com/?a=1&b=2'
+        assert normalize_url('https://example.com:8443/p?a=1#top',
+                             keep_fragment=True) == \
+            'https://example.com:8443/p?a=1#top'
+
+        fp = request_fingerprint(DummyRequest('http://example.com/?b=2&a=1'))
+        assert fp == request_fingerprint(
+            DummyRequest('http://EXAMPLE.com/?a=1&b=2#fragment'),
+        )
+
+        post = DummyRequest('http://example.com/?a=1&b=2')
+        post.method = 'POST'
+        post.data = b'x=1'
+        assert request_fingerprint(post) != fp
+        assert request_fingerprint(post, include_body=False) != fp
+        post.method = 'GET'
+        assert request_fingerprint(post, include_body=False) == fp
+
+    def test_storages(self):
+        path = os.path.join(tempfile.gettempdir(), 'test_dedup.sqlite')
+        if os.path.exists(path):
+            os.remove(path)
+
+        for storage in (
+                SetStorage(),
+                BloomFilterStorage(capacity=1000, error_rate=0.01),
+                SqliteStorage(path, commit_every=10)):
+            fingerprints = [
+                request_fingerprint(DummyRequest('http://localhost/%s' % i))
+                for i in range(100)
+            ]
+            assert all(storage.add(fp) for fp in fingerprints)
+            assert not any(storage.add(fp) for fp in fingerprints)
+            assert len(storage) == 100
+            assert storage.get_memory_usage() > 0
+            storage.close()
+
+        # bloom filter memory is fixed by capacity
+        storage = BloomFilterStorage(capacity=1000, error_rate=0.01)
+        assert storage.hashes_count == 7
+        assert len(storage.bits) == 1199
+
+        # sqlite storage keeps fingerprints on disk
+        storage = SqliteStorage(path)
+        assert len(storage) == 100
+        assert not storage.add(fingerprints[0])
+        storage.close()
+
+        def _count():
+            reader = SqliteStorage(path)
+            try:
+                return len(reader)
+            finally:
+                reader.close()
+
+        # committed fingerprints are visible to other connection before
+        # storage is closed
+        storage = SqliteStorage(path, commit_every=2, commit_interval=None)
+        for fp in fingerprints[:10]:
+            storage.add(fp)
+        for i in range(3):
+            storage.add(('new %s' % i).encode())
+        assert _count() == 102
+        storage.close()
+        assert _count() == 103
+
+        # commit by time
+        storage = SqliteStorage(path, commit_every=1000, commit_interval=0)
+        storage.add(b'by time')
+        assert _count() == 104
+        storage.close()
+
+    def test_dedup_middleware(self):
+
+        class Crawler(DummyCrawler):
+            ENTRY_REQUESTS = '/root'
+
+            def next_requests(self, response):
+                # yield same links from every page
+                return ['/root', '/1', '/2', '/1?']
+
+        dedup_middleware = DedupMiddleware()
+        collect_middleware = CollectRequestResponseMiddleware()
+        pomp = Pomp(
+            downloader=DummyDownloader(),
+            middlewares=(
+                RequestResponseMiddleware(
+                    prefix_url='http://localhost',
+                    request_factory=DummyRequest,
+                    bodyjson=False,
+                ),
+                dedup_middleware,
+                collect_middleware,
+            ),
+        )
+        pomp.pump(Crawler())
+
+        assert [r.url for r in collect_middleware.requests] == [
+            'http://localhost/root',
+            'http://localhost/1',
+            'http://localhost/2',
+        ]
+        stats = dedup_middleware.get_stats()
+        assert stats['seen'] == 3
+        assert stats['duplicates'] == 10
+        assert stats['memory'] > 0
+
+        # force request
+        request = DummyRequest('http://localhost/root')
+        request.dont_filter = True
+        assert dedup_middleware.process_request(request, None, None) \
+            is request
@@ -0,0 +1,127 @@
+import os
+import shutil
+import logging
+import tempfile
+import threading
+
+from pomp.core.base import BasePipeline
+from pomp.core.engine import Pomp, StopCommand
+from pomp.contrib.diskqueue import SpilloverQueue
+
+from tools import DummyCrawler, DummyDownloader, DummyRequest
+
+
+logging.basicConfig(level=logging.DEBUG)
+
+
+class TestContribDiskQueue(object):
+
+    def setup_method(self, method):
+        self.path = tempfile.mkdtemp(prefix='pomp-test-queue-')
+
+    def teardown_method(self, method):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def _get_all(self, queue, count):
+        urls = []
+        while len(queue):
+            requests = queue.get_requests(count=count)
+            urls.extend(r.url for r in requests)
+            # memory stays bounded
+            assert queue.get_stats()['memory'] <= 20
+        return urls
+
+    def test_fifo(self):
+        queue = SpilloverQueue(self.path, memory_size=10, segment_size=5)
+        queue.put_requests([DummyRequest(i) for i in range(50)])
+        stats = queue.get_stats()
+        assert stats['spilled'] == 40
+        assert stats['segments'] == 8
+        assert len(queue) == 50
+
+        # requests put while spilled ones are read keep order
+        assert [r.url for r in queue.get_requests(count=12)] == \
+            list(range(12))
+        queue.put_requests([DummyRequest(i) for i in range(50, 63)])
+        assert self._get_all(queue, count=7) == list(range(12, 63))
+        assert os.listdir(self.path) == []
+
+    def test_lifo(self):
+        queue = SpilloverQueue(
+            self.path, memory_size=10, segment_size=5, lifo=True,
+        )
+        queue.put_requests([DummyRequest(i) for i in range(33)])
+        assert queue.get_stats()['spilled'] == 25
+        assert [r.url for r in queue.get_requests(count=3)] == [32, 31, 30]
+        queue.put_requests([DummyRequest(i) for i in range(33, 36)])
+        assert self._get_all(queue, count=4) == \
+            list(range(35, 32, -1)) + list(range(29, -1, -1))
+        assert os.listdir(self.path) == []
+
+    def test_commands_and_blocking_get(self):
+        queue = SpilloverQueue(self.path, memory_size=2, segment_size=1)
+        queue.put_requests([DummyRequest(i) for i in range(3)])
+        queue.put_requests(StopCommand())
+
+        # command is not mixed with requests
+        assert [r.url for r in queue.get_requests(count=10)] == [0, 1, 2]
+        assert isinstance(queue.get_requests(count=10), StopCommand)
+
+        # get waits for requests
+        timer = threading.Timer(
+            0.1, queue.put_requests, args=(DummyRequest('late'), ),
+        )
+        timer.start()
+        assert [r.url for r in queue.get_requests(count=10)] == ['late']
+        timer.join()
+
+    def test_close(self):
+        queue = SpilloverQueue(memory_size=2, segment_size=1)
+        queue.put_requests([DummyRequest(i) for i in range(5)])
+        assert len(os.listdir(queue.path)) == 3
+        queue.close()
+        assert not os.path.exists(queue.path)
+
+    def test_crawler(self):
+
+        class WideCrawler(DummyCrawler):
+            ENTRY_REQUESTS = DummyRequest('http://localhost/0')
+
+            def next_requests(self, response):
+                # 4 links on page up to 340 pages
+                url = response.get_request().url
+                page = int(url.rsplit('/', 1)[-1])
+                if page < 85:
+                    return [
+                        DummyRequest('http://localhost/%s' % (page * 4 + i))
+                        for i in range(1, 5)
+                    ]
+
+            def extract_items(self, response):
+                yield response.get_request().url
+
+        class CollectPipeline(BasePipeline):
+
+            def start(self, crawler):
+                self.items = []
+
+            def process(self, crawler, item):
+                self.items.append(item)
+                return item
+
+        pipeline = CollectPipeline()
+        queue = SpilloverQueue(self.path, memory_size=20, segment_size=10)
+        pomp = Pomp(
+            downloader=DummyDownloader(),
+            pipelines=[pipeline],
+            queue=queue,
+        )
+        pomp.pump(WideCrawler())
+
+        # breadth first order
+        assert pipeline.items == [
+            'http://localhost/%s' % i for i in range(341)
+        ]
+        # frontier was spilled to disk
+        assert queue._segment_counter > 10
+        assert queue.get_stats()['spilled'] == 0
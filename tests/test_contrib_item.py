@@ -1,5 +1,6 @@
 import pickle
-from pomp.contrib.item import Item, Field
+import pytest
+from pomp.contrib.item import Item, SlottedItem, Field
 
 
 class TItem(Item):
@@ -35,3 +36,61 @@ def test_item():
 
     # pickling
     assert i == pickle.loads(pickle.dumps(i))
+
+
+class TSlottedItem(SlottedItem):
+    f1 = Field()
+    f2 = Field()
+    f3 = Field()
+
+
+class TSlottedSubItem(TSlottedItem):
+    f4 = Field()
+    f1 = Field()
+
+
+def test_fields_cached():
+    assert TItem._fields == ('f1', 'f2', 'f3')
+    assert isinstance(TItem.f1, Field)
+
+    class SubItem(TItem):
+        f4 = Field()
+        f2 = None
+
+    assert SubItem._fields == ('f1', 'f3', 'f4')
+
+    # dict and attribute access see same value
+    i = SubItem(f4=4)
+    i['f1'] = 1
+    assert i.f1 == 1
+    assert list(i.values()) == [1, None, 4]
+
+
+def test_slotted_item():
+    i = TSlottedItem('f1', f3='f3')
+    assert not hasattr(i, '__dict__')
+    assert ['f1', 'f2', 'f3'] == list(i.keys())
+    assert ['f1', None, 'f3'] == list(i.values())
+
+    i.f2 = 'f2'
+    i['f3'] = 'f3_new'
+    assert i['f2'] == 'f2'
+    assert i.f3 == 'f3_new'
+    assert dict(i) == {'f1': 'f1', 'f2': 'f2', 'f3': 'f3_new'}
+    assert i == TItem('f1', 'f2', 'f3_new')
+
+    with pytest.raises(KeyError):
+        i['unknown'] = 1
+    with pytest.raises(AttributeError):
+        i.unknown = 1
+
+    # pickling
+    assert i == pickle.loads(pickle.dumps(i))
+    assert i.__reduce__() == (TSlottedItem, ('f1', 'f2', 'f3_new'))
+
+    # inherited fields
+    i = TSlottedSubItem(1, 2, 3, 4)
+    assert not hasattr(i, '__dict__')
+    assert ['f2', 'f3', 'f4', 'f1'] == list(i.keys())
+    assert i.f1 == 4
+    assert i == pickle.loads(pickle.dumps(i))
@@ -0,0 +1,237 @@
+import os
+import shutil
+import logging
+import tempfile
+
+import pytest
+
+from pomp.core.base import BasePipeline, BaseMiddleware
+from pomp.core.engine import Pomp
+from pomp.contrib.journal import Journal
+from pomp.contrib.retry import RetryMiddleware
+
+from tools import DummyCrawler, DummyDownloader, DummyRequest, DummyResponse
+
+
+logging.basicConfig(level=logging.DEBUG)
+
+
+class Crash(BaseException):
+    pass
+
+
+class CrashingDownloader(DummyDownloader):
+    """Crashes the process on `crash_at` download"""
+
+    def __init__(self, crash_at=None):
+        self.crash_at = crash_at
+        self.urls = []
+
+    def process(self, crawler, request):
+        self.urls.append(request.url)
+        if len(self.urls) == self.crash_at:
+            raise Crash()
+        return DummyResponse(request, 'some html code')
+
+
+class TreeCrawler(DummyCrawler):
+    ENTRY_REQUESTS = 'http://localhost/0'
+
+    def next_requests(self, response):
+        # 3 links on page, 40 pages
+        page = int(response.get_request().url.rsplit('/', 1)[-1])
+        if page < 13:
+            return [
+                'http://localhost/%s' % (page * 3 + i) for i in range(1, 4)
+            ]
+
+    def extract_items(self, response):
+        yield response.get_request().url
+
+
+class CollectPipeline(BasePipeline):
+
+    def start(self, crawler):
+        self.items = []
+
+    def process(self, crawler, item):
+        self.items.append(item)
+        return item
+
+
+class UrlToRequestMiddleware(BaseMiddleware):
+
+    def process_request(self, request, crawler, downloader):
+        if isinstance(request, str):
+            return DummyRequest(request)
+        return request
+
+
+class SkipMiddleware(BaseMiddleware):
+
+    def process_request(self, request, crawler, downloader):
+        if request.url.endswith('/7'):
+            return None
+        return request
+
+
+class TestContribJournal(object):
+
+    def setup_method(self, method):
+        self.tmp = tempfile.mkdtemp(prefix='pomp-test-journal-')
+        self.path = os.path.join(self.tmp, 'crawl.journal')
+
+    def teardown_method(self, method):
+        shutil.rmtree(self.tmp)
+
+    def test_journal(self):
+        journal = Journal(self.path)
+        assert journal.replay() == []
+        journal.put(['http://localhost/%s' % i for i in range(5)])
+        # the same request is pending until it is done twice
+        journal.put([DummyRequest('http://localhost/0')])
+        journal.done(DummyRequest('http://localhost/1'))
+        journal.done('http://localhost/0')
+        # not journaled request
+        journal.done('http://localhost/100')
+        assert journal.get_stats()['pending'] == 4
+
+        # log is read by the new process
+        assert sorted(Journal(self.path).replay()) == [
+            'http://localhost/0', 'http://localhost/2',
+            'http://localhost/3', 'http://localhost/4',
+        ]
+
+        # broken tail of log is skipped and truncated
+        size = os.path.getsize(self.path)
+        with open(self.path, 'ab') as f:
+            f.write(b'p\xff\x00')
+        journal = Journal(self.path)
+        assert len(journal.replay()) == 4
+        assert os.path.getsize(self.path) == size
+        journal.done('http://localhost/2')
+        journal.close()
+        assert len(Journal(self.path).replay()) == 3
+
+    def test_compaction(self):
+        journal = Journal(self.path, compact_threshold=10)
+        journal.replay()
+        journal.put(['http://localhost/%s' % i for i in range(25)])
+        size = os.path.getsize(self.path)
+        for i in range(20):
+            journal.done('http://localhost/%s' % i)
+        stats = journal.get_stats()
+        assert stats['compactions'] == 2
+        assert stats['pending'] == 5
+        assert stats['done_records'] == 0
+        assert os.path.getsize(self.path) < size / 3
+        journal.close()
+        assert Journal(self.path).replay() == [
+            'http://localhost/%s' % i for i in range(20, 25)
+        ]
+
+    def _pump(self, crash_at=None, middlewares=()):
+        journal = Journal(self.path, compact_threshold=5)
+        pipeline = CollectPipeline()
+        downloader = CrashingDownloader(crash_at=crash_at)
+        pomp = Pomp(
+            downloader=downloader,
+            middlewares=(UrlToRequestMiddleware(), ) + tuple(middlewares),
+            pipelines=[pipeline],
+            journal=journal,
+        )
+        try:
+            pomp.pump(TreeCrawler())
+        except Crash:
+            # process is killed, journal is not closed
+            pass
+        else:
+            journal.close()
+        return pipeline.items, downloader.urls
+
+    def test_resume_crawl(self):
+        all_urls = ['http://localhost/%s' % i for i in range(40)]
+
+        done, downloaded = self._pump(crash_at=15)
+        assert len(done) == 14
+
+        # queued and in flight requests are replayed
+        resumed, downloaded = self._pump(crash_at=10)
+        assert downloaded[0] == 'http://localhost/14'
+        assert not set(done) & set(resumed)
+
+        resumed_again, downloaded = self._pump()
+        assert sorted(done + resumed + resumed_again) == sorted(all_urls)
+        assert Journal(self.path).replay() == []
+
+        # the next crawl starts from entry requests
+        done, _ = self._pump()
+        assert sorted(done) == sorted(all_urls)
+
+    def test_skipped_and_retried_requests_are_done(self):
+
+        class FailOnce(BaseMiddleware):
+            failed = set()
+
+            def process_response(self, response, crawler, downloader):
+                url = response.get_request().url
+                if url not in self.failed:
+                    self.failed.add(url)
+                    response.status = 503
+                return response
+
+        done, _ = self._pump(middlewares=(
+            SkipMiddleware(),
+            RetryMiddleware(backoff=0.01),
+            FailOnce(),
+        ))
+        # links of skipped page are not crawled
+        assert len(done) == 36
+        assert Journal(self.path).replay() == []
+
+    def test_resume_asyncio(self):
+        asyncio = pytest.importorskip('asyncio')
+        from pomp.contrib.asynciotools import AioPomp
+
+        class SlowDownloader(DummyDownloader):
+
+            def get_workers_count(self):
+                return 2
+
+            async def process(self, crawler, request):
+                await asyncio.sleep(0.01)
+                return DummyResponse(request, 'some html code')
+
+        def _pump(stop_after=None):
+            journal = Journal(self.path)
+            pipeline = CollectPipeline()
+            pomp = AioPomp(
+                downloader=SlowDownloader(),
+                middlewares=(UrlToRequestMiddleware(), ),
+                pipelines=[pipeline],
+                journal=journal,
+                drain_timeout=0,
+            )
+
+            async def _run():
+                task = asyncio.ensure_future(pomp.pump(TreeCrawler()))
+                if stop_after:
+                    await asyncio.sleep(stop_after)
+                    pomp.stop()
+                await task
+
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            try:
+                loop.run_until_complete(_run())
+            finally:
+                loop.close()
+                asyncio.set_event_loop(None)
+            return pipeline.items
+
+        done = _pump(stop_after=0.1)
+        assert 0 < len(done) < 40
+        resumed = _pump()
+        assert sorted(done + resumed) == sorted(
+            'http://localhost/%s' % i for i in range(40)
+        )
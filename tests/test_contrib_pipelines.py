@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+import io
 import os
 import csv
 import codecs
@@ -62,3 +63,51 @@ class TestContribPipelines(object):
         with open(filepath, 'r') as csvres:
             res = csvres.read()
             assert res.strip() == 'f1;f2;;f4'
+
+    def test_batched_csv_pipeline(self):
+        filepath = os.path.join(tempfile.gettempdir(), 'test_pipe3.csv')
+        pipe = CsvPipeline(filepath, delimiter=';', batch_size=3)
+        pipe.start(None)
+
+        def _read():
+            with io.open(filepath, 'r', encoding='utf-8') as csvres:
+                return csvres.read().splitlines()
+
+        for i in range(4):
+            item = DummyItem(field3=i, field1=u'ф%s' % i)
+            pipe.process(None, item)
+            # row is a snapshot of item
+            item.field2 = 'changed'
+
+        # first batch is written
+        pipe.csvfile.flush()
+        assert _read() == [u'ф0;;0;', u'ф1;;1;', u'ф2;;2;']
+
+        # rest is written on stop
+        pipe.stop(None)
+        assert _read()[-1] == u'ф3;;3;'
+        assert pipe.csvfile.closed
+
+        # file object and time threshold
+        output = io.BytesIO()
+        pipe = CsvPipeline(output, flush_interval=60)
+        pipe.start(None)
+        pipe.process(None, DummyItem('f1', 'f2'))
+        assert output.getvalue() == b''
+
+        pipe._flushed_at -= 60
+        pipe.process(None, DummyItem('f1', 'f2'))
+        assert output.getvalue() == b'f1,f2,,\r\nf1,f2,,\r\n'
+
+        # row in order of item fields
+        output.seek(0)
+        output.truncate()
+        item = DummyItem('f1', 'f2', 'f3')
+        del item['field1']
+        item['extra'] = 'extra'
+        pipe.process(None, item)
+        pipe.flush()
+        assert output.getvalue() == b',f2,f3,\r\n'
+
+        pipe.stop(None)
+        assert not output.closed
@@ -0,0 +1,204 @@
+import time
+import logging
+import threading
+
+from pomp.core.base import BasePipeline, BaseMiddleware
+from pomp.core.engine import Pomp, StopCommand
+from pomp.contrib.queueserver import QueueServer, QueueClient
+from pomp.contrib.retry import RetryMiddleware
+
+from tools import DummyCrawler, DummyDownloader, DummyRequest, DummyResponse
+
+
+logging.basicConfig(level=logging.DEBUG)
+
+
+class Crash(BaseException):
+    pass
+
+
+class SlowDownloader(DummyDownloader):
+    """Crashes the process on `crash_at` download"""
+
+    def __init__(self, crash_at=None):
+        self.crash_at = crash_at
+        self.urls = []
+
+    def process(self, crawler, request):
+        self.urls.append(request.url)
+        if len(self.urls) == self.crash_at:
+            raise Crash()
+        time.sleep(0.005)
+        return DummyResponse(request, 'some html code')
+
+
+class TreeCrawler(DummyCrawler):
+    ENTRY_REQUESTS = None
+
+    def next_requests(self, response):
+        # 3 links on page, 40 pages
+        page = int(response.get_request().url.rsplit('/', 1)[-1])
+        if page < 13:
+            return [
+                'http://localhost/%s' % (page * 3 + i) for i in range(1, 4)
+            ]
+
+    def extract_items(self, response):
+        yield response.get_request().url
+
+
+class CollectPipeline(BasePipeline):
+
+    def start(self, crawler):
+        self.items = []
+
+    def process(self, crawler, item):
+        self.items.append(item)
+        return item
+
+
+class UrlToRequestMiddleware(BaseMiddleware):
+
+    def process_request(self, request, crawler, downloader):
+        if isinstance(request, str):
+            return DummyRequest(request)
+        return request
+
+
+ALL_URLS = sorted('http://localhost/%s' % i for i in range(40))
+
+
+class TestContribQueueServer(object):
+
+    def setup_method(self, method):
+        self.server = QueueServer(visibility_timeout=0.3)
+        self.server.start()
+        self.clients = []
+
+    def teardown_method(self, method):
+        for client in self.clients:
+            client.close()
+        self.server.stop()
+
+    def _get_client(self, **kwargs):
+        kwargs.setdefault('poll_timeout', 0.1)
+        client = QueueClient(self.server.address, **kwargs)
+        self.clients.append(client)
+        return client
+
+    def _pump(self, crash_at=None, middlewares=()):
+        pipeline = CollectPipeline()
+        downloader = SlowDownloader(crash_at=crash_at)
+        client = self._get_client(stop_when_drained=True)
+        pomp = Pomp(
+            downloader=downloader,
+            middlewares=(UrlToRequestMiddleware(), ) + tuple(middlewares),
+            pipelines=[pipeline],
+            queue=client,
+        )
+        try:
+            pomp.pump(TreeCrawler())
+        except Crash:
+            # process is killed, leases are not acknowledged
+            client.close()
+        return pipeline.items
+
+    def test_leases(self):
+        client = self._get_client()
+        client.put_requests([DummyRequest('http://localhost/%s' % i)
+                             for i in range(5)])
+
+        # batch up to count
+        requests = client.get_requests(count=3)
+        assert [r.url for r in requests] == [
+            'http://localhost/0', 'http://localhost/1', 'http://localhost/2',
+        ]
+        client.done_request(requests[1])
+        assert client.get_stats() == {
+            'ready': 2, 'leased': 2, 'put': 5, 'acked': 1, 'redelivered': 0,
+        }
+
+        # expired leases are redelivered first
+        time.sleep(0.35)
+        requests = client.get_requests(count=10)
+        assert [r.url for r in requests] == [
+            'http://localhost/2', 'http://localhost/0',
+            'http://localhost/3', 'http://localhost/4',
+        ]
+        for request in requests:
+            client.done_request(request)
+        # acknowledge of expired lease is ignored
+        client.done_request(DummyRequest('http://localhost/0'))
+        assert client.get_stats() == {
+            'ready': 0, 'leased': 0, 'put': 5, 'acked': 5, 'redelivered': 2,
+        }
+
+    def test_long_poll(self):
+        client = self._get_client(poll_timeout=5)
+        timer = threading.Timer(
+            0.1, self._get_client().put_requests,
+            args=(DummyRequest('http://localhost/late'), ),
+        )
+        started = time.time()
+        timer.start()
+        assert client.get_requests().url == 'http://localhost/late'
+        assert time.time() - started < 1
+        timer.join()
+
+        # frontier is not drained while request is leased
+        client = self._get_client(stop_when_drained=True)
+        timer = threading.Timer(
+            0.2, self.clients[0].done_request,
+            args=(DummyRequest('http://localhost/late'), ),
+        )
+        timer.start()
+        assert isinstance(client.get_requests(count=2), StopCommand)
+        assert time.time() - started >= 0.3
+        timer.join()
+
+    def test_workers_share_frontier(self):
+        self._get_client().put_requests(['http://localhost/0'])
+
+        results = []
+        workers = [
+            threading.Thread(target=lambda: results.append(self._pump()))
+            for _ in range(3)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        assert sorted(sum(results, [])) == ALL_URLS
+        assert len([items for items in results if items]) > 1
+
+    def test_crashed_worker(self):
+        self._get_client().put_requests(['http://localhost/0'])
+
+        done = self._pump(crash_at=10)
+        assert len(done) == 9
+        # in flight request of the crashed worker is redelivered
+        resumed = self._pump()
+        assert sorted(done + resumed) == ALL_URLS
+        assert self.server.get_stats()['redelivered'] == 1
+
+    def test_retried_requests(self):
+
+        class FailOnce(BaseMiddleware):
+            failed = set()
+
+            def process_response(self, response, crawler, downloader):
+                url = response.get_request().url
+                if url not in self.failed:
+                    self.failed.add(url)
+                    response.status = 503
+                return response
+
+        self._get_client().put_requests(['http://localhost/0'])
+        # worker is not stopped while the last request waits for retry
+        done = self._pump(middlewares=(
+            RetryMiddleware(backoff=0.2, jitter=0),
+            FailOnce(),
+        ))
+        assert sorted(done) == ALL_URLS
+        assert self.server.get_stats()['put'] == 80
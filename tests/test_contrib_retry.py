@@ -0,0 +1,290 @@
+import time
+import logging
+
+import pytest
+
+from pomp.core.base import (
+    BaseDownloader, BaseCrawlException, BodySizeCrawlException,
+)
+from pomp.core.engine import Pomp
+from pomp.core.scheduler import InFlightScheduler
+from pomp.contrib.retry import RetryMiddleware
+from pomp.contrib.dedup import DedupMiddleware
+from pomp.contrib.urllibtools import UrllibDownloader, UrllibHttpRequest
+
+from mockserver import HttpServer, make_sitemap
+from tools import DummyCrawler, DummyRequest, DummyResponse
+from tools import CollectRequestResponseMiddleware
+
+
+logging.basicConfig(level=logging.DEBUG)
+
+
+class FlakyDownloader(BaseDownloader):
+    """Fails first `failures` downloads of each url"""
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.downloads = []
+
+    def process(self, crawler, request):
+        self.downloads.append((request.url, time.time()))
+        attempts = sum(1 for url, _ in self.downloads if url == request.url)
+        if attempts <= self.failures.get(request.url, 0):
+            return BaseCrawlException(
+                request, exception=ValueError('failed %s' % attempts),
+            )
+        return DummyResponse(request, 'some html code')
+
+
+class Crawler(DummyCrawler):
+
+    def __init__(self):
+        # retries are counted by request
+        self.ENTRY_REQUESTS = [
+            DummyRequest('http://localhost/%s' % i) for i in range(3)
+        ]
+
+    def next_requests(self, response):
+        pass
+
+
+def test_backoff():
+    middleware = RetryMiddleware(
+        backoff=1, factor=2, max_backoff=5, jitter=0.5,
+    )
+    for retries, delay in ((0, 1), (1, 2), (2, 4), (3, 5), (10, 5)):
+        for _ in range(10):
+            assert delay * 0.5 <= middleware.get_backoff(retries) <= delay
+    assert len(set(middleware.get_backoff(0) for _ in range(10))) > 1
+
+    middleware = RetryMiddleware(backoff=1, jitter=0)
+    assert middleware.get_backoff(1) == 2
+    # delay requested by server is limited by max backoff
+    assert middleware.get_backoff(0, retry_after=10) == 10
+    assert middleware.get_backoff(0, retry_after=100) == 60
+
+
+def test_retry_budget():
+    middleware = RetryMiddleware(max_retries=2, backoff=10, jitter=0)
+    request = DummyRequest('http://localhost/')
+
+    def _fail():
+        return middleware.process_exception(
+            BaseCrawlException(request), None, None,
+        )
+
+    started = time.time()
+    assert _fail() is request
+    assert request.retries == 1
+    assert request.dont_filter
+    assert started + 10 <= request.not_before <= time.time() + 10
+    assert _fail() is request
+    assert request.not_before >= started + 20
+    # budget is exhausted
+    assert isinstance(_fail(), BaseCrawlException)
+    assert middleware.get_stats() == {'retried': 2, 'given_up': 1}
+
+    # budget of request
+    request = DummyRequest('http://localhost/')
+    request.max_retries = 0
+    assert isinstance(_fail(), BaseCrawlException)
+
+    # not retryable failures
+    for exception in (
+            BodySizeCrawlException(DummyRequest('http://localhost/')),
+            BaseCrawlException(None),
+            # exception of crawler on response
+            BaseCrawlException(
+                request, response=DummyResponse(request, 'some html code'),
+            )):
+        assert middleware.process_exception(exception, None, None) \
+            is exception
+
+    # retryable responses
+    response = DummyResponse(DummyRequest('http://localhost/'), '')
+    assert middleware.process_response(response, None, None) is response
+    response.status = 503
+    assert middleware.process_response(response, None, None) \
+        is response.get_request()
+
+
+def test_retry_does_not_hold_slots():
+    downloader = FlakyDownloader({'http://localhost/0': 2})
+    collect_middleware = CollectRequestResponseMiddleware()
+    retry_middleware = RetryMiddleware(max_retries=3, backoff=0.2, jitter=0)
+    pomp = Pomp(
+        downloader=downloader,
+        middlewares=(collect_middleware, retry_middleware),
+        scheduler=InFlightScheduler(limit=1),
+    )
+    started = time.time()
+    pomp.pump(Crawler())
+
+    assert len(collect_middleware.responses) == 3
+    assert not collect_middleware.exceptions
+    assert retry_middleware.get_stats() == {'retried': 2, 'given_up': 0}
+
+    times = [t - started for url, t in downloader.downloads]
+    urls = [url for url, _ in downloader.downloads]
+    # other requests are downloaded while failed one waits for retry
+    assert urls == [
+        'http://localhost/0', 'http://localhost/1', 'http://localhost/2',
+        'http://localhost/0', 'http://localhost/0',
+    ]
+    assert times[2] < 0.1
+    # exponential backoff
+    assert 0.2 <= times[3] < 0.35
+    assert 0.6 <= times[4] < 0.75
+    assert pomp.scheduler.get_stats()['in_flight'] == 0
+
+
+def test_retry_gives_up():
+    downloader = FlakyDownloader({'http://localhost/1': 10})
+    collect_middleware = CollectRequestResponseMiddleware()
+    pomp = Pomp(
+        downloader=downloader,
+        middlewares=(
+            collect_middleware,
+            # retried request is not filtered
+            DedupMiddleware(),
+            RetryMiddleware(max_retries=2, backoff=0.01),
+        ),
+    )
+    pomp.pump(Crawler())
+
+    assert len(downloader.downloads) == 5
+    assert len(collect_middleware.responses) == 2
+    assert [e.request.url for e in collect_middleware.exceptions] == [
+        'http://localhost/1',
+    ]
+
+
+def test_retry_asyncio():
+    asyncio = pytest.importorskip('asyncio')
+    from pomp.contrib.asynciotools import AioPomp
+
+    downloader = FlakyDownloader({'http://localhost/0': 2})
+    collect_middleware = CollectRequestResponseMiddleware()
+    pomp = AioPomp(
+        downloader=downloader,
+        middlewares=(
+            collect_middleware,
+            RetryMiddleware(backoff=0.2, jitter=0),
+        ),
+    )
+    loop = asyncio.new_event_loop()
+    started = time.time()
+    try:
+        loop.run_until_complete(pomp.pump(Crawler()))
+    finally:
+        loop.close()
+
+    assert len(collect_middleware.responses) == 3
+    times = [t - started for url, t in downloader.downloads]
+    assert 0.2 <= times[3] < 0.35
+    assert 0.6 <= times[4] < 0.75
+    assert not pomp._delayed
+
+
+def test_delayed_requests_returned_on_stop():
+    asyncio = pytest.importorskip('asyncio')
+    from pomp.contrib.asynciotools import AioPomp
+
+    downloader = FlakyDownloader({'http://localhost/0': 1})
+    pomp = AioPomp(
+        downloader=downloader,
+        middlewares=(RetryMiddleware(backoff=10, jitter=0), ),
+    )
+
+    async def _run():
+        task = asyncio.ensure_future(pomp.pump(Crawler()))
+        await asyncio.sleep(0.1)
+        pomp.stop()
+        await task
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        loop.run_until_complete(_run())
+    finally:
+        loop.close()
+        asyncio.set_event_loop(None)
+
+    assert not pomp._delayed
+    assert [r.url for r in pomp.queue.q._queue] == ['http://localhost/0']
+
+
+class TestContribRetry(object):
+
+    @classmethod
+    def setup_class(cls):
+        cls.httpd = HttpServer(sitemap=make_sitemap(level=1, links_on_page=1))
+        cls.httpd.start()
+
+    @classmethod
+    def teardown_class(cls):
+        cls.httpd.stop()
+
+    def _get_crawler(self, key, request_class):
+
+        class FlakyCrawler(DummyCrawler):
+            ENTRY_REQUESTS = [
+                request_class('%s/flaky/%s/%s' % (
+                    self.httpd.location, key, count,
+                ))
+                for count in range(3)
+            ]
+
+            def extract_items(self, response):
+                yield response
+
+            def next_requests(self, response):
+                pass
+
+        return FlakyCrawler()
+
+    def test_retry_urllib(self):
+        collect_middleware = CollectRequestResponseMiddleware()
+        pomp = Pomp(
+            downloader=UrllibDownloader(),
+            middlewares=(
+                collect_middleware,
+                RetryMiddleware(max_retries=1, backoff=0.01),
+            ),
+        )
+        pomp.pump(self._get_crawler('urllib', UrllibHttpRequest))
+
+        assert sorted(
+            r.get_request().url[-1] for r in collect_middleware.responses
+        ) == ['0', '1']
+        # 503 of the last attempt
+        assert [
+            e.exception.code for e in collect_middleware.exceptions
+        ] == [503]
+
+    def test_retry_asyncio_downloader(self):
+        asyncio = pytest.importorskip('asyncio')
+        from pomp.contrib.asynciotools import (
+            AioPomp, AsyncioHttpDownloader, AsyncioHttpRequest,
+        )
+
+        collect_middleware = CollectRequestResponseMiddleware()
+        pomp = AioPomp(
+            downloader=AsyncioHttpDownloader(),
+            middlewares=(
+                collect_middleware,
+                RetryMiddleware(max_retries=2, backoff=0.01),
+            ),
+        )
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(
+                pomp.pump(self._get_crawler('asyncio', AsyncioHttpRequest)),
+            )
+        finally:
+            loop.close()
+
+        assert len(collect_middleware.responses) == 3
+        assert all(r.status == 200 for r in collect_middleware.responses)
+        assert not collect_middleware.exceptions
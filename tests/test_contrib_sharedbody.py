@@ -0,0 +1,77 @@
+import os
+import pickle
+
+import pytest
+
+from pomp.contrib.sharedbody import (
+    SHM, MMAP, SharedBodyHandle, share_body, attach_body, detach_body,
+    shared_memory,
+)
+
+from tools import DummyRequest, DummyResponse
+
+
+TRANSPORTS = [MMAP]
+if shared_memory is not None:
+    TRANSPORTS.append(SHM)
+
+
+def _is_freed(handle):
+    if handle.transport == MMAP:
+        return not os.path.exists(handle.name)
+    try:
+        shared_memory.SharedMemory(name=handle.name).close()
+    except FileNotFoundError:
+        return True
+    return False
+
+
+@pytest.mark.parametrize('transport', TRANSPORTS)
+def test_shared_body(transport):
+    body = b'x' * 1000 + b'y'
+    response = DummyResponse(DummyRequest('http://localhost/'), None)
+    response.body = body
+
+    # small body is pickled as is
+    assert share_body(response, threshold=2000, transport=transport).body \
+        is body
+
+    # response is passed from pool process with handle only
+    response = share_body(response, threshold=1000, transport=transport)
+    handle = response.body
+    assert isinstance(handle, SharedBodyHandle)
+    assert len(handle) == 1001
+    response = pickle.loads(pickle.dumps(response))
+
+    # body is copied from the segment by default
+    copied = attach_body(pickle.loads(pickle.dumps(response)))
+    assert copied.body == body
+    assert 'release' not in copied.__dict__
+    assert _is_freed(handle)
+
+    # read-only view of the segment
+    response = share_body(copied, threshold=1000, transport=transport)
+    handle = response.body
+    response = attach_body(
+        pickle.loads(pickle.dumps(response)), view=True,
+    )
+    assert isinstance(response.body, memoryview)
+    assert response.body.readonly
+    assert bytes(response.body) == body
+    assert str(response.body[-1:], 'utf-8') == 'y'
+    # name of segment is removed right after mapping
+    assert _is_freed(handle)
+
+    # mapped body is copied on pickling to the other process
+    copied = detach_body(response)
+    assert copied is not response
+    assert pickle.loads(pickle.dumps(copied)).body == body
+
+    # segment is unmapped by release of response
+    response.release()
+    with pytest.raises(ValueError):
+        bytes(response.body)
+
+    # release of class is restored
+    assert 'release' not in response.__dict__
+    response.release()
@@ -1,8 +1,21 @@
+import time
+import json
+import pickle
 import logging
-from pomp.core.base import BaseCrawler, BaseMiddleware
+
+import pytest
+
+from pomp.core.base import (
+    BaseCrawler, BaseMiddleware, BaseCrawlException, TimeoutCrawlException,
+    BodySizeCrawlException,
+)
 from pomp.core.engine import Pomp
 from pomp.contrib.urllibtools import UrllibDownloader
 from pomp.contrib.urllibtools import UrllibAdapterMiddleware
+from pomp.contrib.urllibtools import (
+    HttpConnectionPool, PooledUrllibDownloader, UrllibDownloadWorker,
+    PooledUrllibDownloadWorker, UrllibHttpRequest, UrllibHttpResponse,
+)
 
 from mockserver import HttpServer, make_sitemap
 from tools import DummyCrawler
@@ -12,6 +25,15 @@ from tools import RequestResponseMiddleware, CollectRequestResponseMiddleware
 logging.basicConfig(level=logging.DEBUG)
 
 
+class MockedConnection(object):
+
+    def __init__(self, host, port, **kwargs):
+        self.sock = object()
+
+    def close(self):
+        self.sock = None
+
+
 class TestContribUrllib(object):
 
     @classmethod
@@ -53,6 +75,260 @@ class TestContribUrllib(object):
                 for r in collect_middleware.requests]) == \
             set(self.httpd.sitemap.keys())
 
+    def test_pooled_urllib_downloader(self):
+        req_resp_midlleware = RequestResponseMiddleware(
+            prefix_url=self.httpd.location,
+            request_factory=lambda x: x,
+        )
+
+        collect_middleware = CollectRequestResponseMiddleware()
+
+        downloader = PooledUrllibDownloader()
+
+        pomp = Pomp(
+            downloader=downloader,
+            middlewares=(
+                req_resp_midlleware,
+                UrllibAdapterMiddleware(),
+                collect_middleware,
+            ),
+            pipelines=[],
+        )
+
+        class Crawler(DummyCrawler):
+            ENTRY_REQUESTS = '/root'
+
+        pomp.pump(Crawler())
+
+        assert \
+            set([r.url.replace(self.httpd.location, '')
+                for r in collect_middleware.requests]) == \
+            set(self.httpd.sitemap.keys())
+        assert all(r.status == 200 for r in collect_middleware.responses)
+
+        # pool closed on downloader stop
+        assert downloader.worker.pool.get_idle_count() == 0
+
+    def test_connection_pool(self):
+        pool = HttpConnectionPool(maxsize=2, idle_timeout=60)
+        pool.CONNECTION_CLASSES = {'http': MockedConnection}
+
+        conn, reused = pool.get_connection('http', 'localhost', 80)
+        assert not reused
+
+        # keep-alive connection reused
+        pool.release(conn, 'http', 'localhost', 80)
+        assert pool.get_connection('http', 'localhost', 80) == (conn, True)
+
+        # other host - other connection
+        assert pool.get_connection('http', 'other', 80)[0] is not conn
+
+        # bounded count of idle connections
+        conns = [MockedConnection(None, None) for _ in range(3)]
+        for c in conns:
+            pool.release(c, 'http', 'localhost', 80)
+        assert pool.get_idle_count() == 2
+        assert conns[-1].sock is None
+
+        # closed connections are not reused
+        conns[1].close()
+        assert pool.get_connection('http', 'localhost', 80) == \
+            (conns[0], True)
+
+        # evict idle connections
+        pool.idle_timeout = -1
+        pool.release(conns[0], 'http', 'localhost', 80)
+        pool.evict_idle()
+        assert pool.get_idle_count() == 0
+        assert conns[0].sock is None
+
+    def test_retry_idempotent_only(self):
+        worker = PooledUrllibDownloadWorker()
+        worker.pool.CONNECTION_CLASSES = {'http': MockedConnection}
+        calls = []
+
+        def _request(conn, deadline, method, path, body, headers):
+            calls.append(method)
+            raise worker.RETRY_EXCEPTIONS[0]('closed by server')
+
+        worker._request = _request
+        url = 'http://localhost/'
+
+        for data, count in ((None, 2), (b'data', 1)):
+            # stale keep-alive connection in the pool
+            worker.pool.release(
+                MockedConnection(None, None), 'http', 'localhost',
+            )
+            del calls[:]
+            result = worker.process(UrllibHttpRequest(url, data=data))
+            assert isinstance(result, BaseCrawlException)
+            # POST is not resent
+            assert len(calls) == count
+
+    def test_timeouts(self):
+        for worker_class in (UrllibDownloadWorker, PooledUrllibDownloadWorker):
+            # read timeout
+            worker = worker_class(timeout=0.5)
+            response = worker.process(
+                UrllibHttpRequest('%s/sleep' % self.httpd.location),
+            )
+            assert isinstance(response, TimeoutCrawlException)
+
+            # wait for the mock server to finish slow response
+            time.sleep(2)
+
+            # slow body transfer is not limited by read timeout
+            worker = worker_class(read_timeout=1)
+            response = worker.process(
+                UrllibHttpRequest('%s/tarpit' % self.httpd.location),
+            )
+            assert isinstance(response, UrllibHttpResponse)
+
+            # but limited by total timeout
+            worker = worker_class(read_timeout=1, total_timeout=0.5)
+            started = time.time()
+            response = worker.process(
+                UrllibHttpRequest('%s/tarpit' % self.httpd.location),
+            )
+            assert isinstance(response, TimeoutCrawlException)
+            assert time.time() - started < 1
+
+            # per request override
+            worker = worker_class()
+            response = worker.process(
+                UrllibHttpRequest(
+                    '%s/tarpit' % self.httpd.location, total_timeout=0.5,
+                ),
+            )
+            assert isinstance(response, TimeoutCrawlException)
+
+            time.sleep(2)
+
+        # not timed out exceptions
+        response = UrllibDownloadWorker(timeout=0.5).process(
+            UrllibHttpRequest('http://localhost:1/'),
+        )
+        assert isinstance(response, BaseCrawlException)
+        assert not isinstance(response, TimeoutCrawlException)
+
+    def test_max_body_size(self):
+        for worker_class in (UrllibDownloadWorker, PooledUrllibDownloadWorker):
+            worker = worker_class(max_body_size=1000)
+
+            # aborted by content length and by read body
+            for path in ('/big', '/endless'):
+                response = worker.process(
+                    UrllibHttpRequest(self.httpd.location + path),
+                )
+                assert isinstance(response, BodySizeCrawlException)
+
+            # per request override
+            response = worker.process(UrllibHttpRequest(
+                self.httpd.location + '/big', max_body_size=2 * 1024 * 1024,
+            ))
+            assert len(response.body) == 1024 * 1024
+
+            # aborted while body is streamed
+            response = worker_class(max_body_size=1000, stream=True).process(
+                UrllibHttpRequest(self.httpd.location + '/endless'),
+            )
+            assert isinstance(response, UrllibHttpResponse)
+            with pytest.raises(BodySizeCrawlException):
+                for _ in response.iter_body(chunk_size=100):
+                    pass
+
+    def test_decode_content(self):
+        url = self.httpd.location + '/root'
+        for worker_class in (UrllibDownloadWorker, PooledUrllibDownloadWorker):
+            # compressed body is decoded
+            response = worker_class().process(UrllibHttpRequest(url))
+            assert response.headers['Content-Encoding'] == 'gzip'
+            assert json.loads(response.body.decode('utf-8')) == \
+                self.httpd.sitemap['/root']
+
+            # and not requested without decoding
+            response = worker_class(decode_content=False).process(
+                UrllibHttpRequest(url),
+            )
+            assert 'Content-Encoding' not in response.headers
+
+            # decoded while streamed
+            response = worker_class(stream=True).process(
+                UrllibHttpRequest(self.httpd.location + '/bomb'),
+            )
+            chunks = response.iter_body(chunk_size=1024)
+            assert len(next(chunks)) == 1024
+            chunks.close()
+            response.release()
+
+            # size of decoded body is limited
+            started = time.time()
+            response = worker_class(max_body_size=1024 * 1024).process(
+                UrllibHttpRequest(self.httpd.location + '/bomb'),
+            )
+            assert isinstance(response, BodySizeCrawlException)
+            assert time.time() - started < 1
+
+            response = worker_class().process(
+                UrllibHttpRequest(self.httpd.location + '/bomb'),
+            )
+            assert response.body == b'\0' * 10 * 1024 * 1024
+
+    def test_stream(self):
+        for worker_class in (UrllibDownloadWorker, PooledUrllibDownloadWorker):
+            worker = worker_class(stream=True)
+
+            # body is read by consumer
+            response = worker.process(
+                UrllibHttpRequest(self.httpd.location + '/endless'),
+            )
+            chunks = response.iter_body(chunk_size=1024)
+            assert [len(next(chunks)) for _ in range(3)] == [1024] * 3
+            chunks.close()
+            assert list(response.iter_body()) == []
+            response.release()
+
+            # body is read on access and on pickling
+            response = worker.process(
+                UrllibHttpRequest(self.httpd.location + '/big'),
+            )
+            assert len(pickle.loads(pickle.dumps(response)).body) == \
+                1024 * 1024
+            response.release()
+
+            # body is spooled to file
+            response = worker_class(spool_threshold=1000).process(
+                UrllibHttpRequest(self.httpd.location + '/big'),
+            )
+            assert response.body_file._rolled
+            assert sum(len(c) for c in response.iter_body()) == 1024 * 1024
+            assert len(response.body) == 1024 * 1024
+            response.release()
+            assert response.body_file.closed
+
+        # crawler and middlewares read body from the stream
+        req_resp_midlleware = RequestResponseMiddleware(
+            prefix_url=self.httpd.location,
+            request_factory=lambda x: x,
+        )
+        collect_middleware = CollectRequestResponseMiddleware()
+        pomp = Pomp(
+            downloader=PooledUrllibDownloader(stream=True),
+            middlewares=(
+                req_resp_midlleware,
+                UrllibAdapterMiddleware(),
+                collect_middleware,
+            ),
+            pipelines=[],
+        )
+
+        class Crawler(DummyCrawler):
+            ENTRY_REQUESTS = '/root'
+
+        pomp.pump(Crawler())
+
+        assert len(collect_middleware.requests) == len(self.httpd.sitemap)
+
     def test_exception_handling(self):
 
         class CatchException(BaseMiddleware):
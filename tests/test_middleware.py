@@ -2,7 +2,9 @@ import sys
 import pickle
 import logging
 
-from pomp.core.base import BaseMiddleware, BaseCrawlException
+from pomp.core.base import (
+    BaseMiddleware, BaseCrawlException, TimeoutCrawlException,
+)
 from pomp.core.engine import Pomp
 
 from tools import (
@@ -98,6 +100,10 @@ def test_exception_on_processing_response():
     assert len(collect_middleware.requests) == 1
     assert len(collect_middleware.responses) == 1
 
+    # request done only once
+    assert pomp.in_progress == 0
+    assert pomp.scheduler.in_flight == 0
+
 
 def test_exception_on_processing_response_callback():
 
@@ -139,6 +145,10 @@ def test_exception_on_processing_exception():
     assert len(collect_middleware.requests) == 0
     assert len(collect_middleware.responses) == 0
 
+    # request done only once
+    assert pomp.in_progress == 0
+    assert pomp.scheduler.in_flight == 0
+
 
 def test_exception_pickling():
     try:
@@ -153,6 +163,10 @@ def test_exception_pickling():
         exception = pickle.loads(pickle.dumps(exception))
         assert not exception.exc_info
 
+    # exception type preserved
+    exception = pickle.loads(pickle.dumps(TimeoutCrawlException()))
+    assert isinstance(exception, TimeoutCrawlException)
+
 
 def test_exception_on_processing_done():
 
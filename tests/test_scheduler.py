@@ -0,0 +1,229 @@
+import time
+import threading
+
+from pomp.core.scheduler import InFlightScheduler
+
+from tools import DummyRequest
+
+
+def test_unlimited_scheduler():
+    scheduler = InFlightScheduler()
+
+    assert scheduler.available() is None
+    for _ in range(10):
+        scheduler.acquire()
+        scheduler.acquire_host(DummyRequest('http://localhost/'))
+
+    stats = scheduler.get_stats()
+    assert stats['in_flight'] == 10
+    assert stats['acquired'] == 10
+    assert stats['waiting'] == 0
+    assert stats['hosts'] == {}
+
+
+def test_global_limit():
+    scheduler = InFlightScheduler(limit=2)
+
+    scheduler.acquire()
+    assert scheduler.available() == 1
+    scheduler.acquire()
+    assert scheduler.available() == 0
+
+    # release slot from other thread
+    threading.Timer(0.2, scheduler.release).start()
+
+    started = time.time()
+    scheduler.wait()
+    scheduler.acquire()
+    assert time.time() - started >= 0.1
+
+    stats = scheduler.get_stats()
+    assert stats['in_flight'] == 2
+    assert stats['acquired'] == 3
+    assert stats['waiting'] == 0
+    assert stats['max_wait_time'] >= 0.1
+    assert stats['wait_time'] >= stats['max_wait_time']
+
+
+def test_per_host_limit():
+    scheduler = InFlightScheduler(per_host_limit=1)
+    request = DummyRequest('http://localhost/1')
+
+    scheduler.acquire_host(request)
+    # other host is not limited
+    scheduler.acquire_host(DummyRequest('http://example.com/'))
+    assert scheduler.get_stats()['hosts'] == {
+        'localhost': 1, 'example.com': 1,
+    }
+
+    threading.Timer(0.2, scheduler.release_host, args=(request, )).start()
+
+    started = time.time()
+    scheduler.acquire_host(DummyRequest('http://localhost/2'))
+    assert time.time() - started >= 0.1
+
+    scheduler.release_host(request)
+    assert scheduler.get_stats()['hosts'] == {'example.com': 1}
+
+
+def test_park_host_requests():
+    scheduler = InFlightScheduler(per_host_limit=1)
+    downloaded = []
+
+    def callback(request):
+        downloaded.append(request.url)
+
+    first = DummyRequest('http://localhost/1')
+    scheduler.acquire_host(first, callback=callback)
+    # busy host - request is parked without blocking
+    scheduler.acquire_host(DummyRequest('http://localhost/2'), callback)
+    scheduler.acquire_host(DummyRequest('http://example.com/'), callback)
+    assert downloaded == ['http://localhost/1', 'http://example.com/']
+    assert scheduler.get_stats()['parked'] == 1
+
+    # slot is passed to parked request
+    scheduler.release_host(first)
+    assert downloaded[-1] == 'http://localhost/2'
+    stats = scheduler.get_stats()
+    assert stats['parked'] == 0
+    assert stats['hosts'] == {'localhost': 1, 'example.com': 1}
+    assert stats['waiting'] == 0
+
+
+def test_park_host_requests_without_recursion():
+    scheduler = InFlightScheduler(per_host_limit=1)
+    depth = [0, 0]
+
+    def callback(request):
+        # release slot at once like sync downloader
+        depth[0] += 1
+        depth[1] = max(depth)
+        scheduler.release_host(request)
+        depth[0] -= 1
+
+    first = DummyRequest('http://localhost/')
+    scheduler.acquire_host(first)
+    for i in range(1000):
+        scheduler.acquire_host(DummyRequest('http://localhost/'), callback)
+    scheduler.release_host(first)
+
+    assert depth[1] == 1
+    assert scheduler.get_stats()['hosts'] == {}
+
+
+def test_host_limits():
+    scheduler = InFlightScheduler(host_limits={'big': 2})
+    downloaded = []
+
+    for i in range(3):
+        scheduler.acquire_host(DummyRequest('http://big/%s' % i),
+                               downloaded.append)
+        scheduler.acquire_host(DummyRequest('http://small/%s' % i),
+                               downloaded.append)
+
+    # other hosts are not limited
+    assert len(downloaded) == 5
+    assert scheduler.get_stats()['hosts'] == {'big': 2, 'small': 3}
+    assert scheduler.get_stats()['parked'] == 1
+
+
+def test_parked_requests_release_global_slot():
+    scheduler = InFlightScheduler(limit=2, per_host_limit=1)
+    downloaded = []
+
+    first = DummyRequest('http://big/0')
+    for i in range(3):
+        scheduler.acquire()
+        scheduler.acquire_host(DummyRequest('http://big/%s' % i)
+                               if i else first, downloaded.append)
+
+    # parked requests do not hold global slots
+    assert scheduler.in_flight == 1
+    assert scheduler.available() == 1
+    scheduler.acquire()
+    scheduler.acquire_host(DummyRequest('http://small/'), downloaded.append)
+    assert [r.url for r in downloaded] == ['http://big/0', 'http://small/']
+
+    # host is free, but global slots are busy - parked request is resumed
+    # by release of global slot before new requests
+    scheduler.release_host(first)
+    assert len(downloaded) == 2
+    assert not scheduler._is_free()
+    scheduler.release()
+    assert downloaded[-1].url == 'http://big/1'
+    assert scheduler.in_flight == 2
+    assert scheduler.get_stats()['parked'] == 1
+    assert scheduler.get_stats()['acquired'] == 4
+
+
+def test_max_parked():
+    scheduler = InFlightScheduler(per_host_limit=1, max_parked=1)
+    first = DummyRequest('http://localhost/0')
+    scheduler.acquire()
+    scheduler.acquire_host(first, lambda r: None)
+    scheduler.acquire()
+    scheduler.acquire_host(DummyRequest('http://localhost/1'), lambda r: None)
+
+    threading.Timer(0.2, scheduler.release_host, args=(first, )).start()
+    started = time.time()
+    scheduler.wait()
+    assert time.time() - started >= 0.1
+
+
+def test_host_delay():
+    scheduler = InFlightScheduler(delay=0.2, host_delays={'fast': 0})
+    downloaded = {}
+    done = threading.Event()
+
+    def callback(request):
+        downloaded[request.url] = time.time() - started
+        scheduler.release_host(request)
+        if len(downloaded) == 5:
+            done.set()
+
+    started = time.time()
+    for i in range(3):
+        scheduler.acquire_host(DummyRequest('http://slow/%s' % i), callback)
+    for i in range(2):
+        scheduler.acquire_host(DummyRequest('http://fast/%s' % i), callback)
+
+    # delayed requests are parked and other hosts are not blocked
+    assert set(downloaded) == set(['http://slow/0', 'http://fast/0',
+                                   'http://fast/1'])
+    assert done.wait(2)
+    assert 0.2 <= downloaded['http://slow/1'] < 0.35
+    assert 0.4 <= downloaded['http://slow/2'] < 0.55
+    assert scheduler.get_stats()['parked'] == 0
+
+    # blocking acquire waits for delay
+    started = time.time()
+    scheduler.acquire_host(DummyRequest('http://slow/'))
+    assert time.time() - started >= 0.1
+
+
+def test_autothrottle():
+    scheduler = InFlightScheduler(
+        autothrottle=True, delay=0.01, max_delay=0.2,
+    )
+
+    def download(latency, failed=False):
+        request = DummyRequest('http://localhost/')
+        # delay of host is applied to blocking acquire
+        scheduler.acquire_host(request)
+        time.sleep(latency)
+        scheduler.release_host(request, failed=failed)
+        return scheduler.get_delay('localhost')
+
+    # delay follows latency
+    assert 0.1 <= download(0.1) < 0.15
+    # failed request does not decrease delay
+    assert download(0, failed=True) >= 0.1
+    # fast responses decrease delay to the min delay
+    delays = [download(0) for _ in range(10)]
+    assert delays == sorted(delays, reverse=True)
+    assert 0.01 <= delays[-1] < 0.02
+    # slow responses are limited by max delay
+    assert download(0.3) == 0.2
+    assert scheduler.get_stats()['delays'] == {'localhost': 0.2}
+    # other hosts are not throttled
+    assert scheduler.get_delay('other') == 0.01
@@ -1,9 +1,15 @@
+import time
 import logging
-from pomp.core.base import BaseCrawler, BasePipeline, BaseQueue
-from pomp.core.engine import Pomp
+import threading
+from pomp.core.base import (
+    BaseCrawler, BasePipeline, BaseQueue, BaseMiddleware,
+)
+from pomp.core.engine import Pomp, SimpleQueue, PriorityQueue, StopCommand
+from pomp.core.scheduler import InFlightScheduler
+from pomp.core.utils import Planned
 
 
-from tools import DummyCrawler, DummyDownloader, DummyRequest
+from tools import DummyCrawler, DummyDownloader, DummyRequest, DummyResponse
 from tools import RequestResponseMiddleware
 
 
@@ -272,3 +278,254 @@ class TestSimplerCrawler(object):
         )
 
         pomp.pump(Crawler())
+
+    def test_in_flight_limit(self):
+
+        class ThreadedDownloader(DummyDownloader):
+
+            def get_workers_count(self):
+                return 2
+
+            def process(self, crawler, request):
+                planned = Planned()
+                threading.Timer(
+                    0.05,
+                    lambda: planned.set_result(
+                        DummyResponse(request, 'some html code'),
+                    ),
+                ).start()
+                return planned
+
+        class InFlightMiddleware(BaseMiddleware):
+
+            def __init__(self):
+                self.in_flight = []
+
+            def process_request(self, request, crawler, downloader):
+                self.in_flight.append(pomp.scheduler.in_flight)
+                return request
+
+        class ManyRequestsCrawler(DummyCrawler):
+            ENTRY_REQUESTS = [
+                'http://localhost/%s' % i for i in range(10)
+            ]
+
+            def next_requests(self, response):
+                pass
+
+        road = RoadPipeline()
+        in_flight_middleware = InFlightMiddleware()
+        pomp = Pomp(
+            downloader=ThreadedDownloader(),
+            middlewares=[url_to_request_middl, in_flight_middleware],
+            pipelines=[road],
+            # engine waits while parked request is not resumed
+            scheduler=InFlightScheduler(per_host_limit=1, max_parked=1),
+        )
+        pomp.pump(ManyRequestsCrawler())
+
+        assert len(road.collection) == 10
+        assert max(in_flight_middleware.in_flight) == 2
+        stats = pomp.scheduler.get_stats()
+        assert stats['in_flight'] == 0
+        assert stats['acquired'] == 10
+        assert stats['wait_time'] > 0
+        assert stats['hosts'] == {}
+
+    def test_slow_host_does_not_block_others(self):
+        started = time.time()
+
+        class TwoHostsDownloader(DummyDownloader):
+
+            def get_workers_count(self):
+                return 10
+
+            def process(self, crawler, request):
+                planned = Planned()
+                threading.Timer(
+                    0.3 if 'slow' in request.url else 0.01,
+                    lambda: planned.set_result(
+                        DummyResponse(request, 'some html code'),
+                    ),
+                ).start()
+                return planned
+
+        class DoneMiddleware(BaseMiddleware):
+
+            def __init__(self):
+                self.done = {}
+
+            def process_response(self, response, crawler, downloader):
+                self.done[response.get_request().url] = \
+                    time.time() - started
+                return response
+
+        class TwoHostsCrawler(DummyCrawler):
+            ENTRY_REQUESTS = [
+                'http://slow/%s' % i for i in range(3)
+            ] + [
+                'http://fast/%s' % i for i in range(5)
+            ]
+
+            def next_requests(self, response):
+                pass
+
+        done_middleware = DoneMiddleware()
+        pomp = Pomp(
+            downloader=TwoHostsDownloader(),
+            middlewares=[url_to_request_middl, done_middleware],
+            scheduler=InFlightScheduler(per_host_limit=1),
+        )
+        pomp.pump(TwoHostsCrawler())
+
+        assert len(done_middleware.done) == 8
+        # requests to fast host are not queued behind parked slow requests
+        fast = [v for k, v in done_middleware.done.items() if 'fast' in k]
+        assert max(fast) < 0.3
+        assert max(done_middleware.done.values()) >= 0.9
+        stats = pomp.scheduler.get_stats()
+        assert stats['in_flight'] == 0
+        assert stats['parked'] == 0
+        assert stats['hosts'] == {}
+
+    def test_simple_queue_batch(self):
+        queue = SimpleQueue(use_lifo=True)
+        queue.put_requests([DummyRequest(str(i)) for i in range(5)])
+
+        # drain available requests without blocking
+        assert [r.url for r in queue.get_requests(count=3)] == \
+            ['0', '1', '2']
+
+        # command is not mixed with requests
+        queue.put_requests(StopCommand())
+        assert [r.url for r in queue.get_requests(count=10)] == ['3', '4']
+        assert isinstance(queue.get_requests(count=10), StopCommand)
+
+        # without count hint
+        queue.put_requests(DummyRequest('5'))
+        assert queue.get_requests().url == '5'
+
+    def test_priority_queue(self):
+        queue = PriorityQueue()
+
+        def _request(url, priority=None, depth=None):
+            request = DummyRequest(url)
+            if priority is not None:
+                request.priority = priority
+            if depth is not None:
+                request.depth = depth
+            return request
+
+        queue.put_requests(StopCommand())
+        queue.put_requests([
+            _request('a'), _request('b', priority=1), 'url',
+            _request('c'), _request('d', priority=-1), _request('e', 1),
+        ])
+        # higher priority first, the same priority in order of put,
+        # command after all requests
+        assert [getattr(r, 'url', r) for r in queue.get_requests(count=4)] \
+            == ['b', 'e', 'a', 'url']
+        assert [r.url for r in queue.get_requests(count=10)] == ['c', 'd']
+        assert isinstance(queue.get_requests(), StopCommand)
+
+        # deep requests are taken later
+        queue = PriorityQueue(depth_bias=1)
+        queue.put_requests([
+            _request('deep', depth=3), _request('root'),
+            _request('deep-important', priority=2, depth=2),
+            _request('shallow', depth=1),
+        ])
+        assert [r.url for r in queue.get_requests(count=4)] == \
+            ['root', 'deep-important', 'shallow', 'deep']
+
+    def test_priority_queue_crawler(self):
+
+        class PaginationCrawler(DummyCrawler):
+            ENTRY_REQUESTS = DummyRequest('http://localhost/root')
+
+            depths = {}
+
+            def next_requests(self, response):
+                request = response.get_request()
+                self.depths[request.url] = getattr(request, 'depth', 0)
+                if request.url.endswith('root'):
+                    yield DummyRequest('http://localhost/page/1')
+                    for i in range(3):
+                        listing = DummyRequest('http://localhost/list/%s' % i)
+                        listing.priority = 1
+                        yield listing
+                elif '/page/' in request.url:
+                    page = int(request.url.rsplit('/', 1)[-1])
+                    if page < 3:
+                        yield DummyRequest(
+                            'http://localhost/page/%s' % (page + 1),
+                        )
+
+        road = RoadPipeline()
+        pomp = Pomp(
+            downloader=DummyDownloader(),
+            pipelines=[road],
+            queue=PriorityQueue(),
+        )
+        crawler = PaginationCrawler()
+        pomp.pump(crawler)
+
+        # listing pages before pagination
+        assert [item.url.replace('http://localhost/', '')
+                for item in road.collection] == [
+            'root', 'list/0', 'list/1', 'list/2', 'page/1', 'page/2', 'page/3',
+        ]
+        # depth of follow-up requests is set by engine
+        assert crawler.depths['http://localhost/root'] == 0
+        assert crawler.depths['http://localhost/list/0'] == 1
+        assert crawler.depths['http://localhost/page/3'] == 3
+
+    def test_bulk_put_requests(self):
+
+        class DummyDownloaderWithWorkers(DummyDownloader):
+
+            def get_workers_count(self):
+                return 5
+
+        class BulkQueue(SimpleQueue):
+
+            def __init__(self):
+                super(BulkQueue, self).__init__(use_lifo=True)
+                self.gets = []
+                self.puts = []
+
+            def get_requests(self, count=None):
+                requests = super(BulkQueue, self).get_requests(count=count)
+                self.gets.append(requests)
+                return requests
+
+            def put_requests(self, requests):
+                self.puts.append(requests)
+                super(BulkQueue, self).put_requests(requests)
+
+        class ManyLinksCrawler(DummyCrawler):
+            ENTRY_REQUESTS = 'http://localhost/root'
+
+            def next_requests(self, response):
+                if response.get_request().url.endswith('root'):
+                    return [
+                        'http://localhost/%s' % i for i in range(10)
+                    ]
+
+        road = RoadPipeline()
+        pomp = Pomp(
+            downloader=DummyDownloaderWithWorkers(),
+            middlewares=[url_to_request_middl],
+            pipelines=[road],
+        )
+        pomp.queue = BulkQueue()
+        pomp.pump(ManyLinksCrawler())
+
+        assert len(road.collection) == 11
+        # all links of the page are put by one call
+        assert [len(r) for r in pomp.queue.puts if isinstance(r, list)] == \
+            [10]
+        # and fetched by batches up to workers count
+        assert max(
+            len(r) for r in pomp.queue.gets if isinstance(r, list)
+        ) == 5